@@ -0,0 +1,122 @@
+"""
+Daily Activity Counters
+Keeps count, quantity and value per (business date, site, transaction type), written
+in the same transaction as each ledger insert, so "today" tiles and activity trends
+never scan the transactions table
+"""
+
+from datetime import datetime, timedelta
+import logging
+
+from sqlalchemy import func, update
+
+from app import db
+from models_new import Transaction, DailyActivityCounter
+
+
+def business_date_today():
+    """Business dates follow the ledger's UTC created_at timestamps"""
+    return datetime.utcnow().date()
+
+
+class ActivityCounterService:
+    """Service class for the daily activity counters"""
+
+    @staticmethod
+    def record(site_id, transaction_type, quantity, total_value, business_date=None, count=1):
+        """Count one ledger entry (or count entries recorded together) in the current transaction"""
+        business_date = business_date or business_date_today()
+        result = db.session.execute(
+            update(DailyActivityCounter)
+            .where(
+                DailyActivityCounter.business_date == business_date,
+                DailyActivityCounter.site_id == site_id,
+                DailyActivityCounter.type == transaction_type
+            )
+            .values(
+                count=DailyActivityCounter.count + count,
+                quantity=DailyActivityCounter.quantity + quantity,
+                total_value=DailyActivityCounter.total_value + total_value
+            )
+        )
+        if result.rowcount == 0:
+            db.session.add(DailyActivityCounter(
+                business_date=business_date,
+                site_id=site_id,
+                type=transaction_type,
+                count=count,
+                quantity=quantity,
+                total_value=total_value
+            ))
+            db.session.flush()
+
+    @staticmethod
+    def get_counts(business_date=None, site_id=None):
+        """Get ledger entry counts by transaction type for one business date"""
+        query = db.session.query(
+            DailyActivityCounter.type,
+            func.sum(DailyActivityCounter.count)
+        ).filter(DailyActivityCounter.business_date == (business_date or business_date_today()))
+
+        if site_id:
+            query = query.filter(DailyActivityCounter.site_id == site_id)
+
+        return {txn_type: int(count or 0) for txn_type, count in query.group_by(DailyActivityCounter.type).all()}
+
+    @staticmethod
+    def get_total(site_id=None):
+        """Get the number of ledger entries ever recorded, without counting the transactions table"""
+        query = db.session.query(func.sum(DailyActivityCounter.count))
+        if site_id:
+            query = query.filter(DailyActivityCounter.site_id == site_id)
+        return int(query.scalar() or 0)
+
+    @staticmethod
+    def get_trend(days=90, site_id=None):
+        """Get daily count, quantity and value per transaction type for the last N days"""
+        start_date = business_date_today() - timedelta(days=days - 1)
+        query = db.session.query(
+            DailyActivityCounter.business_date,
+            DailyActivityCounter.type,
+            func.sum(DailyActivityCounter.count).label('count'),
+            func.sum(DailyActivityCounter.quantity).label('quantity'),
+            func.sum(DailyActivityCounter.total_value).label('total_value')
+        ).filter(DailyActivityCounter.business_date >= start_date)
+
+        if site_id:
+            query = query.filter(DailyActivityCounter.site_id == site_id)
+
+        return query.group_by(
+            DailyActivityCounter.business_date, DailyActivityCounter.type
+        ).order_by(DailyActivityCounter.business_date).all()
+
+    @staticmethod
+    def rebuild():
+        """Recompute all counters from the transactions ledger; returns the number of rows written"""
+        business_date = func.date(Transaction.created_at)
+        rows = db.session.query(
+            business_date.label('business_date'),
+            Transaction.site_id,
+            Transaction.type,
+            func.count(Transaction.id).label('count'),
+            func.sum(Transaction.quantity).label('quantity'),
+            func.sum(Transaction.total_value).label('total_value')
+        ).group_by(business_date, Transaction.site_id, Transaction.type).all()
+
+        DailyActivityCounter.query.delete()
+        for row in rows:
+            row_date = row.business_date
+            if isinstance(row_date, str):  # SQLite returns DATE() as text
+                row_date = datetime.strptime(row_date, '%Y-%m-%d').date()
+            db.session.add(DailyActivityCounter(
+                business_date=row_date,
+                site_id=row.site_id,
+                type=row.type,
+                count=row.count,
+                quantity=row.quantity or 0,
+                total_value=row.total_value or 0
+            ))
+        db.session.commit()
+
+        logging.info(f"Daily activity counters rebuilt: {len(rows)} rows")
+        return len(rows)
@@ -85,6 +85,19 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['DATA_FOLDER'] = 'data'
 
+# Rendered template fragment cache size cap
+app.config['FRAGMENT_CACHE_MAX_BYTES'] = int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# Generated report artifact cache (PDF/Excel files on disk)
+app.config['REPORT_CACHE_FOLDER'] = os.path.join(app.config['DATA_FOLDER'], 'report_cache')
+app.config['REPORT_CACHE_MAX_BYTES'] = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Content-addressed store of rendered goods received vouchers
+app.config['RECEIPT_STORE_FOLDER'] = os.path.join(app.config['DATA_FOLDER'], 'receipts')
+
+# Precomputed downloads (upload templates) built once per layout or catalog version
+app.config['STATIC_ARTIFACT_FOLDER'] = os.path.join(app.config['DATA_FOLDER'], 'static_artifacts')
+
 # Ensure upload and data directories exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['DATA_FOLDER'], exist_ok=True)
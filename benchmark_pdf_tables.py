@@ -0,0 +1,123 @@
+"""
+Benchmark for chunked PDF table rendering
+Renders synthetic transaction history reports and reports time, pages and peak memory.
+
+Usage:
+    python benchmark_pdf_tables.py                      # 10k, 100k and 500k rows
+    python benchmark_pdf_tables.py --rows 10000 --baseline
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate
+
+from app import app  # noqa: F401  (initializes the app before the report engine imports it)
+from enhanced_report_generator import ProfessionalReportGenerator
+from report_engine import ReportEngine, TRANSACTION_HISTORY
+
+DEFAULT_ROW_COUNTS = [10000, 100000, 500000]
+
+
+def synthetic_transactions(count):
+    """Yield transaction-like rows without touching the database"""
+    start = datetime(2024, 1, 1)
+    types = ['receive', 'issue', 'issue', 'adjustment']
+    for i in range(count):
+        txn_type = types[i % len(types)]
+        quantity = (i % 97) + 1
+        yield SimpleNamespace(
+            serial_number=f"TXN-{i:08d}",
+            created_at=start + timedelta(minutes=i),
+            material_name=f"Material {i % 250}",
+            type=txn_type,
+            quantity=quantity if txn_type == 'receive' else -quantity,
+            unit='bags',
+            unit_cost=12.5,
+            total_value=quantity * 12.5 if txn_type == 'receive' else -quantity * 12.5,
+            issued_to_project_code=f"PRJ-{i % 12:03d}"
+        )
+
+
+def render_chunked(transactions, path):
+    """The transaction history report as rendered by the report engine"""
+    params = {'site_id': None, 'site_name': 'Benchmark Site', 'company_name': 'Benchmark Co', 'currency': 'ZMW',
+              'report_date': None, 'start_date': None, 'end_date': None}
+    frame = pd.DataFrame({
+        'serial_number': [txn.serial_number for txn in transactions],
+        'created_at': [txn.created_at for txn in transactions],
+        'material_name': [txn.material_name for txn in transactions],
+        'type': [txn.type for txn in transactions],
+        'quantity': [txn.quantity for txn in transactions],
+        'unit': [txn.unit for txn in transactions],
+        'unit_cost': [txn.unit_cost for txn in transactions],
+        'total_value': [txn.total_value for txn in transactions],
+        'project_code': [txn.issued_to_project_code for txn in transactions],
+        'created_by': None,
+        'notes': None,
+    })
+    frame = TRANSACTION_HISTORY.derive(frame, params)
+    ReportEngine.render(TRANSACTION_HISTORY.name, params, {'pdf': path}, frame=frame)
+
+
+def render_single_table(transactions, path):
+    """The previous approach: every row in one Table with a full-table style"""
+    generator = ProfessionalReportGenerator()
+    headers = ['Serial Number', 'Date', 'Material', 'Type', 'Quantity', 'Unit Cost', 'Total Value', 'Project Code']
+    rows = [
+        [txn.serial_number, txn.created_at.strftime('%d/%m/%Y'), txn.material_name, txn.type.upper(),
+         f"{txn.quantity:,.2f} {txn.unit}", generator.format_currency(txn.unit_cost),
+         generator.format_currency(abs(txn.total_value)), txn.issued_to_project_code]
+        for txn in transactions
+    ]
+    doc = SimpleDocTemplate(path, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+    doc.build([generator.create_professional_table(rows, headers)])
+
+
+def run(renderer, count, trace_memory):
+    transactions = list(synthetic_transactions(count))
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        renderer(transactions, path)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    return elapsed, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS)
+    parser.add_argument('--baseline', action='store_true', help='Also time the single-table renderer')
+    parser.add_argument('--memory', action='store_true', help='Trace peak Python memory (slower)')
+    args = parser.parse_args()
+
+    renderers = [('chunked', render_chunked)]
+    if args.baseline:
+        renderers.append(('single table', render_single_table))
+
+    print(f"{'renderer':<14}{'rows':>10}{'seconds':>10}{'rows/s':>10}{'PDF MB':>9}{'peak MB':>9}")
+    for count in args.rows:
+        for name, renderer in renderers:
+            elapsed, size, peak = run(renderer, count, args.memory)
+            peak_text = f"{peak / 1e6:.1f}" if peak is not None else '-'
+            print(f"{name:<14}{count:>10}{elapsed:>10.1f}{count / elapsed:>10.0f}{size / 1e6:>9.1f}{peak_text:>9}")
+
+
+if __name__ == '__main__':
+    main()
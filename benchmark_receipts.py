@@ -0,0 +1,112 @@
+"""
+Benchmark for goods received voucher rendering
+Renders synthetic receipts and reports receipts per second for single downloads,
+ZIP bundles and background pre-rendering. Receipts come from synthetic payloads,
+so no transactions are read from the database.
+
+Usage:
+    python benchmark_receipts.py                        # 200 receipts, every mode
+    python benchmark_receipts.py --receipts 1000 --workers 1 4 --modes zip
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app import app  # noqa: F401 - set up the app before modules that import its models
+from receipt_bundle import iter_receipts_zip, RECEIPT_RENDER_WORKERS
+from receipt_generator import render_receipt_payload
+
+DEFAULT_RECEIPT_COUNT = 200
+MODES = ['single', 'zip', 'prerender']
+
+
+def synthetic_payloads(count):
+    """Yield receipt payloads shaped like receipt_store.receipt_payload output"""
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        created_at = start + timedelta(minutes=i)
+        serial_number = f"TXN-{created_at.strftime('%Y%m%d')}-{i:04d}"
+        quantity = (i % 97) + 1
+        yield {
+            'transaction_id': i + 1,
+            'filename': f"Receipt_{serial_number}_{created_at.strftime('%Y%m%d')}.pdf",
+            'transaction_data': {
+                'serial_number': serial_number,
+                'date': created_at,
+                'material_name': f"Material {i % 250}",
+                'material_sku': f"SKU-{i % 250:04d}",
+                'material_unit': 'bags',
+                'quantity': quantity,
+                'unit_cost': 12.5,
+                'total_value': quantity * 12.5,
+                'notes': f"Supplier: Supplier {i % 20}\nContact: 0977 000 {i % 1000:03d}\nRef: INV-{i:06d}",
+                'supplier_info': {
+                    'name': f"Supplier {i % 20}",
+                    'contact': f"0977 000 {i % 1000:03d}",
+                    'reference': f"INV-{i:06d}"
+                }
+            },
+            'site_data': {'name': 'Benchmark Site', 'location': 'Lusaka', 'code': 'BEN'},
+            'user_data': {'username': 'storesman1', 'role': 'storesman'},
+            'company_settings': {'company_name': 'Benchmark Co', 'currency': 'ZMW'}
+        }
+
+
+def run_single(payloads, workers):
+    """One receipt at a time, as download_receipt renders on a store miss"""
+    for payload in payloads:
+        render_receipt_payload(payload)
+
+
+def run_zip(payloads, workers):
+    """A receipts ZIP bundle, discarding the archive bytes"""
+    for _ in iter_receipts_zip(payloads, workers):
+        pass
+
+
+def run_prerender(payloads, workers):
+    """Render and write each receipt under its content hash, as the background pre-renderer does"""
+    folder = tempfile.mkdtemp()
+    try:
+        for payload in payloads:
+            _, pdf_data = render_receipt_payload(payload)
+            sha256 = hashlib.sha256(pdf_data).hexdigest()
+            with open(os.path.join(folder, f"{sha256}.pdf"), 'wb') as f:
+                f.write(pdf_data)
+    finally:
+        shutil.rmtree(folder)
+
+
+RUNNERS = {'single': run_single, 'zip': run_zip, 'prerender': run_prerender}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--receipts', type=int, default=DEFAULT_RECEIPT_COUNT)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--workers', type=int, nargs='+', default=[RECEIPT_RENDER_WORKERS],
+                        help='Render processes for ZIP bundles')
+    args = parser.parse_args()
+
+    # The first render of a process also pays for reportlab's lazy initialisation
+    started = time.perf_counter()
+    render_receipt_payload(next(synthetic_payloads(1)))
+    print(f"first receipt: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    print(f"{'mode':<12}{'workers':>8}{'receipts':>10}{'seconds':>10}{'receipts/s':>12}")
+    for mode in args.modes:
+        for workers in (args.workers if mode == 'zip' else [1]):
+            payloads = list(synthetic_payloads(args.receipts))
+            started = time.perf_counter()
+            RUNNERS[mode](payloads, workers)
+            elapsed = time.perf_counter() - started
+            print(f"{mode:<12}{workers:>8}{args.receipts:>10}{elapsed:>10.2f}{args.receipts / elapsed:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,8 @@ Bulk import script for construction materials from the provided list
 """
 
 import pandas as pd
-from app import app, db
-from models_new import Material
+from app import app
+from catalog_import import CatalogImportService, ACTION_REJECTED, ACTION_UNCHANGED
 
 # Comprehensive materials list from the provided image
 materials_data = [
@@ -122,49 +122,29 @@ materials_data = [
 ]
 
 def import_materials():
-    """Import all materials into the database"""
+    """Import all materials into the database; running it again only applies changes"""
     with app.app_context():
-        added_count = 0
-        updated_count = 0
-        error_count = 0
-        
-        for material_data in materials_data:
-            try:
-                # Check if material already exists
-                existing_material = Material.query.filter_by(name=material_data['name']).first()
-                
-                if existing_material:
-                    # Update existing material
-                    existing_material.unit = material_data['unit']
-                    existing_material.category = material_data['category']
-                    existing_material.cost_per_unit = material_data['cost_per_unit']
-                    existing_material.minimum_level = material_data['minimum_level']
-                    existing_material.description = material_data['description']
-                    updated_count += 1
-                else:
-                    # Create new material
-                    new_material = Material(
-                        name=material_data['name'],
-                        unit=material_data['unit'],
-                        category=material_data['category'],
-                        cost_per_unit=material_data['cost_per_unit'],
-                        minimum_level=material_data['minimum_level'],
-                        description=material_data['description']
-                    )
-                    db.session.add(new_material)
-                    added_count += 1
-                    
-            except Exception as e:
-                print(f"Error processing {material_data['name']}: {str(e)}")
-                error_count += 1
-                continue
-        
+        frame = pd.DataFrame(materials_data).rename(columns={
+            'name': 'Material Name',
+            'unit': 'Unit',
+            'description': 'Description',
+            'cost_per_unit': 'Cost per Unit',
+            'minimum_level': 'Minimum Level',
+            'category': 'Category'
+        })
+        diff = CatalogImportService.diff(frame)
+        for row, name, error in diff.loc[diff['action'] == ACTION_REJECTED, ['row', 'name', 'error']].itertuples(index=False, name=None):
+            print(f"Error processing {name}: {error}")
+
         try:
-            db.session.commit()
-            print(f"Import completed! Added: {added_count}, Updated: {updated_count}, Errors: {error_count}")
+            added_count, updated_count = CatalogImportService.apply(diff)
+            unchanged_count = int((diff['action'] == ACTION_UNCHANGED).sum())
+            error_count = int((diff['action'] == ACTION_REJECTED).sum())
+            print(f"Import completed! Added: {added_count}, Updated: {updated_count}, "
+                  f"Unchanged: {unchanged_count}, Errors: {error_count}")
         except Exception as e:
-            db.session.rollback()
             print(f"Error committing to database: {str(e)}")
 
+
 if __name__ == '__main__':
-    import_materials()
\ No newline at end of file
+    import_materials()
@@ -0,0 +1,204 @@
+"""
+Catalog Import
+Idempotent material catalog imports from CSV or XLSX. Rows are keyed on SKU, or
+on the normalized name (case and spacing ignored) when there is no SKU, and are
+classified as added, changed or unchanged before anything is written, so the
+same file can be imported again without creating duplicates.
+
+On PostgreSQL the rows to write are staged with COPY into a temporary table and
+merged with one UPDATE ... FROM and one INSERT ... SELECT; other databases use
+executemany bulk statements.
+"""
+
+import csv
+from io import StringIO
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, text, update
+
+from app import db
+from models_new import Material
+from import_reader import import_format, read_import_frame
+from material_import import MATERIAL_COLUMNS, SKU_COLUMN, MaterialImportService, normalize_material_frame
+from inventory_service import InventoryService
+
+CATALOG_COLUMNS = MATERIAL_COLUMNS + [SKU_COLUMN]
+
+# Material fields an import sets; a row whose fields all match is unchanged
+CATALOG_FIELDS = ['name', 'sku', 'unit', 'description', 'cost_per_unit', 'minimum_level', 'category']
+
+ACTION_ADDED = 'added'
+ACTION_CHANGED = 'changed'
+ACTION_UNCHANGED = 'unchanged'
+ACTION_REJECTED = 'rejected'
+
+DIFF_COLUMNS = [('row', 'Row'), ('action', 'Action'), ('name', 'Material Name'), ('sku', 'SKU'),
+                ('changes', 'Changes'), ('error', 'Error')]
+
+
+def normalize_names(names):
+    """Normalized catalog keys: case-insensitive with runs of whitespace collapsed"""
+    return names.astype('string').str.strip().str.replace(r'\s+', ' ', regex=True).str.casefold().astype(object)
+
+
+def _existing_catalog():
+    """Every material's importable fields, from one query"""
+    frame = pd.DataFrame(
+        db.session.query(Material.id, *[getattr(Material, field) for field in CATALOG_FIELDS])
+        .order_by(Material.id).all(),
+        columns=['id'] + CATALOG_FIELDS
+    )
+    frame['key'] = normalize_names(frame['name'])
+    return frame
+
+
+def _changed_fields(rows, current):
+    """Names of the fields that differ between file rows and their current materials"""
+    differs = {}
+    for field in CATALOG_FIELDS:
+        new, old = rows[field].values, current[field].values
+        if field in ('cost_per_unit', 'minimum_level'):
+            differs[field] = ~np.isclose(new.astype(float), pd.to_numeric(old).astype(float))
+        elif field == 'sku':
+            # A blank SKU cell keeps the current SKU
+            differs[field] = pd.notna(new) & (new != old)
+        else:
+            differs[field] = pd.Series(new).fillna('').values != pd.Series(old).fillna('').values
+    joined = pd.Series('', index=rows.index, dtype=object)
+    for field, changed in differs.items():
+        joined = joined + np.where(changed, field + ', ', '')
+    return joined.str.rstrip(', ')
+
+
+class CatalogImportService:
+    """Service class for idempotent catalog imports"""
+
+    @staticmethod
+    def read(path, filename, skip_header=True):
+        """Read a catalog file into a frame; raises ValueError when it cannot be imported"""
+        file_format = import_format(filename)
+        if not file_format:
+            raise ValueError('Invalid file format. Use .xlsx, .xls or .csv files.')
+        first_row, df = read_import_frame(path, file_format, CATALOG_COLUMNS, skip_header)
+        if 'Material Name' not in df.columns or 'Unit' not in df.columns:
+            raise ValueError('The file must contain "Material Name" and "Unit" columns')
+        return first_row, df
+
+    @staticmethod
+    def diff(df, first_row=2):
+        """
+        Classify every catalog row as added, changed, unchanged or rejected against
+        the current catalog. Returns the normalized rows with id (the matched
+        material), action and changes (the fields that would change) columns.
+        """
+        frame = normalize_material_frame(df, first_row)
+        frame['key'] = normalize_names(frame['name'])
+        duplicate_key = frame['error'].isna() & frame['key'].duplicated()
+        frame.loc[duplicate_key, 'error'] = 'Same name as an earlier row (ignoring case and spacing)'
+
+        existing = _existing_catalog()
+        by_sku = existing.dropna(subset=['sku']).set_index('sku')['id']
+        by_key = existing.drop_duplicates('key').set_index('key')['id']
+        frame['id'] = frame['sku'].map(by_sku).fillna(frame['key'].map(by_key))
+
+        # A row matched by name cannot take a SKU that belongs to a different material
+        sku_owner = frame['sku'].map(by_sku)
+        taken_sku = frame['error'].isna() & sku_owner.notna() & (sku_owner != frame['id'])
+        frame.loc[taken_sku, 'error'] = 'SKU belongs to another material'
+        same_material = frame['error'].isna() & frame['id'].notna() & frame['id'].duplicated()
+        frame.loc[same_material, 'error'] = 'Matches the same material as an earlier row'
+
+        valid = frame['error'].isna()
+        matched = valid & frame['id'].notna()
+        frame['action'] = np.where(valid, ACTION_ADDED, ACTION_REJECTED).astype(object)
+        frame['changes'] = ''
+        if matched.any():
+            current = existing.set_index('id').loc[frame.loc[matched, 'id'].astype(int)]
+            changes = _changed_fields(frame.loc[matched], current)
+            frame.loc[matched, 'changes'] = changes.values
+            frame.loc[matched, 'action'] = np.where(changes.values != '', ACTION_CHANGED, ACTION_UNCHANGED)
+        return frame
+
+    @staticmethod
+    def apply(diff):
+        """Write the added and changed rows of a diff in one transaction; returns (added, changed)"""
+        added = diff[diff['action'] == ACTION_ADDED]
+        changed = diff[diff['action'] == ACTION_CHANGED].copy()
+        if added.empty and changed.empty:
+            return 0, 0
+
+        try:
+            previous = None
+            if len(changed):
+                changed['id'] = changed['id'].astype(int)
+                previous = _existing_catalog().set_index('id').loc[changed['id']]
+                changed['sku'] = changed['sku'].where(changed['sku'].notna(), previous['sku'].values)
+
+            if db.engine.dialect.name == 'postgresql':
+                CatalogImportService._merge_with_copy(added, changed)
+            else:
+                CatalogImportService._merge_with_executemany(added, changed)
+
+            if len(changed):
+                MaterialImportService.refresh_rollups(changed.set_index('id'), previous)
+            InventoryService.bump_catalog_version()
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error importing catalog: {str(e)}")
+            raise
+
+        logging.info(f"Catalog import: {len(added)} added, {len(changed)} changed")
+        return len(added), len(changed)
+
+    @staticmethod
+    def _records(rows, fields):
+        values = rows[fields].astype(object)
+        return values.where(values.notna(), None).to_dict('records')
+
+    @staticmethod
+    def _merge_with_executemany(added, changed):
+        if len(added):
+            db.session.execute(insert(Material), CatalogImportService._records(added, CATALOG_FIELDS))
+        if len(changed):
+            db.session.execute(update(Material), CatalogImportService._records(changed, ['id'] + CATALOG_FIELDS))
+
+    @staticmethod
+    def _merge_with_copy(added, changed):
+        """Stage rows with COPY into a temporary table and merge them into materials in SQL"""
+        stage_columns = ['id'] + CATALOG_FIELDS
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        for rows in (added, changed):
+            for record in CatalogImportService._records(rows.assign(id=rows['id'].astype(object)), stage_columns):
+                writer.writerow(['' if record[column] is None else record[column] for column in stage_columns])
+        buffer.seek(0)
+
+        connection = db.session.connection()
+        connection.execute(text(
+            "CREATE TEMPORARY TABLE material_catalog_stage ("
+            "id INTEGER, name VARCHAR(100), sku VARCHAR(50), unit VARCHAR(20), description TEXT, "
+            "cost_per_unit DOUBLE PRECISION, minimum_level DOUBLE PRECISION, category VARCHAR(50)"
+            ") ON COMMIT DROP"
+        ))
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY material_catalog_stage ({', '.join(stage_columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+
+        connection.execute(text(
+            "UPDATE materials AS m SET name = s.name, sku = s.sku, unit = s.unit, description = s.description, "
+            "cost_per_unit = s.cost_per_unit, minimum_level = s.minimum_level, category = s.category "
+            "FROM material_catalog_stage AS s WHERE s.id IS NOT NULL AND m.id = s.id"
+        ))
+        connection.execute(text(
+            "INSERT INTO materials (name, sku, unit, description, cost_per_unit, minimum_level, category, created_at) "
+            "SELECT name, sku, unit, description, cost_per_unit, minimum_level, category, now() AT TIME ZONE 'utc' "
+            "FROM material_catalog_stage WHERE id IS NULL"
+        ))
@@ -0,0 +1,403 @@
+"""
+Maintenance CLI Commands
+Run with: flask --app main <command>
+"""
+
+import os
+
+import click
+
+from app import app
+from stock_status import StockStatusService
+from valuation_service import ValuationService
+from activity_counters import ActivityCounterService
+from ledger_export import iter_ledger_csv, gzip_chunks
+from report_engine import ReportEngine, DATASETS, REPORT_FORMATS, REPORT_EXTENSIONS
+
+
+@app.cli.command('rebuild-stock-status')
+def rebuild_stock_status():
+    """Rebuild the maintained low-stock index from current stock levels"""
+    count = StockStatusService.rebuild()
+    click.echo(f"Stock status rebuilt for {count} stock levels")
+
+
+@app.cli.command('rebuild-valuations')
+def rebuild_valuations():
+    """Rebuild the per-site, per-category inventory valuation rollup from stock levels"""
+    count = ValuationService.rebuild()
+    click.echo(f"Inventory valuation rebuilt: {count} site/category rows")
+
+
+@app.cli.command('rebuild-activity-counters')
+def rebuild_activity_counters():
+    """Rebuild the daily activity counters from the transactions ledger"""
+    count = ActivityCounterService.rebuild()
+    click.echo(f"Daily activity counters rebuilt: {count} date/site/type rows")
+
+
+@app.cli.command('export-transactions')
+@click.option('--site-id', type=int, default=None, help='Only export this site')
+@click.option('--start-date', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+@click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-', help='Output file (default: stdout)')
+@click.option('--gzip', 'compress', is_flag=True, help='Write gzip-compressed CSV')
+def export_transactions(site_id, start_date, end_date, output, compress):
+    """Stream the transactions ledger as CSV"""
+    chunks = iter_ledger_csv(
+        site_id,
+        start_date.date() if start_date else None,
+        end_date.date() if end_date else None
+    )
+    if compress:
+        chunks = gzip_chunks(chunks)
+    else:
+        chunks = (chunk.encode('utf-8') for chunk in chunks)
+    
+    with click.open_file(output, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+@app.cli.command('export-report')
+@click.argument('report_type', type=click.Choice(sorted(DATASETS)))
+@click.option('--site-id', type=int, required=True)
+@click.option('--report-date', type=click.DateTime(formats=['%Y-%m-%d']), help='Day of a daily_issues report')
+@click.option('--start-date', type=click.DateTime(formats=['%Y-%m-%d']))
+@click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']))
+@click.option('--format', '-f', 'formats', type=click.Choice(REPORT_FORMATS), multiple=True, default=['pdf'],
+              help='Repeat to write several formats from one query')
+@click.option('--output', '-o', default=None, help='Output path without extension')
+def export_report(report_type, site_id, report_date, start_date, end_date, formats, output):
+    """Render a report dataset to one or more formats"""
+    if report_type == 'daily_issues' and not report_date:
+        raise click.UsageError('--report-date is required for daily_issues')
+
+    params = ReportEngine.build_params(
+        site_id,
+        report_date.date() if report_date else None,
+        start_date.date() if start_date else None,
+        end_date.date() if end_date else None
+    )
+    output = output or f"{report_type}_{site_id}"
+    outputs = {report_format: f"{output}.{REPORT_EXTENSIONS[report_format]}" for report_format in formats}
+    frame = ReportEngine.render(report_type, params, outputs)
+    for path in outputs.values():
+        click.echo(f"Wrote {len(frame)} rows to {path}")
+
+
+@app.cli.command('run-report-worker')
+@click.option('--poll-interval', type=float, default=None, help='Seconds to wait when the queue is empty')
+def run_report_worker(poll_interval):
+    """Run the background report worker in the foreground"""
+    import report_worker
+    report_worker.run(poll_interval if poll_interval is not None else report_worker.POLL_INTERVAL)
+
+
+@app.cli.command('rerender-receipts')
+@click.option('--all', 'all_documents', is_flag=True, help='Re-render every stored receipt, not just older layouts')
+def rerender_receipts(all_documents):
+    """Re-render stored goods received vouchers after a receipt layout change"""
+    from receipt_store import ReceiptStore
+    count = ReceiptStore.rerender(all_documents)
+    click.echo(f"Re-rendered {count} receipts")
+
+
+@app.cli.command('prerender-receipts')
+def prerender_receipts():
+    """Render and store receipts for every receive transaction that has none yet"""
+    from receipt_store import ReceiptStore
+    total = 0
+    last_id = 0
+    while last_id is not None:
+        stored, last_id = ReceiptStore.prerender_missing(after_id=last_id)
+        total += stored
+    click.echo(f"Pre-rendered {total} receipts")
+
+
+@app.cli.command('import-materials')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False), required=False)
+@click.option('--no-header', is_flag=True, help='The first row is data, in the upload template column order')
+@click.option('--update-existing', is_flag=True, help='Update materials whose SKU or name already exists')
+@click.option('--chunk-size', type=int, default=None, help='Rows imported and committed per chunk')
+@click.option('--resume', 'resume_job_id', type=int, default=None, help='Continue a failed or stalled import by job id')
+def import_materials(path, no_header, update_existing, chunk_size, resume_job_id):
+    """Import a material catalog (.xlsx, .xls or .csv) in committed chunks"""
+    from app import db
+    from models_new import MaterialImportJob
+    from material_import import MaterialImportService, JOB_FAILED
+    from import_reader import IMPORT_CHUNK_SIZE
+
+    if not path and not resume_job_id:
+        raise click.UsageError('Give a file to import or --resume JOB_ID')
+
+    try:
+        if resume_job_id:
+            job = db.session.get(MaterialImportJob, resume_job_id)
+            if not job:
+                raise click.ClickException(f"Material import {resume_job_id} not found")
+            MaterialImportService.resume(job, queue=False)
+        else:
+            job = MaterialImportService.submit(os.path.abspath(path), os.path.basename(path), not no_header,
+                                               update_existing, queue=False)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    def report_progress(job):
+        total = f"/{job.rows_total}" if job.rows_total else ""
+        click.echo(f"  {job.rows_processed}{total} rows: {job.added} added, {job.updated} updated, "
+                   f"{job.skipped} skipped, {job.rejected} rejected")
+
+    click.echo(f"Importing {job.filename} as job {job.id} from row {job.rows_processed}")
+    MaterialImportService.run_job(job, chunk_size or IMPORT_CHUNK_SIZE, on_progress=report_progress)
+    if job.status == JOB_FAILED:
+        raise click.ClickException(f"Import stopped after {job.rows_processed} rows: {job.error_message}. "
+                                   f"Resume with --resume {job.id}")
+    click.echo(f"Imported {job.rows_processed} rows: {job.added} added, {job.updated} updated, "
+               f"{job.skipped} skipped, {job.rejected} rejected")
+
+
+@app.cli.command('import-opening-balances')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username recorded as the creator of the receive transactions')
+@click.option('--site', 'default_site', default=None, help='Site name or code for lines without a Site column value')
+@click.option('--no-header', is_flag=True, help='The first row is data: Site, Material, SKU, Quantity, Unit Cost, Received Date')
+@click.option('--dry-run', is_flag=True, help='Show the diff against current stock without writing anything')
+@click.option('--diff-output', type=click.Path(dir_okay=False), default=None, help='Write the per-material diff as CSV')
+@click.option('--errors-output', type=click.Path(dir_okay=False), default=None, help='Write rejected lines as CSV')
+@click.option('--skip-invalid', is_flag=True, help='Import the valid lines even when some lines are rejected')
+def import_opening_balances(path, username, default_site, no_header, dry_run, diff_output, errors_output, skip_invalid):
+    """Load a site's existing stock as receive transactions and FIFO layers"""
+    from models_new import User
+    from opening_balance import OpeningBalanceService, DIFF_COLUMNS, ERROR_COLUMNS
+
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f"User '{username}' not found")
+
+    try:
+        plan = OpeningBalanceService.plan(path, os.path.basename(path), not no_header, default_site)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    diff = plan.diff
+    for site_name, site_diff in diff.groupby('site_name', sort=False):
+        new_levels = int((site_diff['change'] == 'new stock level').sum())
+        click.echo(f"{site_name}: {int(site_diff['lines'].sum())} lines, {len(site_diff)} materials "
+                   f"({new_levels} new stock levels), quantity +{site_diff['opening_quantity'].sum():,.2f}, "
+                   f"value +{site_diff['opening_value'].sum():,.2f}")
+    click.echo(f"{len(plan.lines)} valid lines, {len(plan.errors)} rejected")
+
+    if diff_output:
+        diff[[key for key, _ in DIFF_COLUMNS]].to_csv(diff_output, index=False, header=[header for _, header in DIFF_COLUMNS])
+        click.echo(f"Wrote diff to {diff_output}")
+    if errors_output and len(plan.errors):
+        plan.errors.to_csv(errors_output, index=False, header=[header for _, header in ERROR_COLUMNS])
+        click.echo(f"Wrote rejected lines to {errors_output}")
+    elif len(plan.errors):
+        for row, error in plan.errors[['row', 'error']].head(20).itertuples(index=False, name=None):
+            click.echo(f"  row {row}: {error}")
+        if len(plan.errors) > 20:
+            click.echo(f"  ... and {len(plan.errors) - 20} more (use --errors-output)")
+
+    if dry_run:
+        click.echo("Dry run: nothing was written")
+        return
+    if len(plan.errors) and not skip_invalid:
+        raise click.ClickException('Some lines were rejected; fix them or pass --skip-invalid')
+
+    count = OpeningBalanceService.apply(plan, user.id)
+    click.echo(f"Recorded {count} opening balance transactions")
+
+
+@app.cli.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--no-header', is_flag=True, help='The first row is data, in the upload template column order plus SKU')
+@click.option('--diff', 'diff_only', is_flag=True, help='Only show what would be added, changed and left unchanged')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None, help='Write the per-row diff as CSV')
+def import_catalog(path, no_header, diff_only, output):
+    """Import a material catalog idempotently, keyed on SKU or normalized name"""
+    from catalog_import import CatalogImportService, DIFF_COLUMNS, ACTION_ADDED, ACTION_CHANGED, ACTION_REJECTED
+
+    try:
+        first_row, df = CatalogImportService.read(path, os.path.basename(path), not no_header)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    diff = CatalogImportService.diff(df, first_row)
+    counts = diff['action'].value_counts()
+    click.echo(', '.join(f"{counts.get(action, 0)} {action}" for action in ('added', 'changed', 'unchanged', 'rejected')))
+    for action in (ACTION_ADDED, ACTION_CHANGED, ACTION_REJECTED):
+        rows = diff[diff['action'] == action]
+        for row, name, changes, error in rows[['row', 'name', 'changes', 'error']].head(20).itertuples(index=False, name=None):
+            detail = {ACTION_CHANGED: changes, ACTION_REJECTED: error}.get(action)
+            click.echo(f"  {action:<9} row {row}: {name}" + (f" ({detail})" if detail else ""))
+        if len(rows) > 20:
+            click.echo(f"  ... and {len(rows) - 20} more {action}")
+
+    if output:
+        diff[[key for key, _ in DIFF_COLUMNS]].to_csv(output, index=False, header=[header for _, header in DIFF_COLUMNS])
+        click.echo(f"Wrote diff to {output}")
+
+    if diff_only:
+        return
+    added, changed = CatalogImportService.apply(diff)
+    click.echo(f"Imported catalog: {added} added, {changed} changed")
+
+
+@app.cli.command('cycle-count')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--site', 'site_name', required=True, help='Name or code of the counted site')
+@click.option('--user', 'username', required=True, help='Username recorded as the adjuster')
+@click.option('--reason', default=None, help='Reason recorded on every adjustment')
+@click.option('--no-header', is_flag=True, help='The first row is data: Material, SKU, Counted Quantity')
+@click.option('--dry-run', is_flag=True, help='Show the discrepancies without adjusting anything')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), default=None, help='Write the discrepancies as CSV')
+def cycle_count(path, site_name, username, reason, no_header, dry_run, output):
+    """Apply a physical count sheet for a site in one transaction"""
+    from models_new import Site, User
+    from cycle_count import CycleCountService, DIFF_COLUMNS
+
+    site = Site.query.filter((Site.name == site_name) | (Site.code == site_name)).first()
+    if not site:
+        raise click.ClickException(f"Site '{site_name}' not found")
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f"User '{username}' not found")
+
+    try:
+        first_row, df = CycleCountService.read(path, os.path.basename(path), not no_header)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    plan = CycleCountService.plan(site.id, df, first_row, for_update=not dry_run)
+    discrepancies = plan.lines[plan.lines['discrepancy'] != 0]
+    click.echo(f"{site.name}: {len(plan.lines)} items counted, {len(discrepancies)} discrepancies "
+               f"(quantity {discrepancies['discrepancy'].sum():+,.2f}, value {discrepancies['adjustment_value'].sum():+,.2f}), "
+               f"{len(plan.errors)} rejected")
+    for row, error in plan.errors[['row', 'error']].head(20).itertuples(index=False, name=None):
+        click.echo(f"  row {row}: {error}")
+    if output:
+        discrepancies[[key for key, _ in DIFF_COLUMNS]].to_csv(output, index=False,
+                                                               header=[header for _, header in DIFF_COLUMNS])
+        click.echo(f"Wrote discrepancies to {output}")
+
+    if dry_run:
+        click.echo("Dry run: nothing was adjusted")
+        return
+    if len(plan.errors):
+        raise click.ClickException('Some lines were rejected; fix them and count again')
+
+    counted, adjusted = CycleCountService.apply(plan, user.id, reason)
+    click.echo(f"Applied cycle count: {counted} items counted, {adjusted} adjusted")
+
+
+@app.cli.command('export-stock-workbook')
+def export_stock_workbook():
+    """Export the legacy stock journal to data/construction_materials.xlsx"""
+    from excel_manager import ExcelManager
+
+    path = ExcelManager().export_workbook()
+    click.echo(f"Exported stock workbook to {path}")
+
+
+@app.cli.command('build-static-artifacts')
+def build_static_artifacts():
+    """Build every precomputed download (upload templates) for the current deploy and catalog"""
+    from static_artifacts import StaticArtifactService, ARTIFACTS
+
+    for name in ARTIFACTS:
+        path, version = StaticArtifactService.build(name)
+        click.echo(f"Built {name} version {version}: {path}")
+
+
+@app.cli.command('canonicalize-units')
+@click.option('--dry-run', is_flag=True, help='Only list the units that would change')
+def canonicalize_units(dry_run):
+    """Rewrite every material's unit to its canonical code from the unit registry"""
+    from collections import Counter
+    from sqlalchemy import update
+    from app import db
+    from models_new import Material
+    from inventory_service import InventoryService
+    from units import canonical_unit
+
+    changes, unknown, renames = [], Counter(), Counter()
+    for material_id, unit in db.session.query(Material.id, Material.unit):
+        code = canonical_unit(unit)
+        if code is None:
+            unknown[unit] += 1
+        elif code != unit:
+            changes.append({'id': material_id, 'unit': code})
+            renames[(unit, code)] += 1
+
+    for (unit, code), count in sorted(renames.items()):
+        click.echo(f"  '{unit}' -> '{code}': {count} materials")
+    for unit, count in sorted(unknown.items(), key=lambda item: str(item[0])):
+        click.echo(f"  unknown unit '{unit}' left unchanged: {count} materials")
+
+    if dry_run:
+        click.echo(f"Dry run: {len(changes)} materials would change")
+        return
+    if changes:
+        db.session.execute(update(Material), changes)
+        InventoryService.bump_catalog_version()
+        db.session.commit()
+    click.echo(f"Canonicalized the unit of {len(changes)} materials")
+
+
+@app.cli.command('import-grn')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--site', 'site_name', required=True, help='Name or code of the receiving site')
+@click.option('--user', 'username', required=True, help='Username recorded as the receiver')
+@click.option('--supplier', default=None, help='Supplier name for the transaction notes')
+@click.option('--invoice', 'invoice_number', default=None, help='Invoice number for the transaction notes')
+@click.option('--document', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Supporting document to link (defaults to the invoice file itself)')
+@click.option('--no-header', is_flag=True, help='The first row is data: SKU, Description, Quantity, Unit, Unit Cost, Line Total')
+@click.option('--dry-run', is_flag=True, help='Only match the lines; nothing is received')
+def import_grn(path, site_name, username, supplier, invoice_number, document, no_header, dry_run):
+    """Receive a supplier invoice into a site in one transaction"""
+    from datetime import datetime
+    import shutil
+    from werkzeug.utils import secure_filename
+    from models_new import Site, User
+    from grn_import import GrnImportService
+
+    site = Site.query.filter((Site.name == site_name) | (Site.code == site_name)).first()
+    if not site:
+        raise click.ClickException(f"Site '{site_name}' not found")
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f"User '{username}' not found")
+
+    try:
+        plan = GrnImportService.plan(site.id, path, os.path.basename(path), not no_header)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    click.echo(f"{site.name}: {len(plan.lines)} lines matched to {len(plan.diff)} materials "
+               f"(value {plan.lines['total_value'].sum():,.2f}), {len(plan.errors)} rejected")
+    for row, error in plan.errors[['row', 'error']].head(20).itertuples(index=False, name=None):
+        click.echo(f"  row {row}: {error}")
+
+    if dry_run:
+        click.echo("Dry run: nothing was received")
+        return
+    if len(plan.errors):
+        raise click.ClickException('Some lines were rejected; fix them and import again')
+
+    # Supporting documents are served from uploads/, so the document is copied there
+    document = document or path
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs('uploads', exist_ok=True)
+    supporting_document_url = os.path.join(
+        'uploads', f"grn_{timestamp}_{secure_filename(os.path.basename(document)) or 'invoice'}"
+    )
+    shutil.copyfile(document, supporting_document_url)
+    try:
+        count = GrnImportService.apply(plan, user.id, supplier, invoice_number, supporting_document_url)
+    except Exception:
+        os.remove(supporting_document_url)
+        raise
+    click.echo(f"Received {count} invoice lines")
@@ -0,0 +1,249 @@
+"""
+Consolidated Stock Report
+Company-wide stock position across every site from one grouped query. Site totals,
+category and material comparisons across sites and the per-site detail sheets are
+all derived from that single frame with pandas group-bys.
+"""
+
+from datetime import datetime
+from itertools import chain
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+from sqlalchemy import func
+
+from app import db
+from models_new import Site, Material, StockLevel
+from enhanced_report_generator import ProfessionalReportGenerator
+from pdf_tables import FlowableStream
+from report_frames import read_frame, plain_records, format_amounts, format_currency
+from streaming_excel import StreamingExcelWriter
+
+INVALID_SHEET_CHARACTERS = re.compile(r'[\[\]:*?/\\]')
+
+
+def consolidated_stock_query():
+    """Stock per site, category and material in one grouped query"""
+    return db.session.query(
+        Site.id.label('site_id'),
+        Site.name.label('site_name'),
+        Material.category,
+        Material.id.label('material_id'),
+        Material.name.label('material_name'),
+        Material.unit,
+        func.sum(StockLevel.quantity).label('quantity'),
+        func.sum(StockLevel.total_value).label('total_value'),
+        func.max(Material.minimum_level).label('minimum_level')
+    ).join(Site, StockLevel.site_id == Site.id).join(
+        Material, StockLevel.material_id == Material.id
+    ).group_by(
+        Site.id, Site.name, Material.category, Material.id, Material.name, Material.unit
+    ).order_by(Site.name, Material.category, Material.name)
+
+
+def _sheet_title(name, used):
+    """Make a unique Excel sheet title (31 characters, no []:*?/\\)"""
+    base = INVALID_SHEET_CHARACTERS.sub('-', name).strip() or 'Site'
+    title = base[:31]
+    suffix = 2
+    while title.lower() in used:
+        tag = f" ({suffix})"
+        title = base[:31 - len(tag)] + tag
+        suffix += 1
+    used.add(title.lower())
+    return title
+
+
+class ConsolidatedReportService:
+    """Service class for the all-sites stock report"""
+
+    @staticmethod
+    def fetch_frame():
+        """Fetch the grouped stock frame with derived columns"""
+        frame = read_frame(consolidated_stock_query())
+        frame['category'] = frame['category'].fillna('General')
+        frame['quantity'] = frame['quantity'].fillna(0)
+        frame['total_value'] = frame['total_value'].fillna(0)
+        frame['minimum_level'] = frame['minimum_level'].fillna(0)
+        frame['unit_cost'] = (frame['total_value'] / frame['quantity'].where(frame['quantity'] > 0)).fillna(0)
+        frame['low_stock'] = frame['quantity'] < frame['minimum_level']
+        frame['status'] = np.where(frame['low_stock'], 'LOW STOCK', 'OK')
+        logging.info(f"Fetched {len(frame)} stock rows across {frame['site_id'].nunique()} sites")
+        return frame
+
+    @staticmethod
+    def site_totals(frame):
+        """One row per site: materials stocked, stock value, low stock items and share of company value"""
+        totals = frame.groupby(['site_id', 'site_name'], sort=False).agg(
+            materials=('material_id', 'count'),
+            total_value=('total_value', 'sum'),
+            low_stock=('low_stock', 'sum')
+        ).reset_index()
+        company_value = totals['total_value'].sum()
+        totals['value_share'] = totals['total_value'] / company_value * 100 if company_value else 0.0
+        totals['value_rank'] = totals['total_value'].rank(ascending=False, method='min').astype(int)
+        return totals.sort_values('site_name', kind='stable')
+
+    @staticmethod
+    def category_comparison(frame):
+        """Stock value per category (rows) and site (columns) with a company total"""
+        pivot = frame.pivot_table(index='category', columns='site_name', values='total_value',
+                                  aggfunc='sum', fill_value=0)
+        pivot['Total'] = pivot.sum(axis=1)
+        return pivot.sort_values('Total', ascending=False)
+
+    @staticmethod
+    def material_comparison(frame):
+        """Quantity per material (rows) and site (columns), with totals and the number of sites stocking it"""
+        pivot = frame.pivot_table(index=['material_name', 'unit'], columns='site_name', values='quantity',
+                                  aggfunc='sum', fill_value=0)
+        pivot['Total'] = pivot.sum(axis=1)
+        pivot['Sites Stocked'] = (pivot.drop(columns='Total') > 0).sum(axis=1)
+        return pivot
+
+    @staticmethod
+    def render_excel(frame, params, output):
+        currency_format = f'"{params["currency"]}" #,##0.00'
+        writer = StreamingExcelWriter()
+
+        totals = ConsolidatedReportService.site_totals(frame)
+        overview_rows = list(plain_records(
+            totals, ['site_name', 'materials', 'total_value', 'low_stock', 'value_share', 'value_rank']
+        ))
+        overview_rows.append(('TOTAL', int(totals['materials'].sum()), float(totals['total_value'].sum()),
+                              int(totals['low_stock'].sum()), 100.0 if len(totals) else 0.0, None))
+        writer.add_sheet(
+            'Overview',
+            ['Site', 'Materials', 'Stock Value', 'Low Stock Items', 'Share of Value (%)', 'Value Rank'],
+            overview_rows,
+            number_formats={2: currency_format, 4: '0.0'}
+        )
+
+        categories = ConsolidatedReportService.category_comparison(frame)
+        writer.add_sheet(
+            'By Category',
+            ['Category'] + list(categories.columns),
+            plain_records(categories.reset_index(), ['category'] + list(categories.columns)),
+            number_formats={index: currency_format for index in range(1, len(categories.columns) + 1)}
+        )
+
+        materials = ConsolidatedReportService.material_comparison(frame)
+        writer.add_sheet(
+            'Material Comparison',
+            ['Material', 'Unit'] + list(materials.columns),
+            plain_records(materials.reset_index(), ['material_name', 'unit'] + list(materials.columns)),
+            number_formats={index: '#,##0.00' for index in range(2, len(materials.columns) + 1)}
+        )
+
+        # Per-site sheets are slices of the same frame; write-only workbooks are a single
+        # zip stream, so sheets are written one after another
+        used_titles = {'overview', 'by category', 'material comparison'}
+        detail_columns = ['category', 'material_name', 'quantity', 'unit', 'unit_cost', 'total_value', 'minimum_level', 'status']
+        for (_, site_name), site_frame in frame.groupby(['site_id', 'site_name'], sort=False):
+            writer.add_sheet(
+                _sheet_title(site_name, used_titles),
+                ['Category', 'Material', 'Quantity', 'Unit', 'Unit Cost', 'Total Value', 'Min Level', 'Status'],
+                plain_records(site_frame, detail_columns),
+                number_formats={2: '#,##0.00', 4: currency_format, 5: currency_format, 6: '#,##0.00'}
+            )
+
+        writer.save(output)
+
+    @staticmethod
+    def render_pdf(frame, params, output):
+        generator = ProfessionalReportGenerator()
+        currency = params['currency']
+        doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+
+        totals = ConsolidatedReportService.site_totals(frame)
+        story = []
+        generator.add_company_header(story, params['company_name'], "CONSOLIDATED STOCK REPORT")
+        generator.add_report_info_section(story, {
+            'Report Date': datetime.now().strftime('%d/%m/%Y'),
+            'Sites': len(totals),
+            'Total Stock Value': generator.format_currency(totals['total_value'].sum(), currency),
+            'Low Stock Items': int(totals['low_stock'].sum())
+        })
+
+        if frame.empty:
+            story.append(Paragraph("No stock data available.", generator.normal_style))
+            generator.add_footer(story, "Consolidated Stock")
+            doc.build(story)
+            return
+
+        story.append(Paragraph("SITE COMPARISON", generator.header_style))
+        site_rows = pd.DataFrame({
+            'site': totals['site_name'],
+            'materials': totals['materials'].astype(str),
+            'value': format_currency(totals['total_value'], currency),
+            'low_stock': totals['low_stock'].astype(str),
+            'share': format_amounts(totals['value_share'], 1) + '%',
+            'rank': totals['value_rank'].astype(str)
+        })
+        overview_tables = generator.create_professional_tables(
+            (list(row) for row in site_rows.itertuples(index=False, name=None)),
+            ['Site', 'Materials', 'Stock Value', 'Low Stock', 'Share', 'Rank']
+        )
+
+        categories = frame.groupby('category')['total_value'].sum().sort_values(ascending=False)
+        category_story = [Spacer(1, 20), Paragraph("STOCK VALUE BY CATEGORY", generator.header_style)]
+        category_rows = pd.DataFrame({
+            'category': categories.index,
+            'value': format_currency(categories, currency).values
+        })
+        category_tables = generator.create_professional_tables(
+            (list(row) for row in category_rows.itertuples(index=False, name=None)), ['Category', 'Stock Value']
+        )
+
+        def site_sections():
+            formatted = pd.DataFrame({
+                'site_id': frame['site_id'],
+                'site_name': frame['site_name'],
+                'material': frame['material_name'],
+                'category': frame['category'],
+                'quantity': format_amounts(frame['quantity']) + ' ' + frame['unit'].fillna(''),
+                'value': format_currency(frame['total_value'], currency),
+                'status': frame['status']
+            })
+            for (_, site_name), site_frame in formatted.groupby(['site_id', 'site_name'], sort=False):
+                yield PageBreak()
+                yield Paragraph(f"{site_name.upper()} STOCK", generator.header_style)
+                yield from generator.create_professional_tables(
+                    (list(row) for row in site_frame[['material', 'category', 'quantity', 'value', 'status']]
+                     .itertuples(index=False, name=None)),
+                    ['Material', 'Category', 'Quantity', 'Stock Value', 'Status']
+                )
+
+        footer_story = []
+        generator.add_footer(footer_story, "Consolidated Stock")
+        doc.build(FlowableStream(chain(story, overview_tables, category_story, category_tables,
+                                       site_sections(), footer_story)))
+
+    @staticmethod
+    def render_csv(frame, params, output):
+        columns = ['site_name', 'category', 'material_name', 'quantity', 'unit', 'unit_cost', 'total_value',
+                   'minimum_level', 'status']
+        frame[columns].to_csv(output, index=False, header=[
+            'Site', 'Category', 'Material', 'Quantity', 'Unit', 'Unit Cost', 'Total Value', 'Min Level', 'Status'
+        ])
+
+    @staticmethod
+    def render(params, outputs):
+        """Render the consolidated report into each {format: path} in outputs from one fetch"""
+        renderers = {
+            'pdf': ConsolidatedReportService.render_pdf,
+            'excel': ConsolidatedReportService.render_excel,
+            'csv': ConsolidatedReportService.render_csv
+        }
+        unknown = set(outputs) - set(renderers)
+        if unknown:
+            raise ValueError(f"Unsupported report format: {', '.join(sorted(unknown))}")
+
+        frame = ConsolidatedReportService.fetch_frame()
+        for report_format, output in outputs.items():
+            renderers[report_format](frame, params, output)
+        return frame
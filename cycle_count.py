@@ -0,0 +1,297 @@
+"""
+Cycle Counts
+Applies a whole physical count sheet for a site at once. Every counted line is
+compared against a single snapshot of the site's stock levels and FIFO layers,
+and the resulting stock adjustments, adjustment transactions, FIFO layer
+changes and stock levels are written with a handful of bulk statements in one
+database transaction instead of one adjust_stock call (and commit) per item.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, update
+
+from app import db
+from models_new import Material, StockLevel, StockAdjustment, Transaction, FIFOBatch
+from import_reader import import_format, read_import_frame, text_column, number_column
+from inventory_service import InventoryService
+from valuation_service import ValuationService
+from stock_status import StockStatusService
+from activity_counters import ActivityCounterService
+
+COUNT_SHEET_COLUMNS = ['Material', 'SKU', 'Counted Quantity']
+
+DEFAULT_COUNT_REASON = 'Physical Count Discrepancy'
+
+DIFF_COLUMNS = [
+    ('row', 'Row'), ('material_name', 'Material'), ('sku', 'SKU'), ('unit', 'Unit'),
+    ('expected_quantity', 'Expected Quantity'), ('counted_quantity', 'Counted Quantity'),
+    ('discrepancy', 'Discrepancy'), ('adjustment_value', 'Adjustment Value')
+]
+
+ERROR_COLUMNS = [('row', 'Row'), ('material', 'Material'), ('sku', 'SKU'), ('error', 'Error')]
+
+# lines: valid lines with the snapshot's expected quantity and the adjustment value
+# of each discrepancy; layers: the FIFO layers consumed by shortages; errors:
+# rejected lines with the reason
+CycleCountPlan = namedtuple('CycleCountPlan', 'site_id lines layers errors')
+
+
+def normalize_count_sheet(df, first_row=2):
+    """
+    Normalize count sheet lines and resolve materials (by id, SKU, then name,
+    ignoring case); lines with a blank count were not counted and are left out.
+    Returns a frame with row, material, sku, counted_quantity, material_id and
+    error columns.
+    """
+    frame = pd.DataFrame({
+        'row': np.arange(first_row, first_row + len(df)),
+        'material': text_column(df, 'Material'),
+        'sku': text_column(df, 'SKU'),
+    }, index=df.index)
+    material_ids, bad_id = number_column(df, 'Material ID', np.nan)
+    frame['counted_quantity'], bad_quantity = number_column(df, 'Counted Quantity', np.nan)
+
+    # Blank lines carry no material at all, and lines without a count were not counted
+    keep = ((frame['material'] != '') | (frame['sku'] != '') | material_ids.notna() | bad_id) & \
+        (frame['counted_quantity'].notna() | bad_quantity)
+    frame, material_ids, bad_id, bad_quantity = frame[keep].copy(), material_ids[keep], bad_id[keep], bad_quantity[keep]
+
+    materials = db.session.query(Material.id, Material.name, Material.sku).order_by(Material.id).all()
+    known_ids = {material.id for material in materials}
+    by_sku = {material.sku: material.id for material in materials if material.sku}
+    by_name = {}
+    for material in materials:
+        by_name.setdefault(material.name.strip().casefold(), material.id)
+
+    frame['material_id'] = (
+        material_ids.where(material_ids.isin(known_ids))
+        .fillna(frame['sku'].map(by_sku))
+        .fillna(frame['material'].str.casefold().map(by_name))
+    )
+
+    checks = [
+        (bad_id, 'Material ID is not a number'),
+        (material_ids.notna() & ~material_ids.isin(known_ids), 'Unknown material id'),
+        (frame['material_id'].isna() & (frame['sku'] != ''), "Unknown SKU '" + frame['sku'] + "'"),
+        (frame['material_id'].isna(), "Unknown material '" + frame['material'] + "'"),
+        (frame['material_id'].notna() & frame['material_id'].duplicated(), 'Material counted on an earlier line'),
+        (bad_quantity, 'Counted Quantity is not a number'),
+        (frame['counted_quantity'] < 0, 'Counted Quantity cannot be negative'),
+    ]
+    errors = pd.Series(None, index=frame.index, dtype=object)
+    for failed, message in reversed(checks):
+        errors = errors.mask(failed.fillna(False).astype(bool), message)
+    frame['error'] = errors
+    return frame
+
+
+def _consume_layers(layers, shortages):
+    """
+    Take each material's shortage from its FIFO layers oldest first. layers must be
+    ordered by material and age; returns the layers with a consumed column.
+    """
+    layers = layers.copy()
+    needed = layers['material_id'].map(shortages).fillna(0.0)
+    before = layers.groupby('material_id')['quantity_remaining'].cumsum() - layers['quantity_remaining']
+    layers['consumed'] = (needed - before).clip(lower=0.0).clip(upper=layers['quantity_remaining'])
+    return layers[layers['consumed'] > 0]
+
+
+class CycleCountService:
+    """Service class for applying whole physical count sheets"""
+
+    @staticmethod
+    def read(path, filename, skip_header=True):
+        """Read a count sheet into a frame; raises ValueError when it cannot be used"""
+        file_format = import_format(filename)
+        if not file_format:
+            raise ValueError('Invalid file format. Use .xlsx, .xls or .csv files.')
+        first_row, df = read_import_frame(path, file_format, COUNT_SHEET_COLUMNS, skip_header)
+        if 'Counted Quantity' not in df.columns or ('Material' not in df.columns and 'SKU' not in df.columns):
+            raise ValueError('The count sheet must contain "Counted Quantity" and "Material" or "SKU" columns')
+        return first_row, df
+
+    @staticmethod
+    def from_records(counts):
+        """
+        Build a count sheet frame from API records holding material_id, sku or
+        material and counted_quantity; lines are numbered from 1
+        """
+        if not isinstance(counts, list) or not all(isinstance(count, dict) for count in counts):
+            raise ValueError('counts must be a list of objects')
+        df = pd.DataFrame.from_records(counts).rename(columns={
+            'material_id': 'Material ID', 'sku': 'SKU', 'material': 'Material', 'counted_quantity': 'Counted Quantity'
+        })
+        if len(df) and 'Counted Quantity' not in df.columns:
+            raise ValueError('Every count needs a counted_quantity')
+        return 1, df
+
+    @staticmethod
+    def plan(site_id, df, first_row=2, for_update=False):
+        """
+        Resolve a count sheet and compute every discrepancy against one snapshot of
+        the site's stock, without writing. With for_update the snapshot rows stay
+        locked until the transaction ends, so apply() sees exactly what was planned.
+        """
+        frame = normalize_count_sheet(df, first_row)
+        lines = frame[frame['error'].isna()].copy()
+        lines['material_id'] = lines['material_id'].astype(int)
+        errors = frame.loc[frame['error'].notna(), [key for key, _ in ERROR_COLUMNS]]
+
+        material_ids = lines['material_id'].tolist()
+        stock_query = db.session.query(
+            StockLevel.id, StockLevel.material_id, StockLevel.quantity, StockLevel.total_value
+        ).filter(StockLevel.site_id == site_id, StockLevel.material_id.in_(material_ids))
+        layer_query = db.session.query(
+            FIFOBatch.id, FIFOBatch.material_id, FIFOBatch.quantity_remaining, FIFOBatch.unit_cost
+        ).filter(
+            FIFOBatch.site_id == site_id, FIFOBatch.material_id.in_(material_ids), FIFOBatch.quantity_remaining > 0
+        ).order_by(FIFOBatch.material_id, FIFOBatch.received_at, FIFOBatch.id)
+        if for_update:
+            stock_query, layer_query = stock_query.with_for_update(), layer_query.with_for_update()
+
+        stock = pd.DataFrame(stock_query.all(),
+                             columns=['stock_level_id', 'material_id', 'expected_quantity', 'current_value']).astype(
+            {'material_id': 'int64', 'expected_quantity': 'float64', 'current_value': 'float64'}
+        )
+        # Typed so counts of materials without stock or live layers at the site still merge and sum
+        layers = pd.DataFrame(layer_query.all(), columns=['id', 'material_id', 'quantity_remaining', 'unit_cost']).astype(
+            {'id': 'int64', 'material_id': 'int64', 'quantity_remaining': 'float64', 'unit_cost': 'float64'}
+        )
+        names = pd.DataFrame(
+            db.session.query(Material.id, Material.name, Material.sku, Material.unit, Material.category,
+                             Material.minimum_level).filter(Material.id.in_(material_ids)).all(),
+            columns=['material_id', 'material_name', 'material_sku', 'unit', 'category', 'minimum_level']
+        ).astype({'material_id': 'int64'})
+
+        lines = lines.merge(stock, on='material_id', how='left').merge(names, on='material_id', how='left')
+        lines['expected_quantity'] = lines['expected_quantity'].fillna(0.0)
+        lines['current_value'] = lines['current_value'].fillna(0.0)
+        lines['sku'] = lines['material_sku'].fillna(lines['sku'])
+        lines['discrepancy'] = lines['counted_quantity'] - lines['expected_quantity']
+        lines['average_cost'] = np.where(
+            lines['expected_quantity'] > 0,
+            lines['current_value'] / lines['expected_quantity'].where(lines['expected_quantity'] > 0, 1.0),
+            0.0
+        )
+
+        # Shortages are valued at the FIFO layers they use up, like an issue; any part
+        # the layers do not cover, and every overage, is valued at average cost
+        shortages = (-lines['discrepancy']).where(lines['discrepancy'] < 0).dropna()
+        shortages.index = lines.loc[shortages.index, 'material_id']
+        consumed = _consume_layers(layers, shortages)
+        fifo = (consumed.assign(value=consumed['consumed'] * consumed['unit_cost'])
+                .groupby('material_id').agg(fifo_quantity=('consumed', 'sum'), fifo_value=('value', 'sum')))
+        lines = lines.merge(fifo, left_on='material_id', right_index=True, how='left')
+        lines['fifo_quantity'] = lines['fifo_quantity'].fillna(0.0)
+        lines['fifo_value'] = lines['fifo_value'].fillna(0.0)
+
+        uncovered = (-lines['discrepancy'] - lines['fifo_quantity']).clip(lower=0.0)
+        lines['adjustment_value'] = np.where(
+            lines['discrepancy'] < 0,
+            -(lines['fifo_value'] + uncovered * lines['average_cost']),
+            lines['discrepancy'] * lines['average_cost']
+        )
+        lines['new_value'] = np.where(
+            lines['counted_quantity'] > 0, (lines['current_value'] + lines['adjustment_value']).clip(lower=0.0), 0.0
+        )
+        return CycleCountPlan(site_id, lines.reset_index(drop=True), consumed, errors)
+
+    @staticmethod
+    def apply(plan, adjusted_by, reason=None):
+        """
+        Write a plan as stock adjustments, adjustment transactions, FIFO layer changes
+        and stock levels in one database transaction; returns (counted, adjusted)
+        """
+        site_id, lines = plan.site_id, plan.lines
+        if lines.empty:
+            return 0, 0
+
+        reason = reason or DEFAULT_COUNT_REASON
+        adjusted = lines[lines['discrepancy'] != 0]
+        try:
+            now = datetime.utcnow()
+            db.session.execute(insert(StockAdjustment), pd.DataFrame({
+                'material_id': lines['material_id'].values,
+                'expected_quantity': lines['expected_quantity'].values,
+                'actual_quantity': lines['counted_quantity'].values,
+                'discrepancy': lines['discrepancy'].values,
+            }).assign(site_id=site_id, reason=reason, adjusted_by=adjusted_by, adjusted_at=now)
+                .astype(object).to_dict('records'))
+
+            if len(adjusted):
+                quantities = adjusted['discrepancy'].values
+                transaction_ids = db.session.scalars(
+                    insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+                    pd.DataFrame({
+                        'serial_number': Transaction.generate_serial_numbers(len(adjusted)),
+                        'material_id': adjusted['material_id'].values,
+                        'quantity': quantities,
+                        'unit_cost': np.abs(adjusted['adjustment_value'].values) / np.abs(quantities),
+                        'total_value': adjusted['adjustment_value'].values,
+                    }).assign(site_id=site_id, type='adjustment', created_by=adjusted_by,
+                              notes=f"Stock adjustment: {reason}", created_at=now)
+                    .astype(object).to_dict('records')
+                ).all()
+
+                if len(plan.layers):
+                    db.session.execute(update(FIFOBatch), [
+                        {'id': int(layer_id), 'quantity_remaining': max(remaining - consumed, 0.0)}
+                        for layer_id, remaining, consumed
+                        in zip(plan.layers['id'], plan.layers['quantity_remaining'], plan.layers['consumed'])
+                    ])
+                overage = adjusted['discrepancy'].values > 0
+                if overage.any():
+                    db.session.execute(insert(FIFOBatch), pd.DataFrame({
+                        'material_id': adjusted['material_id'].values[overage],
+                        'quantity_remaining': quantities[overage],
+                        'unit_cost': adjusted['average_cost'].values[overage],
+                        'transaction_id': np.asarray(transaction_ids)[overage],
+                    }).assign(site_id=site_id, received_at=now).astype(object).to_dict('records'))
+
+                existing = adjusted[adjusted['stock_level_id'].notna()]
+                if len(existing):
+                    db.session.execute(update(StockLevel), [
+                        {'id': int(stock_level_id), 'quantity': quantity, 'total_value': total_value, 'updated_at': now}
+                        for stock_level_id, quantity, total_value
+                        in zip(existing['stock_level_id'], existing['counted_quantity'], existing['new_value'])
+                    ])
+                created = adjusted[adjusted['stock_level_id'].isna()]
+                if len(created):
+                    db.session.execute(insert(StockLevel), [
+                        {'site_id': site_id, 'material_id': int(material_id), 'quantity': quantity,
+                         'total_value': total_value, 'updated_at': now}
+                        for material_id, quantity, total_value
+                        in zip(created['material_id'], created['counted_quantity'], created['new_value'])
+                    ])
+
+                StockStatusService.refresh_many(
+                    (site_id, int(material_id), quantity, minimum_level or 0)
+                    for material_id, quantity, minimum_level
+                    in zip(adjusted['material_id'], adjusted['counted_quantity'], adjusted['minimum_level'])
+                )
+                rollup = adjusted.assign(
+                    category=adjusted['category'].fillna('General'),
+                    value_delta=adjusted['new_value'] - adjusted['current_value']
+                ).groupby('category').agg(quantity=('discrepancy', 'sum'), total_value=('value_delta', 'sum'))
+                for category, row in rollup.iterrows():
+                    ValuationService.apply_delta(site_id, category, row['quantity'], row['total_value'])
+
+                ActivityCounterService.record(site_id, 'adjustment', float(adjusted['discrepancy'].sum()),
+                                              float(adjusted['adjustment_value'].sum()), count=len(adjusted))
+                InventoryService.bump_site_version(site_id)
+
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error applying cycle count: {str(e)}")
+            raise
+
+        logging.info(f"Cycle count applied: Site {site_id}, {len(lines)} items counted, {len(adjusted)} adjusted")
+        return len(lines), len(adjusted)
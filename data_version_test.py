@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Data Version Regression Test
+Catalog and site edits must move the data versions that cached page fragments
+and report artifacts are keyed on, including on a database whose
+site_data_versions table has no rows yet (an existing deployment, or a site
+that has never been written to).
+
+Run with: python data_version_test.py
+"""
+
+import uuid
+
+from app import app, db
+from models_new import Material, Site, SiteDataVersion, User
+from inventory_service import InventoryService
+from fragment_cache import ALL_SITES_SCOPE, CATALOG_SCOPE, get_site_version, get_catalog_version
+from report_jobs import ReportJobService
+import routes_new  # noqa: F401  (registers the routes)
+
+
+def _setup():
+    """A stocked material at the first site, then an empty version table"""
+    with app.app_context():
+        engineer = User.query.filter_by(username='engineer1').first()
+        site = Site.query.order_by(Site.id).first()
+        suffix = uuid.uuid4().hex[:8]
+        material = Material(name=f'Version Test {suffix}', sku=f'DVT-{suffix}', unit='pcs',
+                            cost_per_unit=1.0, minimum_level=0, category='Test')
+        db.session.add(material)
+        db.session.commit()
+        InventoryService.receive_material(site.id, material.id, 5, 1.0, created_by=engineer.id)
+
+        SiteDataVersion.query.delete()
+        db.session.commit()
+        app.jinja_env.fragment_cache.clear()
+        return engineer.id, site.id, material.id, material.name, suffix
+
+
+def _client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def test_material_edit_invalidates_cached_stock_page():
+    user_id, site_id, material_id, name, suffix = _setup()
+    client = _client(user_id)
+
+    print("1. Stock page rendered and cached with no version rows...")
+    response = client.get(f'/view_stock?site_id={site_id}')
+    assert response.status_code == 200, response.status_code
+    assert name.encode() in response.data
+    print("✓ Material listed")
+
+    print("2. Renaming the material shows the new name...")
+    new_name = f'Edited Material {suffix}'
+    response = client.post('/edit_material', data={
+        'material_id': material_id, 'name': new_name, 'sku': f'DVT-{suffix}', 'unit': 'pcs',
+        'category': 'Test', 'minimum_level': '0', 'is_active': '1'
+    })
+    assert response.status_code == 302, response.status_code
+    response = client.get(f'/view_stock?site_id={site_id}')
+    assert new_name.encode() in response.data
+    assert name.encode() not in response.data
+    print("✓ Renamed material listed")
+
+    with app.app_context():
+        scopes = {row.site_id for row in SiteDataVersion.query.all()}
+        assert {ALL_SITES_SCOPE, CATALOG_SCOPE, site_id} <= scopes, scopes
+    print("✓ Version rows created for every scope")
+
+
+def test_catalog_edit_changes_report_keys():
+    _, site_id, _, _, _ = _setup()
+
+    print("3. Stock summary and consolidated report keys move on a catalog edit...")
+    with app.app_context():
+        before = [ReportJobService.describe('stock_summary', {'site_id': site_id}, 'pdf')[0],
+                  ReportJobService.describe('consolidated_stock', {}, 'pdf')[0]]
+        versions = (get_site_version(site_id), get_site_version(), get_catalog_version())
+
+        InventoryService.bump_catalog_version()
+        db.session.commit()
+
+        after = [ReportJobService.describe('stock_summary', {'site_id': site_id}, 'pdf')[0],
+                 ReportJobService.describe('consolidated_stock', {}, 'pdf')[0]]
+        assert before[0] != after[0] and before[1] != after[1]
+        assert all(new == old + 1 for new, old in zip(
+            (get_site_version(site_id), get_site_version(), get_catalog_version()), versions
+        ))
+    print("✓ Both keys changed; site, all-sites and catalog versions bumped")
+
+    print("4. A site write on an empty table creates and then bumps its rows...")
+    with app.app_context():
+        SiteDataVersion.query.delete()
+        InventoryService.bump_site_version(site_id)
+        InventoryService.bump_site_version(site_id)
+        db.session.commit()
+        assert get_site_version(site_id) == 2 and get_site_version() == 2
+    print("✓ Site and all-sites versions at 2")
+
+
+if __name__ == '__main__':
+    test_material_edit_invalidates_cached_stock_page()
+    test_catalog_edit_changes_report_keys()
+    print("All data version checks passed")
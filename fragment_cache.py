@@ -0,0 +1,115 @@
+"""
+Rendered Fragment Cache
+Caches rendered Jinja template fragments keyed by site data version and role
+"""
+
+import threading
+from collections import OrderedDict
+
+from flask import g
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from app import db
+from models_new import SiteDataVersion
+
+# Site id used for the "all sites" scope; every site bump also bumps this row
+ALL_SITES_SCOPE = 0
+# Scope row versioning the material catalog itself (materials added, changed or deleted)
+CATALOG_SCOPE = -1
+
+
+class FragmentCache:
+    """Thread-safe LRU cache of rendered fragments bounded by total size in bytes"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old.encode('utf-8'))
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted.encode('utf-8'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def get_site_version(site_id=None):
+    """Get the current data version for a site (or all sites when site_id is None)"""
+    scope = site_id or ALL_SITES_SCOPE
+    row = db.session.get(SiteDataVersion, scope)
+    return row.version if row else 0
+
+
+def get_catalog_version():
+    """Get the current version of the material catalog"""
+    row = db.session.get(SiteDataVersion, CATALOG_SCOPE)
+    return row.version if row else 0
+
+
+def bypass_fragment_cache():
+    """Keep fragments rendered for the rest of this request out of the cache, e.g. after a failed query"""
+    g.bypass_fragment_cache = True
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Adds a {% cache name, site_id, role %}...{% endcache %} tag.
+    The fragment is keyed by (name, site, data version, role), so any write
+    that bumps the site's data version makes older fragments unreachable.
+    Routes pass the data a fragment needs as loaders called inside the block,
+    so their queries only run on a cache miss.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        while len(args) < 3:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_support', args[:3]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, name, site_id, role, caller):
+        cache = self.environment.fragment_cache
+        key = (name, site_id or ALL_SITES_SCOPE, get_site_version(site_id), role)
+        value = cache.get(key)
+        if value is None:
+            value = caller()
+            if not g.get('bypass_fragment_cache'):
+                cache.set(key, value)
+        return value
+
+
+def init_fragment_cache(app):
+    """Register the fragment cache and its template tag on the Flask app"""
+    app.jinja_env.fragment_cache = FragmentCache(app.config.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,152 @@
+"""
+Supplier Invoice GRN Import
+Receives a supplier invoice (CSV or XLSX, one line per delivered item) into a
+site as goods received. Lines are matched to materials through SKU and
+normalized-name hash maps built from one catalog query, quantities in another
+unit of the same kind are converted to the material's unit, and every line is
+posted as a receive transaction with bulk statements in one database
+transaction, all linked to the same supporting document.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+
+from app import db
+from models_new import Material
+from import_reader import import_format, read_import_frame, text_column, number_column
+from catalog_import import normalize_names
+from opening_balance import OpeningBalanceService, post_receipts
+from units import UNITS, canonical_units
+
+INVOICE_COLUMNS = ['SKU', 'Description', 'Quantity', 'Unit', 'Unit Cost', 'Line Total']
+
+ERROR_COLUMNS = [('row', 'Row'), ('sku', 'SKU'), ('description', 'Description'), ('error', 'Error')]
+
+# lines: valid lines in the material's unit, ready for post_receipts; diff: one row
+# per material received; errors: rejected lines with the reason
+GrnPlan = namedtuple('GrnPlan', 'site_id lines diff errors')
+
+
+def _unit_ratios(line_units, material_units):
+    """Material units per invoice unit, or NaN where the invoice unit cannot be converted"""
+    factors = {code: unit.factor for code, unit in UNITS.items()}
+    dimensions = {code: unit.dimension for code, unit in UNITS.items()}
+    convertible = (line_units.map(dimensions) == material_units.map(dimensions)) & line_units.map(factors).notna()
+    ratios = (line_units.map(factors) / material_units.map(factors)).where(convertible)
+    return ratios.mask(line_units == material_units, 1.0).astype(float)
+
+
+def normalize_invoice_lines(df, first_row=2):
+    """
+    Normalize invoice lines, match them to materials (by SKU, then by name ignoring
+    case and spacing) and convert them to the material's unit. Returns a frame with
+    row, sku, description, material_id, quantity, unit_cost, total_value and error
+    columns; blank lines are dropped.
+    """
+    description = text_column(df, 'Description')
+    frame = pd.DataFrame({
+        'row': np.arange(first_row, first_row + len(df)),
+        'sku': text_column(df, 'SKU'),
+        'description': description.where(description != '', text_column(df, 'Material')),
+        'unit': text_column(df, 'Unit'),
+    }, index=df.index)
+    frame['invoice_quantity'], bad_quantity = number_column(df, 'Quantity', np.nan)
+    frame['invoice_cost'], bad_cost = number_column(df, 'Unit Cost', np.nan)
+    line_total, bad_total = number_column(df, 'Line Total', np.nan)
+    # Invoices that only print line totals are costed from them
+    frame['invoice_cost'] = frame['invoice_cost'].fillna(line_total / frame['invoice_quantity'])
+
+    keep = (frame['sku'] != '') | (frame['description'] != '')
+    frame, bad_quantity, bad_cost, bad_total = frame[keep].copy(), bad_quantity[keep], bad_cost[keep], bad_total[keep]
+
+    catalog = pd.DataFrame(db.session.query(Material.id, Material.name, Material.sku, Material.unit)
+                           .order_by(Material.id).all(), columns=['id', 'name', 'sku', 'unit'])
+    with_sku = catalog.dropna(subset=['sku'])
+    by_sku = pd.Series(with_sku['id'].values, index=with_sku['sku'].str.strip().str.casefold())
+    by_name = pd.Series(catalog['id'].values, index=normalize_names(catalog['name']))
+    by_sku = by_sku[~by_sku.index.duplicated()]
+    by_name = by_name[~by_name.index.duplicated()]
+    frame['material_id'] = (frame['sku'].str.casefold().map(by_sku)
+                            .fillna(normalize_names(frame['description']).map(by_name)))
+
+    material_units = frame['material_id'].map(catalog.set_index('id')['unit'])
+    line_units = canonical_units(frame['unit'])
+    known_unit = line_units.notna() | (frame['unit'] == '')
+    line_units = line_units.fillna(material_units)
+    ratios = _unit_ratios(line_units, canonical_units(material_units).fillna(material_units))
+    frame['quantity'] = frame['invoice_quantity'] * ratios
+    frame['unit_cost'] = frame['invoice_cost'] / ratios
+    frame['total_value'] = frame['invoice_quantity'] * frame['invoice_cost']
+
+    checks = [
+        (frame['material_id'].isna() & (frame['sku'] != ''), "Unknown SKU '" + frame['sku'] + "'"),
+        (frame['material_id'].isna(), "No material named '" + frame['description'] + "'"),
+        (bad_quantity, 'Quantity is not a number'),
+        (frame['invoice_quantity'].isna(), 'Quantity is required'),
+        (frame['invoice_quantity'] <= 0, 'Quantity must be greater than zero'),
+        (~known_unit, "Unknown unit '" + frame['unit'] + "'"),
+        (ratios.isna(), "Cannot convert '" + frame['unit'] + "' to the material's unit '" + material_units.fillna('') + "'"),
+        (bad_cost | bad_total, 'Unit Cost or Line Total is not a number'),
+        (frame['invoice_cost'].isna(), 'Unit Cost or Line Total is required'),
+        (frame['invoice_cost'] < 0, 'Unit Cost cannot be negative'),
+    ]
+    errors = pd.Series(None, index=frame.index, dtype=object)
+    for failed, message in reversed(checks):
+        errors = errors.mask(failed.fillna(False).astype(bool), message)
+    frame['error'] = errors
+    return frame
+
+
+class GrnImportService:
+    """Service class for receiving supplier invoices in bulk"""
+
+    @staticmethod
+    def plan(site_id, path, filename, skip_header=True):
+        """Read and match an invoice file for a site, without writing"""
+        file_format = import_format(filename)
+        if not file_format:
+            raise ValueError('Invalid file format. Use .xlsx, .xls or .csv files.')
+
+        first_row, df = read_import_frame(path, file_format, INVOICE_COLUMNS, skip_header)
+        if 'Quantity' not in df.columns or not {'SKU', 'Description', 'Material'} & set(df.columns):
+            raise ValueError('The invoice must contain a "Quantity" column and "SKU" or "Description" columns')
+
+        frame = normalize_invoice_lines(df, first_row)
+        lines = frame[frame['error'].isna()].copy()
+        lines['material_id'] = lines['material_id'].astype(int)
+        lines['site_id'] = site_id
+        lines['received_at'] = pd.Timestamp(datetime.utcnow())
+        errors = frame.loc[frame['error'].notna(), [key for key, _ in ERROR_COLUMNS]]
+        return GrnPlan(site_id, lines, OpeningBalanceService.diff(lines), errors)
+
+    @staticmethod
+    def apply(plan, created_by, supplier=None, invoice_number=None, supporting_document_url=None,
+              project_code=None, notes=None):
+        """
+        Post a plan's lines as receive transactions, FIFO layers and stock levels in
+        one database transaction; returns the number of transactions recorded
+        """
+        lines = plan.lines
+        if lines.empty:
+            return 0
+
+        try:
+            # Stock is read again under lock so receipts posted since planning are not overwritten
+            diff = OpeningBalanceService.diff(lines, for_update=True)
+            note = f"GRN from {supplier or 'supplier'} - Invoice: {invoice_number or 'n/a'}"
+            count, _ = post_receipts(lines, diff, created_by, f"{note}. {notes}" if notes else note,
+                                     supporting_document_url, project_code or None)
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error importing GRN: {str(e)}")
+            raise
+
+        logging.info(f"GRN imported: Site {plan.site_id}, invoice {invoice_number}, {count} lines "
+                     f"into {len(diff)} materials")
+        return count
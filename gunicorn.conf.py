@@ -21,4 +21,27 @@ errorlog = "-"
 
 # Security
 forwarded_allow_ips = "*"
-secure_scheme_headers = {'X-FORWARDED-PROTO': 'https'}
\ No newline at end of file
+secure_scheme_headers = {'X-FORWARDED-PROTO': 'https'}
+
+# Background report worker, started next to the web workers so it shares the
+# local report cache directory. Set REPORT_WORKER_EMBEDDED=0 to run it separately.
+_report_worker = None
+
+
+def when_ready(server):
+    global _report_worker
+    if os.environ.get('REPORT_WORKER_EMBEDDED', '1') == '0':
+        return
+    import subprocess
+    import sys
+    _report_worker = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'report_worker.py')])
+    server.log.info(f"Started report worker (pid {_report_worker.pid})")
+
+
+def on_exit(server):
+    if _report_worker and _report_worker.poll() is None:
+        _report_worker.terminate()
+        try:
+            _report_worker.wait(timeout=30)
+        except Exception:
+            _report_worker.kill()
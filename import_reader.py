@@ -0,0 +1,167 @@
+"""
+Streaming Import Reader
+Reads uploaded spreadsheets as fixed-size DataFrame chunks so imports hold one
+chunk in memory instead of the whole workbook. XLSX files are read row by row
+with openpyxl in read-only mode and CSV files with pandas' chunked reader.
+"""
+
+from itertools import islice
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+# Data rows per chunk; each chunk is imported and committed on its own
+IMPORT_CHUNK_SIZE = 1000
+
+IMPORT_FORMATS = ('xlsx', 'xls', 'csv')
+
+
+def import_format(filename):
+    """Get the import format from a file name, or None when it is not supported"""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def text_column(frame, column, default=''):
+    """A stripped text column with blank cells (or a missing column) as default"""
+    if column not in frame.columns:
+        return pd.Series([default] * len(frame), index=frame.index, dtype=object)
+    values = frame[column].astype('string').str.strip().astype(object)
+    return values.where(values.notna() & (values != ''), default)
+
+
+def number_column(frame, column, default=0.0):
+    """A float column with blank cells as default, and a mask of cells that are not numbers"""
+    if column not in frame.columns:
+        return pd.Series(default, index=frame.index, dtype=float), pd.Series(False, index=frame.index)
+    values = pd.to_numeric(frame[column], errors='coerce')
+    invalid = values.isna() & frame[column].notna() & (frame[column].astype('string').str.strip() != '')
+    return values.fillna(default).astype(float), invalid.fillna(False)
+
+
+def _column_names(header, width, columns):
+    """Column names from a header row, or the expected columns in order when there is none"""
+    if header is None:
+        return list(columns[:width]) + [f'Column {index + 1}' for index in range(len(columns), width)]
+    return [str(value).strip() if value is not None else f'Column {index + 1}' for index, value in enumerate(header)]
+
+
+def _xlsx_rows(path):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_header(path, file_format, skip_header, columns):
+    """Get the column names an import would use, reading only the first row"""
+    if file_format == 'csv':
+        first = pd.read_csv(path, header=None, nrows=1, dtype=str)
+        values = list(first.iloc[0]) if len(first) else []
+        values = [None if pd.isna(value) else value for value in values]
+    elif file_format == 'xlsx':
+        rows = _xlsx_rows(path)
+        values = list(next(rows, ()))
+        rows.close()
+    else:
+        first = pd.read_excel(path, header=None, nrows=1)
+        values = [None if pd.isna(value) else value for value in first.iloc[0]] if len(first) else []
+    return _column_names(values if skip_header else None, len(values), columns)
+
+
+def count_rows(path, file_format, skip_header):
+    """Estimate the number of data rows without parsing the file, or None when unknown"""
+    header_rows = 1 if skip_header else 0
+    if file_format == 'xlsx':
+        workbook = load_workbook(path, read_only=True)
+        try:
+            # From the sheet's stored dimension; trailing blank rows may be included
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max(max_row - header_rows, 0) if max_row else None
+    if file_format == 'csv':
+        # Counts physical lines, so quoted values with line breaks overestimate
+        lines, last = 0, b''
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                lines += block.count(b'\n')
+                last = block[-1:]
+        if last and last != b'\n':
+            lines += 1
+        return max(lines - header_rows, 0)
+    return None
+
+
+def iter_import_chunks(path, file_format, columns, skip_header=True, chunk_size=IMPORT_CHUNK_SIZE, start_row=0):
+    """
+    Yield (first_row, frame) chunks of at most chunk_size data rows, where first_row
+    is the spreadsheet row number of the chunk's first row. start_row data rows are
+    skipped, so an interrupted import can continue after its last committed chunk.
+    """
+    header_rows = 1 if skip_header else 0
+
+    if file_format == 'csv':
+        skip = range(header_rows, header_rows + start_row) if start_row else None
+        reader = pd.read_csv(path, header=None, dtype=str, skiprows=skip, chunksize=chunk_size)
+        names = None
+        first_row = header_rows + start_row + 1
+        for chunk in reader:
+            if names is None:
+                if skip_header:
+                    header, chunk = chunk.iloc[0].tolist(), chunk.iloc[1:]
+                    names = _column_names([None if pd.isna(value) else value for value in header], len(header), columns)
+                else:
+                    names = _column_names(None, chunk.shape[1], columns)
+            if len(chunk):
+                chunk.columns = names[:chunk.shape[1]]
+                yield first_row, chunk.reset_index(drop=True)
+                first_row += len(chunk)
+        return
+
+    if file_format == 'xlsx':
+        source = _xlsx_rows(path)
+    else:
+        # The legacy .xls format has no streaming reader; it is loaded once and sliced
+        source = pd.read_excel(path, header=None).astype(object).itertuples(index=False, name=None)
+
+    rows = source
+    try:
+        header = next(rows, None) if skip_header else None
+        if skip_header and header is None:
+            return
+        rows = islice(rows, start_row, None)
+        first_row = header_rows + start_row + 1
+        while True:
+            batch = list(islice(rows, chunk_size))
+            if not batch:
+                break
+            width = max(len(row) for row in batch)
+            if header is not None:
+                width = max(width, len(header))
+                names = _column_names(list(header) + [None] * (width - len(header)), width, columns)
+            else:
+                names = _column_names(None, width, columns)
+            frame = pd.DataFrame.from_records([tuple(row) + (None,) * (width - len(row)) for row in batch],
+                                              columns=names)
+            yield first_row, frame
+            first_row += len(batch)
+    finally:
+        # Closes the read-only workbook when the import stops early
+        close = getattr(source, 'close', None)
+        if close:
+            close()
+
+
+def read_import_frame(path, file_format, columns, skip_header=True):
+    """
+    Read a whole import file into one frame, for imports that must see every row
+    before writing (e.g. to show a dry-run diff). Returns (first_row, frame).
+    """
+    chunks = list(iter_import_chunks(path, file_format, columns, skip_header))
+    first_row = (1 if skip_header else 0) + 1
+    if not chunks:
+        return first_row, pd.DataFrame(columns=list(columns))
+    return first_row, pd.concat([frame for _, frame in chunks], ignore_index=True)
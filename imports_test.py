@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Bulk Import Test
+Opening balances, catalog imports, supplier invoices (GRN) and queued material
+uploads: each is planned without writing, rejects bad lines row by row, and
+writes stock, FIFO layers and rollups (or materials) in step when applied.
+Queued material uploads are claimed once, and those left running by a dead
+worker are requeued or resumed.
+
+Run with: python imports_test.py
+"""
+
+from datetime import datetime, timedelta
+import os
+import tempfile
+import uuid
+
+from app import app, db
+from models_new import FIFOBatch, Material, MaterialImportJob, Site, StockLevel, Transaction, User
+from opening_balance import OpeningBalanceService
+from catalog_import import CatalogImportService, ACTION_ADDED, ACTION_CHANGED, ACTION_UNCHANGED, ACTION_REJECTED
+from grn_import import GrnImportService
+from material_import import (
+    MaterialImportService, STALE_JOB_MINUTES, JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED
+)
+from valuation_service import ValuationService
+from fragment_cache import get_catalog_version
+
+
+def _csv(text):
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    return path
+
+
+def _fixture():
+    """A fresh site and a material with a SKU, in their own category"""
+    suffix = uuid.uuid4().hex[:8]
+    site = Site(name=f'Import Site {suffix}', code=f'I{suffix[:6]}')
+    material = Material(name=f'Import Material {suffix}', sku=f'IMP-{suffix}', unit='pcs',
+                        cost_per_unit=1.0, minimum_level=0, category=f'Import {suffix}')
+    db.session.add_all([site, material])
+    db.session.commit()
+    user_id = User.query.filter_by(username='engineer1').first().id
+    return suffix, site, material, user_id
+
+
+def _stock(site_id, material_id):
+    level = StockLevel.query.filter_by(site_id=site_id, material_id=material_id).one()
+    return level.quantity, level.total_value
+
+
+def test_opening_balances():
+    with app.app_context():
+        suffix, site, material, user_id = _fixture()
+
+        print("1. Planning opening balances with one unknown material...")
+        path = _csv("Site,Material,SKU,Quantity,Unit Cost,Received Date\n"
+                    f"{site.name},,{material.sku},10,2.5,2025-01-15\n"
+                    f"{site.code},{material.name},,4,3,2025-02-01\n"
+                    f"{site.name},No Such Material {suffix},,1,1,2025-01-01\n")
+        plan = OpeningBalanceService.plan(path, 'opening.csv')
+        assert len(plan.lines) == 2 and len(plan.errors) == 1
+        assert list(plan.diff['change']) == ['new stock level']
+        assert StockLevel.query.filter_by(site_id=site.id).count() == 0
+        print("✓ Two lines for one new stock level, one rejected, nothing written")
+
+        print("2. Applying them...")
+        assert OpeningBalanceService.apply(plan, user_id) == 2
+        assert _stock(site.id, material.id) == (14, 37)
+        assert FIFOBatch.query.filter_by(site_id=site.id, material_id=material.id).count() == 2
+        assert ValuationService.get_total_value(site.id) == 37
+        print("✓ 14 in stock worth 37.00, two FIFO layers, valuation rollup in step")
+        os.remove(path)
+
+
+def test_catalog_import():
+    with app.app_context():
+        suffix, _, material, _ = _fixture()
+        header = "Material Name,Unit,Description,Cost per Unit,Minimum Level,Category,SKU\n"
+        new_name = f'Catalog Material {suffix}'
+
+        print("3. Diffing a catalog with a new, an unchanged and a broken row...")
+        path = _csv(header + f"{new_name},pcs,,4,0,Test,CAT-{suffix}\n"
+                    f"{material.name},pcs,,1,0,{material.category},{material.sku}\n"
+                    f"Broken Material {suffix},pcs,,lots,0,Test,\n")
+        first_row, df = CatalogImportService.read(path, 'catalog.csv')
+        diff = CatalogImportService.diff(df, first_row)
+        assert list(diff['action']) == [ACTION_ADDED, ACTION_UNCHANGED, ACTION_REJECTED]
+        print("✓ added, unchanged, rejected")
+
+        print("4. Applying it, then importing the same file again...")
+        catalog_version = get_catalog_version()
+        assert CatalogImportService.apply(diff) == (1, 0)
+        assert get_catalog_version() > catalog_version
+        first_row, df = CatalogImportService.read(path, 'catalog.csv')
+        assert ACTION_ADDED not in set(CatalogImportService.diff(df, first_row)['action'])
+        print("✓ One material added, catalog version bumped, nothing added the second time")
+
+        print("5. Changing a cost by SKU...")
+        changed = _csv(header + f"{new_name},pcs,,5,0,Test,CAT-{suffix}\n")
+        first_row, df = CatalogImportService.read(changed, 'catalog.csv')
+        diff = CatalogImportService.diff(df, first_row)
+        assert list(diff['action']) == [ACTION_CHANGED]
+        assert CatalogImportService.apply(diff) == (0, 1)
+        assert Material.query.filter_by(sku=f'CAT-{suffix}').one().cost_per_unit == 5
+        print("✓ Changed in place")
+        os.remove(path)
+        os.remove(changed)
+
+
+def test_grn_import():
+    with app.app_context():
+        _, site, material, user_id = _fixture()
+
+        print("6. Planning an invoice with a unit that does not convert...")
+        header = "SKU,Description,Quantity,Unit,Unit Cost,Line Total\n"
+        bad = _csv(header + f"{material.sku},x,3,pcs,2,6\n{material.sku},x,1,m3,2,2\n")
+        plan = GrnImportService.plan(site.id, bad, 'invoice.csv')
+        assert len(plan.lines) == 1 and len(plan.errors) == 1
+        print("✓ One line matched, one rejected")
+
+        print("7. Receiving a clean invoice...")
+        path = _csv(header + f"{material.sku},x,3,pcs,2,6\n{material.sku},x,2,pcs,2.5,5\n")
+        plan = GrnImportService.plan(site.id, path, 'invoice.csv')
+        assert GrnImportService.apply(plan, user_id, 'Acme', 'INV-1') == 2
+        assert _stock(site.id, material.id) == (5, 11)
+        notes = {t.notes for t in Transaction.query.filter_by(site_id=site.id)}
+        assert notes == {'GRN from Acme - Invoice: INV-1'}, notes
+        print("✓ 5 received worth 11.00 with the invoice noted")
+        os.remove(bad)
+        os.remove(path)
+
+
+def test_material_import_queue():
+    with app.app_context():
+        suffix = uuid.uuid4().hex[:8]
+        path = _csv(f"Material Name,Unit\nQueued Material {suffix},pcs\n")
+
+        print("8. Claiming a queued upload...")
+        job = MaterialImportService.submit(path, 'materials.csv')
+        while True:
+            claimed = MaterialImportService.claim_next()
+            if claimed is None or claimed.id == job.id:
+                break
+            MaterialImportService.run_job(claimed)
+        assert claimed is not None and claimed.status == JOB_RUNNING and claimed.heartbeat_at is not None
+        assert db.session.get(MaterialImportJob, job.id).status == JOB_RUNNING
+        print("✓ Running with a heartbeat")
+
+        print("9. Requeueing it once its worker stops sending heartbeats...")
+        claimed.heartbeat_at = datetime.utcnow() - timedelta(minutes=STALE_JOB_MINUTES + 1)
+        db.session.commit()
+        assert MaterialImportService.is_stalled(claimed)
+        assert MaterialImportService.requeue_stale() >= 1
+        assert db.session.get(MaterialImportJob, job.id).status == JOB_QUEUED
+        print("✓ Queued again")
+
+        print("10. Resuming a stalled import directly...")
+        job.status, job.heartbeat_at = JOB_RUNNING, datetime.utcnow() - timedelta(minutes=STALE_JOB_MINUTES + 1)
+        db.session.commit()
+        MaterialImportService.resume(job, queue=False)
+        MaterialImportService.run_job(job)
+        assert job.status == JOB_COMPLETED and job.added == 1
+        try:
+            MaterialImportService.resume(job)
+            raise AssertionError('A completed import was resumed')
+        except ValueError:
+            pass
+        print("✓ Completed; a finished import cannot be resumed")
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    test_opening_balances()
+    test_catalog_import()
+    test_grn_import()
+    test_material_import_queue()
+    print("All import checks passed")
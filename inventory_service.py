@@ -3,14 +3,22 @@ Inventory Management Service
 Handles FIFO valuation, stock operations, and transaction processing
 """
 
+from collections import defaultdict
 from datetime import datetime
 from app import db
 from models_new import (
     Site, Material, StockLevel, Transaction, FIFOBatch, 
     IssueRequest, BatchIssueRequest, BatchIssueItem, StockAdjustment,
-    StockTransferRequest, StockTransferItem
+    StockTransferRequest, StockTransferItem, SiteDataVersion
 )
-from sqlalchemy import func
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from stock_status import StockStatusService
+from valuation_service import ValuationService
+from activity_counters import ActivityCounterService
+from fragment_cache import ALL_SITES_SCOPE, CATALOG_SCOPE
 import logging
 
 
@@ -43,6 +51,9 @@ class InventoryService:
                 notes=notes
             )
             db.session.add(transaction)
+            ActivityCounterService.record(
+                site_id, transaction.type, transaction.quantity, transaction.total_value
+            )
             db.session.flush()  # Get the transaction ID
             
             # Create FIFO batch
@@ -125,6 +136,9 @@ class InventoryService:
                 notes=notes
             )
             db.session.add(transaction)
+            ActivityCounterService.record(
+                site_id, transaction.type, transaction.quantity, transaction.total_value
+            )
             
             # Update stock levels
             InventoryService._update_stock_level(site_id, material_id, -quantity, -total_cost)
@@ -192,6 +206,9 @@ class InventoryService:
                     notes=f"Stock adjustment: {reason}" if reason else "Stock adjustment"
                 )
                 db.session.add(transaction)
+                ActivityCounterService.record(
+                    site_id, transaction.type, transaction.quantity, transaction.total_value
+                )
                 
                 # Update stock levels
                 InventoryService._update_stock_level(site_id, material_id, discrepancy, adjustment_value)
@@ -234,6 +251,9 @@ class InventoryService:
             )
             db.session.add(stock_level)
         
+        previous_quantity = stock_level.quantity
+        previous_value = stock_level.total_value
+        
         stock_level.quantity += quantity_change
         stock_level.total_value += value_change
         stock_level.updated_at = datetime.utcnow()
@@ -243,7 +263,82 @@ class InventoryService:
             stock_level.quantity = 0
         if stock_level.total_value < 0:
             stock_level.total_value = 0
+        
+        material = db.session.get(Material, material_id)
+        StockStatusService.refresh(site_id, material_id, stock_level.quantity, material.minimum_level if material else 0)
+        ValuationService.apply_delta(
+            site_id,
+            material.category if material else None,
+            stock_level.quantity - previous_quantity,
+            stock_level.total_value - previous_value
+        )
+        
+        InventoryService.bump_site_version(site_id)
     
+    @staticmethod
+    def bump_site_version(site_id=None):
+        """
+        Bump the data version of a site (or every site when site_id is None)
+        in the current transaction so cached fragments for it are invalidated
+        """
+        if site_id is None:
+            scopes = [scope for scope, in db.session.query(Site.id)]
+        else:
+            scopes = [site_id]
+        InventoryService._bump_versions(scopes + [ALL_SITES_SCOPE])
+
+    @staticmethod
+    def bump_catalog_version():
+        """
+        Bump the material catalog version, and with it every site's data version,
+        in the current transaction after materials are added, changed or deleted
+        (or a site is edited) so artifacts built from the catalog are rebuilt
+        """
+        scopes = [scope for scope, in db.session.query(Site.id)]
+        InventoryService._bump_versions(scopes + [ALL_SITES_SCOPE, CATALOG_SCOPE])
+
+    @staticmethod
+    def _bump_versions(scopes):
+        """
+        Increment the version row of each scope, creating the rows that do not exist yet
+        (a fresh table, or a site without writes), as one upsert so concurrent writers
+        cannot both try to insert the same row
+        """
+        now = datetime.utcnow()
+        rows = [{'site_id': scope, 'version': 1, 'updated_at': now} for scope in sorted(set(scopes))]
+        if db.engine.dialect.name == 'postgresql':
+            statement = postgresql_insert(SiteDataVersion).values(rows)
+        elif db.engine.dialect.name == 'sqlite':
+            statement = sqlite_insert(SiteDataVersion).values(rows)
+        else:
+            InventoryService._bump_versions_without_upsert(rows)
+            return
+
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[SiteDataVersion.site_id],
+            set_={'version': SiteDataVersion.version + 1, 'updated_at': now}
+        ))
+
+    @staticmethod
+    def _bump_versions_without_upsert(rows):
+        for row in rows:
+            for attempt in range(2):
+                result = db.session.execute(
+                    update(SiteDataVersion)
+                    .where(SiteDataVersion.site_id == row['site_id'])
+                    .values(version=SiteDataVersion.version + 1, updated_at=row['updated_at'])
+                )
+                if result.rowcount:
+                    break
+                try:
+                    # Savepoint, so losing the insert race to another writer only retries the update
+                    with db.session.begin_nested():
+                        db.session.execute(insert(SiteDataVersion), [row])
+                    break
+                except IntegrityError:
+                    if attempt == 1:
+                        raise
+
     @staticmethod
     def get_stock_summary(site_id=None):
         """
@@ -255,6 +350,7 @@ class InventoryService:
             StockLevel.material_id,
             Material.name.label('material_name'),
             Material.unit,
+            Material.category,
             StockLevel.quantity,
             StockLevel.total_value,
             Material.minimum_level,
@@ -267,9 +363,9 @@ class InventoryService:
         return query.order_by(Site.name, Material.name).all()
     
     @staticmethod
-    def get_low_stock_items(site_id=None):
+    def iter_stock_summary(site_id=None, batch_size=1000):
         """
-        Get items that are below minimum stock level
+        Stream the stock summary from a server-side cursor in batches of batch_size rows
         """
         query = db.session.query(
             StockLevel.site_id,
@@ -277,14 +373,24 @@ class InventoryService:
             StockLevel.material_id,
             Material.name.label('material_name'),
             Material.unit,
+            Material.category,
             StockLevel.quantity,
-            Material.minimum_level
-        ).join(Site).join(Material).filter(StockLevel.quantity < Material.minimum_level)
+            StockLevel.total_value,
+            Material.minimum_level,
+            StockLevel.updated_at
+        ).join(Site).join(Material)
         
         if site_id:
             query = query.filter(StockLevel.site_id == site_id)
         
-        return query.all()
+        return query.order_by(Site.name, Material.name).yield_per(batch_size)
+    
+    @staticmethod
+    def get_low_stock_items(site_id=None):
+        """
+        Get items that are below minimum stock level (from the maintained stock status index)
+        """
+        return StockStatusService.get_low_stock_items(site_id)
     
     @staticmethod
     def get_transaction_history(site_id=None, material_id=None, start_date=None, end_date=None):
@@ -331,6 +437,50 @@ class InventoryService:
             logging.error(f"Error retrieving transaction history: {str(e)}")
             return []
     
+    @staticmethod
+    def iter_transaction_history(site_id=None, material_id=None, start_date=None, end_date=None, batch_size=1000, newest_first=True):
+        """
+        Stream transaction history rows from a server-side cursor in batches of batch_size rows.
+        Rows are flat column tuples, so no ORM objects or relationships are loaded per row.
+        """
+        from models_new import User
+        
+        query = db.session.query(
+            Transaction.id,
+            Transaction.serial_number,
+            Transaction.created_at,
+            Transaction.type,
+            Transaction.site_id,
+            Site.name.label('site_name'),
+            Transaction.material_id,
+            Material.name.label('material_name'),
+            Material.unit,
+            Transaction.quantity,
+            Transaction.unit_cost,
+            Transaction.total_value,
+            Transaction.issued_to_project_code.label('project_code'),
+            User.username.label('created_by'),
+            Transaction.notes
+        ).join(Site, Transaction.site_id == Site.id).join(
+            Material, Transaction.material_id == Material.id
+        ).outerjoin(User, Transaction.created_by == User.id)
+        
+        if site_id:
+            query = query.filter(Transaction.site_id == site_id)
+        if material_id:
+            query = query.filter(Transaction.material_id == material_id)
+        if start_date:
+            query = query.filter(Transaction.created_at >= datetime.combine(start_date, datetime.min.time()))
+        if end_date:
+            query = query.filter(Transaction.created_at <= datetime.combine(end_date, datetime.max.time()))
+        
+        if newest_first:
+            query = query.order_by(Transaction.created_at.desc(), Transaction.id.desc())
+        else:
+            query = query.order_by(Transaction.created_at, Transaction.id)
+        
+        return query.yield_per(batch_size)
+    
     @staticmethod
     def process_issue_request(request_id, approved_by, action='approve', review_notes=None):
         """
@@ -348,6 +498,7 @@ class InventoryService:
             issue_request.reviewed_by = approved_by
             issue_request.reviewed_at = datetime.utcnow()
             issue_request.review_notes = review_notes
+            InventoryService.bump_site_version(issue_request.site_id)
             
             # If approved, create the issue transaction
             if action == 'approve':
@@ -388,6 +539,7 @@ class InventoryService:
             batch_request.reviewed_by = approved_by
             batch_request.reviewed_at = datetime.utcnow()
             batch_request.review_notes = review_notes
+            InventoryService.bump_site_version(batch_request.site_id)
             
             # If approved, create issue transactions for all items
             if action == 'approve':
@@ -412,6 +564,62 @@ class InventoryService:
             logging.error(f"Error processing batch request: {str(e)}")
             raise
     
+    @staticmethod
+    def create_batch_issue_request(site_id, items, requested_by, project_code=None, purpose=None):
+        """
+        Create a batch issue request from (material_id, quantity) lines. Lines for the
+        same material are merged, every material is checked against the site's stock
+        with one query, and the header and items are inserted with bulk statements.
+        Raises ValueError when there are no lines or stock is insufficient.
+        """
+        requested = defaultdict(float)
+        for material_id, quantity in items:
+            if quantity > 0:
+                requested[int(material_id)] += quantity
+        if not requested:
+            raise ValueError("Please add at least one material to the batch request")
+        
+        available = dict(
+            db.session.query(Material.id, func.coalesce(StockLevel.quantity, 0.0))
+            .outerjoin(StockLevel, (StockLevel.material_id == Material.id) & (StockLevel.site_id == site_id))
+            .filter(Material.id.in_(list(requested))).all()
+        )
+        unknown = [material_id for material_id in requested if material_id not in available]
+        if unknown:
+            raise ValueError(f"Unknown material id {unknown[0]}")
+        short = [material_id for material_id, quantity in requested.items() if available[material_id] < quantity]
+        if short:
+            names = [name for name, in db.session.query(Material.name).filter(Material.id.in_(short)).order_by(Material.name)]
+            more = f" and {len(names) - 5} more" if len(names) > 5 else ""
+            raise ValueError(f"Insufficient stock for {', '.join(names[:5])}{more}")
+        
+        for attempt in range(3):
+            batch_id = BatchIssueRequest.generate_batch_id()
+            try:
+                db.session.execute(insert(BatchIssueRequest), [{
+                    'batch_id': batch_id, 'site_id': site_id, 'project_code': project_code, 'purpose': purpose,
+                    'requested_by': requested_by, 'status': 'pending'
+                }])
+                db.session.execute(insert(BatchIssueItem), [
+                    {'batch_id': batch_id, 'material_id': material_id, 'quantity_requested': quantity}
+                    for material_id, quantity in requested.items()
+                ])
+                InventoryService.bump_site_version(site_id)
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Another request took the same batch ID; take the next one
+                db.session.rollback()
+                if attempt == 2:
+                    raise
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Error creating batch request: {str(e)}")
+                raise
+        
+        logging.info(f"Batch request created: {batch_id} with {len(requested)} materials")
+        return batch_id
+    
     @staticmethod
     def create_stock_transfer_request(from_site_id, to_site_id, materials, requested_by, reason=None, priority='normal'):
         """
@@ -444,6 +652,7 @@ class InventoryService:
                 )
                 db.session.add(transfer_item)
             
+            InventoryService.bump_site_version(from_site_id)
             db.session.commit()
             
             logging.info(f"Stock transfer request created: {transfer_id}")
@@ -471,6 +680,7 @@ class InventoryService:
             transfer_request.reviewed_by = approved_by
             transfer_request.reviewed_at = datetime.utcnow()
             transfer_request.review_notes = review_notes
+            InventoryService.bump_site_version(transfer_request.from_site_id)
             
             # If approved, process the stock transfers
             if action == 'approve':
@@ -523,10 +733,17 @@ class ReportService:
         """
         Generate daily issues report for a specific site
         """
+        return ReportService.daily_issues_query(site_id, report_date).all()
+    
+    @staticmethod
+    def daily_issues_query(site_id, report_date):
+        """
+        Build the query for a site's material issues on one day
+        """
         start_date = datetime.combine(report_date, datetime.min.time())
         end_date = datetime.combine(report_date, datetime.max.time())
         
-        issues = db.session.query(
+        return db.session.query(
             Transaction.serial_number,
             Transaction.created_at,
             Material.name.label('material_name'),
@@ -541,9 +758,7 @@ class ReportService:
             Transaction.type == 'issue',
             Transaction.created_at >= start_date,
             Transaction.created_at <= end_date
-        ).order_by(Transaction.created_at).all()
-        
-        return issues
+        ).order_by(Transaction.created_at)
     
     @staticmethod
     def generate_stock_summary_report(site_id):
@@ -557,4 +772,15 @@ class ReportService:
         """
         Generate transaction history report
         """
-        return InventoryService.get_transaction_history(site_id, start_date=start_date, end_date=end_date)
\ No newline at end of file
+        return InventoryService.get_transaction_history(site_id, start_date=start_date, end_date=end_date)
+    
+    @staticmethod
+    def ledger_high_water_mark(site_id=None):
+        """
+        Get the highest transaction id recorded for a site (or all sites).
+        Any new ledger entry raises it, so it identifies the state of a live period.
+        """
+        query = db.session.query(func.max(Transaction.id))
+        if site_id:
+            query = query.filter(Transaction.site_id == site_id)
+        return query.scalar() or 0
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""
+Ledger CSV Export
+Streams the transactions ledger as CSV for BI tools, batch by batch from a
+server-side cursor, optionally gzip-compressed on the fly
+"""
+
+import csv
+import io
+import zlib
+
+from inventory_service import InventoryService
+
+LEDGER_CSV_COLUMNS = [
+    'id', 'serial_number', 'created_at', 'type', 'site_id', 'site_name',
+    'material_id', 'material_name', 'unit', 'quantity', 'unit_cost',
+    'total_value', 'project_code', 'created_by', 'notes'
+]
+
+# Rows fetched per cursor batch and written per yielded CSV chunk
+EXPORT_BATCH_SIZE = 2000
+
+
+def iter_ledger_csv(site_id=None, start_date=None, end_date=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the ledger as CSV text chunks, oldest entries first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(LEDGER_CSV_COLUMNS)
+
+    rows = InventoryService.iter_transaction_history(
+        site_id=site_id, start_date=start_date, end_date=end_date,
+        batch_size=batch_size, newest_first=False
+    )
+    pending = 0
+    for txn in rows:
+        writer.writerow([
+            txn.id,
+            txn.serial_number,
+            txn.created_at.isoformat() if txn.created_at else '',
+            txn.type,
+            txn.site_id,
+            txn.site_name,
+            txn.material_id,
+            txn.material_name,
+            txn.unit,
+            txn.quantity,
+            txn.unit_cost,
+            txn.total_value,
+            txn.project_code or '',
+            txn.created_by or '',
+            txn.notes or ''
+        ])
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of text chunks into a single gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -8,6 +8,7 @@ logging.basicConfig(level=logging.INFO)
 # Import routes to register them with the app
 try:
     import routes_new  # noqa: F401
+    import commands  # noqa: F401
     logging.info("Routes imported successfully")
 except Exception as e:
     logging.error(f"Error importing routes: {e}")
@@ -0,0 +1,425 @@
+"""
+Material Catalog Import
+Validates and normalizes an uploaded catalog with column-wise pandas operations,
+matches it against one prefetch of existing materials and writes inserts and
+updates as two bulk statements. Uploads are imported by the background worker in
+committed chunks read by import_reader, so a failed import resumes after its last
+chunk, and rejected rows are kept for a per-row error report.
+"""
+
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from io import BytesIO
+import logging
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert, update
+
+from app import app, db
+from models_new import Material, StockLevel, MaterialImportJob, MaterialImportError
+from import_reader import (
+    IMPORT_CHUNK_SIZE, import_format, read_header, count_rows, iter_import_chunks, text_column, number_column
+)
+from report_frames import read_frame
+from inventory_service import InventoryService
+from valuation_service import ValuationService
+from stock_status import StockStatusService
+from units import canonical_units
+
+MATERIAL_COLUMNS = ['Material Name', 'Unit', 'Description', 'Cost per Unit', 'Minimum Level', 'Category']
+# Optional extra column; rows with a known SKU update that material whatever its name
+SKU_COLUMN = 'SKU'
+
+# Column lengths from models_new.Material; longer values would fail the whole bulk statement
+MAX_LENGTHS = {'name': 100, 'sku': 50, 'unit': 20, 'category': 50}
+
+ERROR_REPORT_COLUMNS = ['Row', 'Material Name', 'Unit', 'Error']
+
+MaterialImportResult = namedtuple('MaterialImportResult', 'added updated skipped errors')
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+# Running imports record a heartbeat with every committed chunk; one silent for longer than
+# this belongs to a dead worker (redeploy, OOM) and is requeued, or may be resumed
+STALE_JOB_MINUTES = 5
+STALLED_IMPORT_MESSAGE = 'The import worker stopped responding'
+
+# Uploaded files are kept here until their import completes
+IMPORT_FOLDER = os.path.join(app.config['UPLOAD_FOLDER'], 'material_imports')
+
+
+def normalize_material_frame(df, first_row=2):
+    """
+    Normalize an uploaded catalog into name, sku, unit, description, cost_per_unit,
+    minimum_level and category columns, with the spreadsheet row number in 'row'
+    and the first problem found in 'error' (None when the row is valid). Rows
+    without a material name are dropped.
+    """
+    frame = pd.DataFrame({
+        'row': np.arange(first_row, first_row + len(df)),
+        'name': text_column(df, 'Material Name'),
+        'sku': text_column(df, SKU_COLUMN, None),
+        'unit': text_column(df, 'Unit'),
+        'description': text_column(df, 'Description'),
+        'category': text_column(df, 'Category', 'General')
+    }, index=df.index)
+    frame['cost_per_unit'], bad_cost = number_column(df, 'Cost per Unit')
+    frame['minimum_level'], bad_minimum = number_column(df, 'Minimum Level')
+
+    keep = frame['name'] != ''
+    frame, bad_cost, bad_minimum = frame[keep], bad_cost[keep], bad_minimum[keep]
+    # Every accepted spelling of a unit is stored as its canonical code
+    units = canonical_units(frame['unit'])
+
+    # Rows keep their first problem: conditions are checked in this order
+    checks = [
+        (frame['unit'] == '', 'Unit is required'),
+        (units.isna(), "Invalid unit '" + frame['unit'] + "'"),
+        (bad_cost, 'Cost per Unit is not a number'),
+        (bad_minimum, 'Minimum Level is not a number'),
+    ]
+    for column, max_length in MAX_LENGTHS.items():
+        checks.append((frame[column].str.len() > max_length, f"{column.replace('_', ' ').title()} is longer than {max_length} characters"))
+
+    first_name_row = frame.groupby('name', sort=False)['row'].transform('first')
+    checks.append((frame['name'].duplicated(), 'Duplicate of row ' + first_name_row.astype(str)))
+    has_sku = frame['sku'].notna()
+    first_sku_row = frame[has_sku].groupby('sku', sort=False)['row'].transform('first').reindex(frame.index)
+    checks.append((has_sku & frame['sku'].duplicated(), 'SKU already used on row ' + first_sku_row.astype('Int64').astype(str)))
+
+    errors = pd.Series(None, index=frame.index, dtype=object)
+    for failed, message in reversed(checks):
+        errors = errors.mask(failed, message)
+    frame = frame.copy()
+    frame['unit'] = units.fillna(frame['unit'])
+    frame['error'] = errors
+    return frame
+
+
+class MaterialCatalog:
+    """
+    Existing materials by name and SKU from one query, kept current as chunks are
+    written, with the first file row of every name and SKU seen so duplicates are
+    caught across chunks
+    """
+
+    def __init__(self):
+        rows = db.session.query(
+            Material.id, Material.name, Material.sku, Material.category, Material.minimum_level
+        ).order_by(Material.id).all()
+        self.fields = pd.DataFrame(rows, columns=['id', 'name', 'sku', 'category', 'minimum_level']).set_index('id')
+        # Names are not unique in the table; the oldest material wins, as filter_by().first() did
+        self.by_name = {}
+        self.by_sku = {}
+        for row in rows:
+            self.by_name.setdefault(row.name, row.id)
+            if row.sku:
+                self.by_sku[row.sku] = row.id
+        self.seen_names = {}
+        self.seen_skus = {}
+
+    def add(self, material_ids, rows):
+        """Record newly inserted materials so later chunks match them"""
+        for material_id, name, sku in zip(material_ids, rows['name'], rows['sku']):
+            self.by_name.setdefault(name, material_id)
+            if sku is not None:
+                self.by_sku[sku] = material_id
+        added = rows[['name', 'sku', 'category', 'minimum_level']].set_axis(pd.Index(material_ids, name='id'))
+        self.fields = pd.concat([self.fields, added]) if len(self.fields) else added
+
+    def update(self, changes):
+        """Record updated materials; changes is indexed by material id"""
+        for material_id, name in zip(changes.index, changes['name']):
+            self.by_name.setdefault(name, material_id)
+        for material_id, sku in zip(changes.index, changes['sku']):
+            if sku is not None:
+                self.by_sku[sku] = material_id
+        self.fields.loc[changes.index, ['name', 'sku', 'category', 'minimum_level']] = \
+            changes[['name', 'sku', 'category', 'minimum_level']].values
+
+    def flag_earlier_rows(self, frame):
+        """Reject names and SKUs that already appeared in an earlier chunk, then remember this chunk's"""
+        for column, seen, label in (('name', self.seen_names, 'Duplicate of row '), ('sku', self.seen_skus, 'SKU already used on row ')):
+            earlier = frame[column].map(seen)
+            duplicate = frame['error'].isna() & earlier.notna()
+            frame.loc[duplicate, 'error'] = label + earlier[duplicate].astype(int).astype(str)
+            for value, row in zip(frame[column], frame['row']):
+                if pd.notna(value):
+                    seen.setdefault(value, row)
+
+
+class MaterialImportService:
+    """Service class for bulk material catalog uploads"""
+
+    @staticmethod
+    def import_frame(df, update_existing=False, first_row=2, catalog=None):
+        """
+        Import an uploaded catalog frame in the current transaction and return a
+        MaterialImportResult. Existing materials are matched by SKU, then by name.
+        Pass the same catalog for every chunk of one file.
+        """
+        if catalog is None:
+            catalog = MaterialCatalog()
+        frame = normalize_material_frame(df, first_row)
+        catalog.flag_earlier_rows(frame)
+
+        material_ids = frame['sku'].map(catalog.by_sku).fillna(frame['name'].map(catalog.by_name))
+        valid = frame['error'].isna()
+        is_new = valid & material_ids.isna()
+        is_existing = valid & material_ids.notna()
+
+        # A new row cannot take a SKU that already belongs to another material, and two
+        # rows (one matched by SKU, one by name) cannot both update the same material
+        taken_sku = is_new & frame['sku'].isin(catalog.by_sku)
+        frame.loc[taken_sku, 'error'] = 'SKU belongs to another material'
+        is_new &= ~taken_sku
+        same_material = is_existing & material_ids.where(is_existing).duplicated()
+        frame.loc[same_material, 'error'] = 'Matches the same material as an earlier row'
+        is_existing &= ~same_material
+
+        fields = ['name', 'sku', 'unit', 'description', 'cost_per_unit', 'minimum_level', 'category']
+        new_rows = frame.loc[is_new, fields].astype(object)
+        new_rows = new_rows.where(new_rows.notna(), None)
+        if len(new_rows):
+            new_ids = db.session.scalars(
+                insert(Material).returning(Material.id, sort_by_parameter_order=True),
+                new_rows.to_dict('records')
+            ).all()
+            catalog.add(new_ids, new_rows)
+            InventoryService.bump_catalog_version()
+
+        updated = 0
+        if update_existing and is_existing.any():
+            changes = frame.loc[is_existing, fields].astype(object)
+            changes = changes.where(changes.notna(), None)
+            changes['id'] = material_ids[is_existing].astype(int)
+            previous = catalog.fields.loc[changes['id']]
+            # A blank SKU cell keeps the material's current SKU
+            changes['sku'] = changes['sku'].where(changes['sku'].notna(), previous['sku'].values)
+            changes['sku'] = changes['sku'].where(changes['sku'].notna(), None)
+            db.session.execute(update(Material), changes.to_dict('records'))
+            changes = changes.set_index('id')
+            MaterialImportService.refresh_rollups(changes, previous)
+            catalog.update(changes)
+            InventoryService.bump_catalog_version()
+            updated = len(changes)
+
+        skipped = 0 if update_existing else int(is_existing.sum())
+        errors = frame.loc[frame['error'].notna(), ['row', 'name', 'unit', 'error']]
+        logging.info(f"Material import: {len(new_rows)} added, {updated} updated, {skipped} skipped, {len(errors)} rejected")
+        return MaterialImportResult(len(new_rows), updated, skipped, errors)
+
+    @staticmethod
+    def refresh_rollups(changes, previous):
+        """Move valuation rollups and re-classify stock for updated materials in one stock level query"""
+        moved = changes['category'].fillna('General').values != previous['category'].fillna('General').values
+        reclassified = changes['minimum_level'].values != previous['minimum_level'].values
+        affected = changes.index[moved | reclassified]
+        if not len(affected):
+            return
+
+        moved_ids = set(changes.index[moved])
+        deltas = defaultdict(lambda: [0.0, 0.0])
+        for stock_level in StockLevel.query.filter(StockLevel.material_id.in_(affected.tolist())).all():
+            material_id = stock_level.material_id
+            if material_id in moved_ids:
+                for category, sign in ((previous.at[material_id, 'category'], -1), (changes.at[material_id, 'category'], 1)):
+                    delta = deltas[(stock_level.site_id, category or 'General')]
+                    delta[0] += sign * stock_level.quantity
+                    delta[1] += sign * stock_level.total_value
+            StockStatusService.refresh(stock_level.site_id, material_id, stock_level.quantity,
+                                       float(changes.at[material_id, 'minimum_level']))
+
+        for (site_id, category), (quantity_delta, value_delta) in deltas.items():
+            ValuationService.apply_delta(site_id, category, quantity_delta, value_delta)
+
+    @staticmethod
+    def store_upload(file_storage):
+        """Save an uploaded file for the import worker and return its path"""
+        os.makedirs(IMPORT_FOLDER, exist_ok=True)
+        path = os.path.join(IMPORT_FOLDER, f"{uuid.uuid4().hex}.{import_format(file_storage.filename)}")
+        file_storage.save(path)
+        return path
+
+    @staticmethod
+    def submit(file_path, filename, skip_header=True, update_existing=False, requested_by=None, queue=True):
+        """
+        Check a catalog file's columns and queue it for import, or with queue=False
+        create it already running for the caller to run; raises ValueError when the
+        file cannot be imported
+        """
+        file_format = import_format(filename)
+        if not file_format:
+            raise ValueError('Invalid file format. Please upload .xlsx, .xls or .csv files only.')
+
+        columns = read_header(file_path, file_format, skip_header, MATERIAL_COLUMNS)
+        if 'Material Name' not in columns or 'Unit' not in columns:
+            raise ValueError('The file must contain "Material Name" and "Unit" columns')
+
+        job = MaterialImportJob(
+            filename=filename,
+            file_path=file_path,
+            file_format=file_format,
+            skip_header=skip_header,
+            update_existing=update_existing,
+            rows_total=count_rows(file_path, file_format, skip_header),
+            status=JOB_QUEUED if queue else JOB_RUNNING,
+            started_at=None if queue else datetime.utcnow(),
+            heartbeat_at=None if queue else datetime.utcnow(),
+            requested_by=requested_by
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        logging.info(f"Material import {job.id} {job.status}: {filename} (~{job.rows_total} rows)")
+        return job
+
+    @staticmethod
+    def claim_next():
+        """Atomically claim the oldest queued import; returns None when there is none"""
+        while True:
+            job_id = db.session.query(MaterialImportJob.id).filter(
+                MaterialImportJob.status == JOB_QUEUED
+            ).order_by(MaterialImportJob.id).limit(1).scalar()
+            if job_id is None:
+                return None
+
+            now = datetime.utcnow()
+            result = db.session.execute(
+                update(MaterialImportJob)
+                .where(MaterialImportJob.id == job_id, MaterialImportJob.status == JOB_QUEUED)
+                .values(status=JOB_RUNNING, started_at=now, heartbeat_at=now)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return db.session.get(MaterialImportJob, job_id)
+
+    @staticmethod
+    def run_job(job, chunk_size=IMPORT_CHUNK_SIZE, on_progress=None):
+        """
+        Import a claimed job chunk by chunk from its last committed row. Each chunk's
+        materials, rejected rows and progress counters are committed together, so a
+        failure loses at most the chunk in flight.
+        """
+        try:
+            catalog = MaterialCatalog()
+            chunks = iter_import_chunks(job.file_path, job.file_format, MATERIAL_COLUMNS,
+                                        job.skip_header, chunk_size, job.rows_processed)
+            for first_row, chunk in chunks:
+                result = MaterialImportService.import_frame(chunk, job.update_existing, first_row, catalog)
+                if len(result.errors):
+                    db.session.execute(insert(MaterialImportError), [
+                        {'job_id': job.id, 'row_number': int(row), 'material_name': name[:255],
+                         'unit': unit[:100], 'error': error[:255]}
+                        for row, name, unit, error in result.errors.itertuples(index=False, name=None)
+                    ])
+                job.rows_processed += len(chunk)
+                job.added += result.added
+                job.updated += result.updated
+                job.skipped += result.skipped
+                job.rejected += len(result.errors)
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+                if on_progress:
+                    on_progress(job)
+
+            job.status = JOB_COMPLETED
+            job.completed_at = datetime.utcnow()
+            job.error_message = None
+            db.session.commit()
+            logging.info(f"Material import {job.id} completed: {job.added} added, {job.updated} updated, "
+                         f"{job.skipped} skipped, {job.rejected} rejected")
+
+            # Uploaded copies are no longer needed; files imported from the command line are left alone
+            if os.path.dirname(os.path.abspath(job.file_path)) == os.path.abspath(IMPORT_FOLDER):
+                os.remove(job.file_path)
+
+        except Exception as e:
+            db.session.rollback()
+            job.status = JOB_FAILED
+            job.error_message = str(e)
+            job.completed_at = datetime.utcnow()
+            db.session.commit()
+            logging.error(f"Material import {job.id} failed after {job.rows_processed} rows: {str(e)}")
+
+        return job
+
+    @staticmethod
+    def run_next():
+        """Claim and run one queued import; returns the job or None when there is none"""
+        job = MaterialImportService.claim_next()
+        if job:
+            MaterialImportService.run_job(job)
+        return job
+
+    @staticmethod
+    def _stalled(max_age_minutes=STALE_JOB_MINUTES):
+        """Condition matching running imports whose worker has stopped sending heartbeats"""
+        cutoff = datetime.utcnow() - timedelta(minutes=max_age_minutes)
+        return (MaterialImportJob.status == JOB_RUNNING) & \
+            (func.coalesce(MaterialImportJob.heartbeat_at, MaterialImportJob.started_at) < cutoff)
+
+    @staticmethod
+    def is_stalled(job, max_age_minutes=STALE_JOB_MINUTES):
+        """Whether a running import's worker has stopped sending heartbeats"""
+        last_seen = job.heartbeat_at or job.started_at
+        return job.status == JOB_RUNNING and (
+            last_seen is None or last_seen < datetime.utcnow() - timedelta(minutes=max_age_minutes)
+        )
+
+    @staticmethod
+    def resume(job, queue=True):
+        """
+        Queue (or with queue=False, restart) a failed or stalled import; it continues
+        after its last committed chunk
+        """
+        if job.status != JOB_FAILED and not MaterialImportService.is_stalled(job):
+            raise ValueError('Only failed or stalled imports can be resumed')
+        if not os.path.exists(job.file_path):
+            raise ValueError('The uploaded file is no longer available, please upload it again')
+
+        # Conditional, so a worker requeueing or claiming the job at the same moment wins cleanly
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update(MaterialImportJob)
+            .where(MaterialImportJob.id == job.id,
+                   (MaterialImportJob.status == JOB_FAILED) | MaterialImportService._stalled())
+            .values(status=JOB_QUEUED if queue else JOB_RUNNING, error_message=None,
+                    started_at=None if queue else now, heartbeat_at=None if queue else now, completed_at=None)
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            raise ValueError('The import has already been picked up again')
+        db.session.refresh(job)
+        logging.info(f"Material import {job.id} resumed at row {job.rows_processed}")
+        return job
+
+    @staticmethod
+    def requeue_stale(max_age_minutes=STALE_JOB_MINUTES):
+        """Requeue running imports whose worker stopped sending heartbeats; returns the number requeued"""
+        result = db.session.execute(
+            update(MaterialImportJob)
+            .where(MaterialImportService._stalled(max_age_minutes))
+            .values(status=JOB_QUEUED, started_at=None, heartbeat_at=None)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def error_report(job):
+        """Get a job's rejected rows as a CSV buffer"""
+        frame = read_frame(db.session.query(
+            MaterialImportError.row_number, MaterialImportError.material_name,
+            MaterialImportError.unit, MaterialImportError.error
+        ).filter(MaterialImportError.job_id == job.id).order_by(MaterialImportError.row_number))
+
+        output = BytesIO()
+        frame.to_csv(output, index=False, header=ERROR_REPORT_COLUMNS)
+        output.seek(0)
+        return output
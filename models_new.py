@@ -2,7 +2,7 @@ from datetime import datetime
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import UniqueConstraint, func
 import uuid
 
 
@@ -136,6 +136,13 @@ class Transaction(db.Model):
         counter = Transaction.query.filter(Transaction.serial_number.like(f"TXN-{timestamp}-%")).count() + 1
         return f"TXN-{timestamp}-{counter:04d}"
 
+    @staticmethod
+    def generate_serial_numbers(count):
+        """Generate serial numbers for a batch of transactions recorded together"""
+        timestamp = datetime.now().strftime("%Y%m%d")
+        start = Transaction.query.filter(Transaction.serial_number.like(f"TXN-{timestamp}-%")).count() + 1
+        return [f"TXN-{timestamp}-{counter:04d}" for counter in range(start, start + count)]
+
     def __repr__(self):
         return f'<Transaction {self.serial_number} - {self.type}>'
 
@@ -187,10 +194,13 @@ class BatchIssueRequest(db.Model):
 
     @staticmethod
     def generate_batch_id():
-        """Generate a unique batch ID"""
-        timestamp = datetime.now().strftime("%Y%m%d")
-        counter = BatchIssueRequest.query.filter(BatchIssueRequest.batch_id.like(f"BTH-{timestamp}-%")).count() + 1
-        return f"BTH-{timestamp}-{counter:04d}"
+        """Generate the next batch ID of the day after the highest one issued (a range lookup on the unique index)"""
+        prefix = f"BTH-{datetime.now().strftime('%Y%m%d')}-"
+        last = db.session.query(func.max(BatchIssueRequest.batch_id)).filter(
+            BatchIssueRequest.batch_id >= prefix, BatchIssueRequest.batch_id < prefix[:-1] + '.'
+        ).scalar()
+        counter = int(last[len(prefix):]) + 1 if last else 1
+        return f"{prefix}{counter:04d}"
 
     def __repr__(self):
         return f'<BatchIssueRequest {self.batch_id}>'
@@ -251,6 +261,167 @@ class FIFOBatch(db.Model):
         return f'<FIFOBatch {self.material.name} - {self.quantity_remaining} @ {self.unit_cost}>'
 
 
+class StockStatus(db.Model):
+    """Maintained normal / low / critical state of a stock level, indexed per site"""
+    __tablename__ = 'stock_status'
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('sites.id'), nullable=False)
+    material_id = db.Column(db.Integer, db.ForeignKey('materials.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='normal')  # 'normal', 'low', 'critical'
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    minimum_level = db.Column(db.Float, nullable=False, default=0.0)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('site_id', 'material_id', name='uq_stock_status_site_material'),
+        db.Index('ix_stock_status_site_status', 'site_id', 'status'),
+    )
+
+    # Relationships
+    site = db.relationship('Site', backref=db.backref('stock_statuses', cascade='all, delete-orphan'))
+    material = db.relationship('Material', backref=db.backref('stock_statuses', cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<StockStatus site={self.site_id} material={self.material_id}: {self.status}>'
+
+
+class InventoryValuation(db.Model):
+    """Incrementally maintained stock quantity and value rollup per site and category"""
+    __tablename__ = 'inventory_valuations'
+    id = db.Column(db.Integer, primary_key=True)
+    site_id = db.Column(db.Integer, db.ForeignKey('sites.id'), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    total_value = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint('site_id', 'category', name='uq_valuation_site_category'),)
+
+    # Relationships
+    site = db.relationship('Site', backref=db.backref('valuations', cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<InventoryValuation site={self.site_id} {self.category}: {self.total_value}>'
+
+
+class DailyActivityCounter(db.Model):
+    """Ledger activity per business date, site and transaction type, updated on every ledger insert"""
+    __tablename__ = 'daily_activity_counters'
+    id = db.Column(db.Integer, primary_key=True)
+    business_date = db.Column(db.Date, nullable=False)
+    site_id = db.Column(db.Integer, db.ForeignKey('sites.id'), nullable=False)
+    type = db.Column(db.String(20), nullable=False)  # 'receive', 'issue', 'adjustment'
+    count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Float, nullable=False, default=0.0)
+    total_value = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (UniqueConstraint('business_date', 'site_id', 'type', name='uq_activity_date_site_type'),)
+
+    # Relationships
+    site = db.relationship('Site', backref=db.backref('activity_counters', cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<DailyActivityCounter {self.business_date} site={self.site_id} {self.type}: {self.count}>'
+
+
+class SiteDataVersion(db.Model):
+    """Monotonic data version per site, bumped on every write that affects cached views"""
+    __tablename__ = 'site_data_versions'
+    site_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 = all sites, -1 = material catalog
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SiteDataVersion site={self.site_id} v{self.version}>'
+
+
+class ReceiptDocument(db.Model):
+    """Rendered goods received voucher, stored once on disk under its SHA-256 content hash"""
+    __tablename__ = 'receipt_documents'
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False, unique=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    layout_version = db.Column(db.Integer, nullable=False, default=1)
+    rendered_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    transaction = db.relationship('Transaction', backref=db.backref('receipt_document', uselist=False, cascade='all, delete-orphan'))
+
+    def __repr__(self):
+        return f'<ReceiptDocument txn={self.transaction_id} {self.sha256[:12]}>'
+
+
+class ReportJob(db.Model):
+    """Queued report rendering job, picked up by the background report worker"""
+    __tablename__ = 'report_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # 'daily_issues', 'stock_summary', 'transaction_history', 'receipts_zip'
+    report_format = db.Column(db.String(10), nullable=False, default='pdf')  # 'pdf', 'excel', 'zip'
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON encoded report parameters
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # 'queued', 'running', 'completed', 'failed'
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    artifact_key = db.Column(db.String(100), nullable=True)  # File name in the report artifact cache
+    download_name = db.Column(db.String(255), nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)  # Also identifies the claim of the worker running it
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Refreshed by the worker while it renders
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    requester = db.relationship('User', backref='report_jobs')
+
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.job_type} {self.status}>'
+
+
+
+class MaterialImportJob(db.Model):
+    """Uploaded material catalog, imported in committed chunks by the background worker"""
+    __tablename__ = 'material_import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)  # Name of the uploaded file
+    file_path = db.Column(db.String(500), nullable=False)  # Stored copy read by the worker
+    file_format = db.Column(db.String(10), nullable=False)  # 'xlsx', 'xls', 'csv'
+    skip_header = db.Column(db.Boolean, nullable=False, default=True)
+    update_existing = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # 'queued', 'running', 'completed', 'failed'
+    rows_total = db.Column(db.Integer, nullable=True)  # Estimated data rows, when the format reports it
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)  # Data rows committed; imports resume here
+    added = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # None for command line imports
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Updated with every committed chunk while running
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    # Relationships
+    requester = db.relationship('User', backref='material_import_jobs')
+    row_errors = db.relationship('MaterialImportError', backref='job', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<MaterialImportJob {self.id} {self.filename} {self.status}>'
+
+
+class MaterialImportError(db.Model):
+    """A rejected row of a material import, committed with the chunk it belongs to"""
+    __tablename__ = 'material_import_errors'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('material_import_jobs.id'), nullable=False, index=True)
+    row_number = db.Column(db.Integer, nullable=False)  # Spreadsheet row
+    material_name = db.Column(db.String(255), nullable=True)
+    unit = db.Column(db.String(100), nullable=True)
+    error = db.Column(db.String(255), nullable=False)
+
+    def __repr__(self):
+        return f'<MaterialImportError job={self.job_id} row={self.row_number}>'
+
+
 # Legacy models for backward compatibility - with unique table names
 class StockTransferRequest(db.Model):
     __tablename__ = 'stock_transfer_requests'
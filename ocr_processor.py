@@ -3,6 +3,8 @@ from PIL import Image
 import re
 import logging
 
+from units import canonical_unit, find_unit
+
 # Configure pytesseract path if needed (uncomment and adjust path as needed)
 # pytesseract.pytesseract.tesseract_cmd = r'/usr/bin/tesseract'
 
@@ -205,7 +207,7 @@ def parse_standard_format(lines):
                         materials.append({
                             'name': material_name.capitalize(),
                             'quantity': quantity,
-                            'unit': unit.lower()
+                            'unit': canonical_unit(unit) or unit.lower()
                         })
                     except ValueError:
                         continue
@@ -216,7 +218,7 @@ def parse_standard_format(lines):
                         materials.append({
                             'name': material_name.capitalize(),
                             'quantity': quantity,
-                            'unit': 'units'  # default unit
+                            'unit': 'pcs'  # default unit
                         })
                     except ValueError:
                         continue
@@ -263,22 +265,12 @@ def determine_unit(line, material_name):
     """
     Determine the unit of measurement based on material name and context
     """
-    line_lower = line.lower()
     material_lower = material_name.lower()
     
     # Check for explicit units in the line
-    if any(unit in line_lower for unit in ['kg', 'kgs', 'kilogram']):
-        return 'kg'
-    elif any(unit in line_lower for unit in ['bag', 'bags']):
-        return 'bags'
-    elif any(unit in line_lower for unit in ['ton', 'tons', 'tonne', 'tonnes']):
-        return 'tons'
-    elif any(unit in line_lower for unit in ['meter', 'metres', 'meters', 'm']):
-        return 'meters'
-    elif any(unit in line_lower for unit in ['liter', 'liters', 'litres', 'l']):
-        return 'liters'
-    elif any(unit in line_lower for unit in ['piece', 'pieces', 'pcs', 'pc']):
-        return 'pieces'
+    unit = find_unit(line)
+    if unit:
+        return unit
     
     # Infer unit based on material type
     if any(keyword in material_lower for keyword in ['cement', 'concrete', 'sand', 'gravel']):
@@ -286,11 +278,11 @@ def determine_unit(line, material_name):
     elif any(keyword in material_lower for keyword in ['steel', 'rebar', 'iron']):
         return 'kg'
     elif any(keyword in material_lower for keyword in ['pipe', 'cable', 'wire', 'timber', 'wood']):
-        return 'meters'
+        return 'm'
     elif any(keyword in material_lower for keyword in ['brick', 'block', 'tile']):
-        return 'pieces'
+        return 'pcs'
     elif any(keyword in material_lower for keyword in ['trap', 'valve', 'shower', 'head', 'arm']):
-        return 'pieces'
+        return 'pcs'
     
     # Default unit
-    return 'units'
+    return 'pcs'
@@ -0,0 +1,277 @@
+"""
+Opening Balance Import
+Loads the existing stock of a newly onboarded site from a CSV or XLSX file of
+(site, material or SKU, quantity, unit cost, received date) lines. Lines are
+validated and resolved column-wise, shown as a dry-run diff against current
+stock, and written as receive transactions, FIFO layers and stock levels with a
+handful of bulk statements instead of one receive_material call per line.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, update
+
+from app import db
+from models_new import Site, Material, StockLevel, Transaction, FIFOBatch
+from import_reader import import_format, read_import_frame, text_column, number_column
+from inventory_service import InventoryService
+from valuation_service import ValuationService
+from stock_status import StockStatusService
+from activity_counters import ActivityCounterService
+
+OPENING_BALANCE_COLUMNS = ['Site', 'Material', 'SKU', 'Quantity', 'Unit Cost', 'Received Date']
+
+OPENING_BALANCE_NOTE = 'Opening balance'
+
+DIFF_COLUMNS = [
+    ('site_name', 'Site'), ('material_name', 'Material'), ('sku', 'SKU'), ('unit', 'Unit'), ('lines', 'Lines'),
+    ('current_quantity', 'Current Quantity'), ('opening_quantity', 'Opening Quantity'), ('new_quantity', 'New Quantity'),
+    ('current_value', 'Current Value'), ('opening_value', 'Opening Value'), ('new_value', 'New Value'), ('change', 'Change')
+]
+
+ERROR_COLUMNS = [('row', 'Row'), ('site', 'Site'), ('material', 'Material'), ('sku', 'SKU'), ('error', 'Error')]
+
+# lines: valid lines with site_id/material_id resolved; diff: one row per (site, material);
+# errors: rejected lines with the reason
+OpeningBalancePlan = namedtuple('OpeningBalancePlan', 'lines diff errors')
+
+
+def _casefold_lookup(pairs):
+    """Map case-insensitive keys to ids, keeping the first id of each key"""
+    lookup = {}
+    for key, value in pairs:
+        if key:
+            lookup.setdefault(key.strip().casefold(), value)
+    return lookup
+
+
+def normalize_opening_balances(df, first_row=2, default_site=None):
+    """
+    Normalize opening balance lines and resolve sites (by name or code) and
+    materials (by SKU, then name). Returns a frame with row, site, material, sku,
+    quantity, unit_cost, received_at, site_id, material_id and error columns.
+    """
+    frame = pd.DataFrame({
+        'row': np.arange(first_row, first_row + len(df)),
+        'site': text_column(df, 'Site', default_site or ''),
+        'material': text_column(df, 'Material'),
+        'sku': text_column(df, 'SKU'),
+    }, index=df.index)
+    frame['quantity'], bad_quantity = number_column(df, 'Quantity', np.nan)
+    frame['unit_cost'], bad_cost = number_column(df, 'Unit Cost', np.nan)
+
+    today = pd.Timestamp(datetime.utcnow().date())
+    if 'Received Date' in df.columns:
+        raw_dates = df['Received Date']
+        received = pd.to_datetime(raw_dates, errors='coerce', format='mixed')
+        bad_date = received.isna() & raw_dates.notna() & (raw_dates.astype('string').str.strip() != '')
+        frame['received_at'] = received.fillna(today)
+    else:
+        bad_date = pd.Series(False, index=df.index)
+        frame['received_at'] = today
+
+    # Blank lines carry no material at all
+    keep = (frame['material'] != '') | (frame['sku'] != '')
+    frame, bad_quantity, bad_cost, bad_date = frame[keep].copy(), bad_quantity[keep], bad_cost[keep], bad_date[keep]
+
+    sites = db.session.query(Site.id, Site.name, Site.code).all()
+    site_ids = _casefold_lookup([(site.name, site.id) for site in sites])
+    for code, site_id in _casefold_lookup([(site.code, site.id) for site in sites]).items():
+        site_ids.setdefault(code, site_id)
+    materials = db.session.query(Material.id, Material.name, Material.sku).order_by(Material.id).all()
+    by_sku = {material.sku: material.id for material in materials if material.sku}
+    by_name = {}
+    for material in materials:
+        by_name.setdefault(material.name, material.id)
+
+    frame['site_id'] = frame['site'].str.casefold().map(site_ids)
+    frame['material_id'] = frame['sku'].map(by_sku).fillna(frame['material'].map(by_name))
+
+    checks = [
+        (frame['site'] == '', 'Site is required'),
+        (frame['site_id'].isna(), "Unknown site '" + frame['site'] + "'"),
+        (frame['material_id'].isna() & (frame['sku'] != ''), "Unknown SKU '" + frame['sku'] + "'"),
+        (frame['material_id'].isna(), "Unknown material '" + frame['material'] + "'"),
+        (bad_quantity, 'Quantity is not a number'),
+        (frame['quantity'].isna(), 'Quantity is required'),
+        (frame['quantity'] <= 0, 'Quantity must be greater than zero'),
+        (bad_cost, 'Unit Cost is not a number'),
+        (frame['unit_cost'].isna(), 'Unit Cost is required'),
+        (frame['unit_cost'] < 0, 'Unit Cost cannot be negative'),
+        (bad_date, 'Received Date is not a date'),
+        (frame['received_at'] > today + pd.Timedelta(days=1), 'Received Date is in the future'),
+    ]
+    errors = pd.Series(None, index=frame.index, dtype=object)
+    for failed, message in reversed(checks):
+        errors = errors.mask(failed.fillna(False).astype(bool), message)
+    frame['error'] = errors
+    return frame
+
+
+def post_receipts(lines, diff, created_by, notes, supporting_document_url=None, project_code=None):
+    """
+    Write receipt lines (site_id, material_id, quantity, unit_cost, total_value,
+    received_at and row columns) as receive transactions, FIFO layers and stock
+    levels with bulk statements in the current transaction; diff is the per-stock
+    level summary from OpeningBalanceService.diff. notes is one string or a Series
+    per line. Returns (transactions recorded, stock levels created).
+    """
+    count = len(lines)
+    serial_numbers = Transaction.generate_serial_numbers(count)
+    transaction_rows = pd.DataFrame({
+        'serial_number': serial_numbers,
+        'site_id': lines['site_id'].values,
+        'material_id': lines['material_id'].values,
+        'quantity': lines['quantity'].values,
+        'unit_cost': lines['unit_cost'].values,
+        'total_value': lines['total_value'].values,
+        'notes': notes.values if isinstance(notes, pd.Series) else notes
+    }).assign(type='receive', created_by=created_by, issued_to_project_code=project_code,
+              supporting_document_url=supporting_document_url)
+    transaction_ids = db.session.scalars(
+        insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+        transaction_rows.astype(object).to_dict('records')
+    ).all()
+
+    # FIFO layers keep the original received date so older stock is issued first
+    db.session.execute(insert(FIFOBatch), pd.DataFrame({
+        'site_id': lines['site_id'].values,
+        'material_id': lines['material_id'].values,
+        'quantity_remaining': lines['quantity'].values,
+        'unit_cost': lines['unit_cost'].values,
+        'received_at': lines['received_at'].dt.to_pydatetime(),
+        'transaction_id': transaction_ids
+    }).astype(object).to_dict('records'))
+
+    now = datetime.utcnow()
+    existing = diff[diff['stock_level_id'].notna()]
+    if len(existing):
+        db.session.execute(update(StockLevel), [
+            {'id': int(stock_level_id), 'quantity': quantity, 'total_value': total_value, 'updated_at': now}
+            for stock_level_id, quantity, total_value
+            in zip(existing['stock_level_id'], existing['new_quantity'], existing['new_value'])
+        ])
+    created = diff[diff['stock_level_id'].isna()]
+    if len(created):
+        db.session.execute(insert(StockLevel), [
+            {'site_id': int(site_id), 'material_id': int(material_id), 'quantity': quantity,
+             'total_value': total_value, 'updated_at': now}
+            for site_id, material_id, quantity, total_value
+            in zip(created['site_id'], created['material_id'], created['new_quantity'], created['new_value'])
+        ])
+
+    StockStatusService.refresh_many(zip(
+        diff['site_id'].astype(int), diff['material_id'].astype(int), diff['new_quantity'], diff['minimum_level']
+    ))
+
+    rollup = diff.assign(category=diff['category'].fillna('General')).groupby(['site_id', 'category']).agg(
+        quantity=('opening_quantity', 'sum'), total_value=('opening_value', 'sum')
+    )
+    for (site_id, category), row in rollup.iterrows():
+        ValuationService.apply_delta(int(site_id), category, row['quantity'], row['total_value'])
+
+    activity = lines.groupby('site_id').agg(
+        count=('row', 'count'), quantity=('quantity', 'sum'), total_value=('total_value', 'sum')
+    )
+    for site_id, row in activity.iterrows():
+        ActivityCounterService.record(int(site_id), 'receive', row['quantity'], row['total_value'],
+                                      count=int(row['count']))
+        InventoryService.bump_site_version(int(site_id))
+
+    return count, len(created)
+
+
+class OpeningBalanceService:
+    """Service class for bulk opening balance imports"""
+
+    @staticmethod
+    def plan(path, filename, skip_header=True, default_site=None):
+        """Read and validate an opening balance file and diff it against current stock, without writing"""
+        file_format = import_format(filename)
+        if not file_format:
+            raise ValueError('Invalid file format. Use .xlsx, .xls or .csv files.')
+
+        first_row, df = read_import_frame(path, file_format, OPENING_BALANCE_COLUMNS, skip_header)
+        if 'Quantity' not in df.columns or ('Material' not in df.columns and 'SKU' not in df.columns):
+            raise ValueError('The file must contain "Quantity" and "Material" or "SKU" columns')
+
+        frame = normalize_opening_balances(df, first_row, default_site)
+        lines = frame[frame['error'].isna()].copy()
+        lines['site_id'] = lines['site_id'].astype(int)
+        lines['material_id'] = lines['material_id'].astype(int)
+        lines['total_value'] = lines['quantity'] * lines['unit_cost']
+        errors = frame.loc[frame['error'].notna(), [key for key, _ in ERROR_COLUMNS]]
+
+        return OpeningBalancePlan(lines, OpeningBalanceService.diff(lines), errors)
+
+    @staticmethod
+    def diff(lines, for_update=False):
+        """
+        Current, opening and resulting stock per (site, material) touched by the lines.
+        With for_update the current stock levels stay locked until the transaction ends.
+        """
+        columns = [key for key, _ in DIFF_COLUMNS]
+        if lines.empty:
+            return pd.DataFrame(columns=['site_id', 'material_id'] + columns)
+
+        opening = lines.groupby(['site_id', 'material_id'], sort=False).agg(
+            lines=('row', 'count'),
+            opening_quantity=('quantity', 'sum'),
+            opening_value=('total_value', 'sum')
+        ).reset_index()
+
+        site_ids = opening['site_id'].unique().tolist()
+        stock_query = db.session.query(
+            StockLevel.id, StockLevel.site_id, StockLevel.material_id, StockLevel.quantity, StockLevel.total_value
+        ).filter(StockLevel.site_id.in_(site_ids),
+                 StockLevel.material_id.in_(opening['material_id'].unique().tolist()))
+        if for_update:
+            stock_query = stock_query.with_for_update()
+        current = pd.DataFrame(
+            stock_query.all(),
+            columns=['stock_level_id', 'site_id', 'material_id', 'current_quantity', 'current_value']
+        )
+        names = pd.DataFrame(
+            db.session.query(Material.id, Material.name, Material.sku, Material.unit, Material.category,
+                             Material.minimum_level).all(),
+            columns=['material_id', 'material_name', 'sku', 'unit', 'category', 'minimum_level']
+        )
+        sites = pd.DataFrame(db.session.query(Site.id, Site.name).filter(Site.id.in_(site_ids)).all(),
+                             columns=['site_id', 'site_name'])
+
+        diff = opening.merge(current, on=['site_id', 'material_id'], how='left')
+        diff = diff.merge(names, on='material_id', how='left').merge(sites, on='site_id', how='left')
+        diff['current_quantity'] = diff['current_quantity'].fillna(0.0)
+        diff['current_value'] = diff['current_value'].fillna(0.0)
+        diff['new_quantity'] = diff['current_quantity'] + diff['opening_quantity']
+        diff['new_value'] = diff['current_value'] + diff['opening_value']
+        diff['change'] = np.where(diff['stock_level_id'].isna(), 'new stock level', 'adds to existing stock')
+        return diff.sort_values(['site_name', 'material_name'], kind='stable').reset_index(drop=True)
+
+    @staticmethod
+    def apply(plan, created_by):
+        """
+        Write a plan's lines as receive transactions, FIFO layers and stock levels in
+        one database transaction; returns the number of transactions recorded
+        """
+        lines, diff = plan.lines, plan.diff
+        if lines.empty:
+            return 0
+
+        try:
+            notes = OPENING_BALANCE_NOTE + ', received ' + lines['received_at'].dt.strftime('%Y-%m-%d')
+            count, created = post_receipts(lines, diff, created_by, notes)
+            db.session.commit()
+
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error importing opening balances: {str(e)}")
+            raise
+
+        logging.info(f"Opening balances imported: {count} lines into {len(diff)} stock levels "
+                     f"({created} new)")
+        return count
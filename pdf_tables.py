@@ -0,0 +1,74 @@
+"""
+Chunked PDF Tables
+Renders long tables as a sequence of page-sized reportlab Tables with repeated
+headers, so layout cost grows linearly with the number of rows
+"""
+
+from itertools import islice
+
+from reportlab.platypus import Table, TableStyle
+
+# Rows per Table flowable; roughly one A4 page of body rows
+ROWS_PER_CHUNK = 45
+
+# Flowables kept ahead of the layout engine when feeding a story lazily
+STORY_LOOKAHEAD = 4
+
+
+def iter_chunks(rows, size):
+    """Yield lists of at most size rows from any iterable"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_chunked_tables(headers, rows, col_widths=None, style_commands=None, row_background=None,
+                        rows_per_chunk=ROWS_PER_CHUNK):
+    """
+    Yield one Table per chunk of rows. Every chunk starts with the header row
+    (repeated again if the chunk itself splits across pages), and style commands
+    are applied per chunk, so no TableStyle ever spans the full data set.
+    row_background is an optional callable returning a background colour for a row.
+    """
+    style_commands = style_commands or []
+    for chunk in iter_chunks(rows, rows_per_chunk):
+        commands = list(style_commands)
+        if row_background:
+            for index, row in enumerate(chunk, 1):
+                background = row_background(row)
+                if background is not None:
+                    commands.append(('BACKGROUND', (0, index), (-1, index), background))
+
+        table = Table([headers] + chunk, colWidths=col_widths, repeatRows=1)
+        table.setStyle(TableStyle(commands))
+        yield table
+
+
+class FlowableStream(list):
+    """
+    A story list that refills itself from an iterator as the document template
+    consumes it, so only a few chunk tables exist at any time during doc.build().
+    This depends on reportlab's build loop calling len() on the story before each
+    flowable is taken off its front, which holds for the reportlab versions allowed
+    in pyproject.toml; pdf_tables_test.py fails if a release consumes it differently.
+    """
+
+    def __init__(self, flowables, lookahead=STORY_LOOKAHEAD):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+        self._fill()
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
@@ -0,0 +1,162 @@
+"""
+Receipt Bundles
+Builds ZIPs of goods received vouchers for a site and date range. Stored receipts
+are copied as-is; missing ones are rendered in a process pool and streamed into
+the ZIP as they complete.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from itertools import chain
+import io
+import logging
+import multiprocessing
+import os
+import zipfile
+
+from sqlalchemy.orm import joinedload
+
+from models_new import Transaction
+from receipt_generator import get_receipt_generator, render_receipt_payload
+from receipt_store import ReceiptStore, receipt_payload, receipt_filename
+
+# Receipt rendering processes; bundles smaller than POOL_MIN_RECEIPTS render inline
+RECEIPT_RENDER_WORKERS = int(os.environ.get('RECEIPT_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+POOL_MIN_RECEIPTS = 8
+
+# Receipts submitted to the pool ahead of the ZIP writer, per worker
+IN_FLIGHT_PER_WORKER = 4
+
+QUERY_BATCH_SIZE = 500
+
+
+def iter_receipt_transactions(site_id=None, start_date=None, end_date=None, batch_size=QUERY_BATCH_SIZE):
+    """Stream receive transactions with their site, material and creator loaded in the same query"""
+    query = Transaction.query.options(
+        joinedload(Transaction.site),
+        joinedload(Transaction.material),
+        joinedload(Transaction.creator_user),
+        joinedload(Transaction.receipt_document)
+    ).filter(Transaction.type == 'receive')
+
+    if site_id:
+        query = query.filter(Transaction.site_id == site_id)
+    if start_date:
+        query = query.filter(Transaction.created_at >= datetime.combine(start_date, datetime.min.time()))
+    if end_date:
+        query = query.filter(Transaction.created_at <= datetime.combine(end_date, datetime.max.time()))
+
+    return query.order_by(Transaction.created_at, Transaction.id).yield_per(batch_size)
+
+
+def _read_stored(payload):
+    with open(payload['stored_path'], 'rb') as f:
+        return f.read()
+
+
+def render_receipts(payloads, workers=RECEIPT_RENDER_WORKERS):
+    """
+    Yield (payload, pdf_bytes) for each payload as it becomes available. Stored
+    receipts are read from disk; the rest are rendered, in a process pool for larger
+    bundles. Only a bounded number of receipts are in flight, so any number of
+    payloads can be streamed. pdf_bytes is None when rendering failed.
+    """
+    payloads = iter(payloads)
+    first = []
+    for payload in payloads:
+        if payload.get('stored_path'):
+            yield payload, _read_stored(payload)
+            continue
+        first.append(payload)
+        if len(first) >= POOL_MIN_RECEIPTS:
+            break
+
+    if workers <= 1 or len(first) < POOL_MIN_RECEIPTS:
+        for payload in chain(first, payloads):
+            if payload.get('stored_path'):
+                yield payload, _read_stored(payload)
+            else:
+                yield payload, render_receipt_payload(payload)[1]
+        return
+
+    max_in_flight = workers * IN_FLIGHT_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as executor:
+        pending = {executor.submit(render_receipt_payload, payload): payload for payload in first}
+        exhausted = False
+        while pending:
+            while not exhausted and len(pending) < max_in_flight:
+                payload = next(payloads, None)
+                if payload is None:
+                    exhausted = True
+                elif payload.get('stored_path'):
+                    yield payload, _read_stored(payload)
+                else:
+                    pending[executor.submit(render_receipt_payload, payload)] = payload
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()[1]
+
+
+def _pool_context():
+    """
+    Prefer fork: spawn/forkserver re-import the parent's main module, which for the
+    web app and report worker would initialise the database in every render process.
+    Render processes only receive plain payloads and never touch the database.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+class _ZipSink(io.RawIOBase):
+    """Unseekable write target that collects ZIP output until it is drained"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_receipts_zip(payloads, workers=RECEIPT_RENDER_WORKERS, on_rendered=None):
+    """
+    Yield a ZIP archive of receipts in chunks, adding each receipt as soon as it is ready.
+    on_rendered(payload, pdf_bytes) is called for every freshly rendered receipt.
+    """
+    sink = _ZipSink()
+    count = 0
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for payload, pdf_data in render_receipts(payloads, workers):
+            if pdf_data is None:
+                continue
+            if on_rendered and not payload.get('stored_path'):
+                on_rendered(payload, pdf_data)
+            zip_file.writestr(payload['filename'], pdf_data)
+            count += 1
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    yield sink.drain()
+    logging.info(f"Receipt bundle written with {count} receipts")
+
+
+def iter_receipt_payloads(company_settings, site_id=None, start_date=None, end_date=None):
+    """Build receipt payloads for every receive transaction matching the filters"""
+    generator = get_receipt_generator()
+    for transaction in iter_receipt_transactions(site_id, start_date, end_date):
+        stored_path = ReceiptStore.stored_path(transaction.receipt_document)
+        if stored_path:
+            yield {'transaction_id': transaction.id, 'filename': receipt_filename(transaction), 'stored_path': stored_path}
+        else:
+            yield receipt_payload(transaction, company_settings, generator)
@@ -7,53 +7,138 @@ from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from datetime import datetime
 from io import BytesIO
 import os
+import logging
+import re
+
+# Built once per process: getSampleStyleSheet() and the ParagraphStyles derived from it
+# are read-only during rendering, so every receipt shares them
+_SAMPLE_STYLES = getSampleStyleSheet()
+
+TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_SAMPLE_STYLES['Heading1'],
+    fontSize=20,
+    textColor=colors.HexColor('#2c3e50'),
+    alignment=TA_CENTER,
+    spaceAfter=30,
+    fontName='Helvetica-Bold'
+)
+
+HEADER_STYLE = ParagraphStyle(
+    'CustomHeader',
+    parent=_SAMPLE_STYLES['Heading2'],
+    fontSize=14,
+    textColor=colors.HexColor('#34495e'),
+    alignment=TA_LEFT,
+    spaceAfter=12,
+    fontName='Helvetica-Bold'
+)
+
+NORMAL_STYLE = ParagraphStyle(
+    'CustomNormal',
+    parent=_SAMPLE_STYLES['Normal'],
+    fontSize=11,
+    textColor=colors.HexColor('#2c3e50'),
+    alignment=TA_LEFT,
+    spaceAfter=6
+)
+
+RIGHT_ALIGN_STYLE = ParagraphStyle(
+    'RightAlign',
+    parent=_SAMPLE_STYLES['Normal'],
+    fontSize=11,
+    textColor=colors.HexColor('#2c3e50'),
+    alignment=TA_RIGHT,
+    spaceAfter=6
+)
+
+# Table styles do not depend on the receipt contents
+HEADER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ecf0f1')),
+    ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#ecf0f1')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2c3e50')),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
+])
+
+MATERIAL_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#2c3e50')),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
+])
+
+SUPPLIER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ecf0f1')),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2c3e50')),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+])
+
+SIGNATURE_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2c3e50')),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LINEBELOW', (0, 3), (1, 3), 1, colors.HexColor('#2c3e50')),
+    ('LINEBELOW', (2, 3), (3, 3), 1, colors.HexColor('#2c3e50'))
+])
+
+# Supplier fields written into transaction notes as "Keyword: value". A value ends at the
+# end of its line or at the next field keyword, so several fields can share one line.
+# "Ref:" is accepted as a short form of "Reference:"
+SUPPLIER_FIELD_PATTERN = re.compile(
+    r'\b(supplier|contact|reference|ref):(.*?)(?=\b(?:supplier|contact|reference|ref):|\n|$)', re.IGNORECASE
+)
+SUPPLIER_FIELDS = {'supplier': 'name', 'contact': 'contact', 'reference': 'reference', 'ref': 'ref'}
+
+
+def parse_supplier_info(notes):
+    """Extract supplier name, contact and reference from transaction notes in one pass, or None if there are none"""
+    if not notes:
+        return None
+
+    supplier_info = {}
+    for match in SUPPLIER_FIELD_PATTERN.finditer(notes):
+        # Separators before a following field ("ACME, Contact: ...") are not part of the value
+        supplier_info.setdefault(SUPPLIER_FIELDS[match.group(1).lower()], match.group(2).strip(' \t,;|'))
+
+    ref = supplier_info.pop('ref', None)
+    if ref is not None:
+        supplier_info.setdefault('reference', ref)
+
+    return supplier_info or None
+
 
 class ReceiptGenerator:
     """Generate professional goods received vouchers for material transactions"""
     
     def __init__(self):
-        self.styles = getSampleStyleSheet()
+        self.styles = _SAMPLE_STYLES
         self.setup_custom_styles()
     
     def setup_custom_styles(self):
-        """Setup custom paragraph styles for the receipt"""
-        self.title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=self.styles['Heading1'],
-            fontSize=20,
-            textColor=colors.HexColor('#2c3e50'),
-            alignment=TA_CENTER,
-            spaceAfter=30,
-            fontName='Helvetica-Bold'
-        )
-        
-        self.header_style = ParagraphStyle(
-            'CustomHeader',
-            parent=self.styles['Heading2'],
-            fontSize=14,
-            textColor=colors.HexColor('#34495e'),
-            alignment=TA_LEFT,
-            spaceAfter=12,
-            fontName='Helvetica-Bold'
-        )
-        
-        self.normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=self.styles['Normal'],
-            fontSize=11,
-            textColor=colors.HexColor('#2c3e50'),
-            alignment=TA_LEFT,
-            spaceAfter=6
-        )
-        
-        self.right_align_style = ParagraphStyle(
-            'RightAlign',
-            parent=self.styles['Normal'],
-            fontSize=11,
-            textColor=colors.HexColor('#2c3e50'),
-            alignment=TA_RIGHT,
-            spaceAfter=6
-        )
+        """Use the module-level paragraph styles for the receipt"""
+        self.title_style = TITLE_STYLE
+        self.header_style = HEADER_STYLE
+        self.normal_style = NORMAL_STYLE
+        self.right_align_style = RIGHT_ALIGN_STYLE
     
     def generate_receipt(self, transaction_data, site_data, user_data, company_settings=None):
         """Generate a goods received voucher PDF"""
@@ -86,18 +171,7 @@ class ReceiptGenerator:
         ]
         
         header_table = Table(header_data, colWidths=[1.5*inch, 2.5*inch, 1.5*inch, 2*inch])
-        header_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ecf0f1')),
-            ('BACKGROUND', (2, 0), (2, -1), colors.HexColor('#ecf0f1')),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2c3e50')),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('FONTNAME', (2, 0), (2, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ROWBACKGROUNDS', (0, 0), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-        ]))
+        header_table.setStyle(HEADER_TABLE_STYLE)
         
         story.append(header_table)
         story.append(Spacer(1, 30))
@@ -118,19 +192,7 @@ class ReceiptGenerator:
         ]
         
         material_table = Table(material_data, colWidths=[2*inch, 1*inch, 0.8*inch, 1*inch, 1.2*inch, 1.5*inch])
-        material_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#2c3e50')),
-            ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f8f9fa')])
-        ]))
+        material_table.setStyle(MATERIAL_TABLE_STYLE)
         
         story.append(material_table)
         story.append(Spacer(1, 30))
@@ -145,16 +207,7 @@ class ReceiptGenerator:
             ]
             
             supplier_table = Table(supplier_data, colWidths=[2*inch, 4.5*inch])
-            supplier_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ecf0f1')),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2c3e50')),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7')),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-            ]))
+            supplier_table.setStyle(SUPPLIER_TABLE_STYLE)
             
             story.append(supplier_table)
             story.append(Spacer(1, 30))
@@ -176,14 +229,7 @@ class ReceiptGenerator:
         ]
         
         signature_table = Table(signature_data, colWidths=[2*inch, 1.5*inch, 2*inch, 1.5*inch])
-        signature_table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#2c3e50')),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LINEBELOW', (0, 3), (1, 3), 1, colors.HexColor('#2c3e50')),
-            ('LINEBELOW', (2, 3), (3, 3), 1, colors.HexColor('#2c3e50'))
-        ]))
+        signature_table.setStyle(SIGNATURE_TABLE_STYLE)
         
         story.append(signature_table)
         story.append(Spacer(1, 30))
@@ -213,28 +259,33 @@ class ReceiptGenerator:
         }
     
     def _extract_supplier_info(self, transaction):
-        """Extract supplier information from transaction notes or supporting documents"""
-        # This could be enhanced to parse supplier info from notes or linked documents
-        supplier_info = {}
-        
-        if transaction.notes:
-            # Try to extract supplier info from notes using common patterns
-            notes_lower = transaction.notes.lower()
-            if 'supplier:' in notes_lower:
-                # Extract supplier name after "supplier:" keyword
-                start = notes_lower.find('supplier:') + 9
-                end = notes_lower.find('\n', start) if '\n' in notes_lower[start:] else len(notes_lower)
-                supplier_info['name'] = transaction.notes[start:end].strip()
-            
-            if 'contact:' in notes_lower:
-                start = notes_lower.find('contact:') + 8
-                end = notes_lower.find('\n', start) if '\n' in notes_lower[start:] else len(notes_lower)
-                supplier_info['contact'] = transaction.notes[start:end].strip()
-            
-            if 'ref:' in notes_lower or 'reference:' in notes_lower:
-                keyword = 'reference:' if 'reference:' in notes_lower else 'ref:'
-                start = notes_lower.find(keyword) + len(keyword)
-                end = notes_lower.find('\n', start) if '\n' in notes_lower[start:] else len(notes_lower)
-                supplier_info['reference'] = transaction.notes[start:end].strip()
-        
-        return supplier_info if supplier_info else None
\ No newline at end of file
+        """Extract supplier information from transaction notes"""
+        return parse_supplier_info(transaction.notes)
+
+
+# Long-lived renderer shared by everything in this process, including pool workers
+_receipt_generator = None
+
+
+def get_receipt_generator():
+    """Get this process's shared ReceiptGenerator"""
+    global _receipt_generator
+    if _receipt_generator is None:
+        _receipt_generator = ReceiptGenerator()
+    return _receipt_generator
+
+
+def render_receipt_payload(payload):
+    """
+    Render one receipt from a plain-data payload (see receipt_bundle.receipt_payload).
+    Module-level and free of database access so it can run in a process pool.
+    Returns (filename, pdf_bytes), or (filename, None) if rendering failed.
+    """
+    try:
+        pdf_buffer = get_receipt_generator().generate_receipt(
+            payload['transaction_data'], payload['site_data'], payload['user_data'], payload['company_settings']
+        )
+        return payload['filename'], pdf_buffer.getvalue()
+    except Exception as e:
+        logging.error(f"Error generating receipt {payload['filename']}: {str(e)}")
+        return payload['filename'], None
@@ -0,0 +1,215 @@
+"""
+Receipt Store
+Goods received vouchers never change once their transaction exists, so each one is
+rendered once, written to disk under its SHA-256 content hash and recorded in
+receipt_documents. Downloads and ZIP bundles serve the stored bytes.
+"""
+
+from datetime import datetime
+import hashlib
+import logging
+import os
+import tempfile
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models_new import Transaction, SystemSettings, ReceiptDocument
+from receipt_generator import get_receipt_generator, render_receipt_payload
+
+# Bump when the receipt layout changes; 'flask --app main rerender-receipts' then
+# re-renders every stored receipt with an older layout version
+RECEIPT_LAYOUT_VERSION = 1
+
+# Receipts rendered per pass of the background pre-renderer
+PRERENDER_BATCH_SIZE = 50
+
+
+def receipt_company_settings():
+    """Company name and currency printed on receipts"""
+    system_settings = SystemSettings.query.first()
+    return {
+        'company_name': system_settings.company_name if system_settings else 'Construction Company',
+        'currency': system_settings.currency if system_settings else 'ZMW'
+    }
+
+
+def receipt_filename(transaction):
+    return f"Receipt_{transaction.serial_number}_{transaction.created_at.strftime('%Y%m%d')}.pdf"
+
+
+def receipt_payload(transaction, company_settings, generator):
+    """Snapshot everything a receipt needs into plain data that can cross process boundaries"""
+    return {
+        'transaction_id': transaction.id,
+        'filename': receipt_filename(transaction),
+        'transaction_data': generator.extract_transaction_data(transaction),
+        'site_data': {
+            'name': transaction.site.name,
+            'location': transaction.site.location or 'N/A',
+            'code': transaction.site.code or 'N/A'
+        },
+        'user_data': {
+            'username': transaction.creator_user.username if transaction.creator_user else 'Unknown',
+            'role': transaction.creator_user.role if transaction.creator_user else 'Unknown'
+        },
+        'company_settings': company_settings
+    }
+
+
+class ReceiptStore:
+    """Service class for the content-addressed receipt store"""
+
+    @staticmethod
+    def blob_path(sha256):
+        return os.path.join(app.config['RECEIPT_STORE_FOLDER'], sha256[:2], f"{sha256}.pdf")
+
+    @staticmethod
+    def write_blob(pdf_data):
+        """Write receipt bytes under their content hash; returns (sha256, size)"""
+        sha256 = hashlib.sha256(pdf_data).hexdigest()
+        path = ReceiptStore.blob_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    tmp_file.write(pdf_data)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return sha256, len(pdf_data)
+
+    @staticmethod
+    def record(transaction_id, sha256, size_bytes, layout_version=RECEIPT_LAYOUT_VERSION):
+        """Record the stored receipt of a transaction in the current transaction; returns the previous hash"""
+        document = ReceiptDocument.query.filter_by(transaction_id=transaction_id).first()
+        previous_sha256 = document.sha256 if document else None
+        if not document:
+            document = ReceiptDocument(transaction_id=transaction_id)
+            db.session.add(document)
+        document.sha256 = sha256
+        document.size_bytes = size_bytes
+        document.layout_version = layout_version
+        document.rendered_at = datetime.utcnow()
+        return previous_sha256
+
+    @staticmethod
+    def record_new(transaction_id, sha256, size_bytes):
+        """
+        Record a newly rendered receipt in a savepoint. Returns False when another
+        worker recorded the transaction's receipt first; that record is kept.
+        """
+        try:
+            with db.session.begin_nested():
+                ReceiptStore.record(transaction_id, sha256, size_bytes)
+        except IntegrityError:
+            return False
+        return True
+
+    @staticmethod
+    def stored_path(document):
+        """Get the file of a recorded receipt, or None if it is missing from disk"""
+        if not document:
+            return None
+        path = ReceiptStore.blob_path(document.sha256)
+        return path if os.path.exists(path) else None
+
+    @staticmethod
+    def render(transaction, company_settings=None, generator=None):
+        """Render a receipt for a transaction and return the PDF bytes"""
+        payload = receipt_payload(
+            transaction, company_settings or receipt_company_settings(), generator or get_receipt_generator()
+        )
+        _, pdf_data = render_receipt_payload(payload)
+        if pdf_data is None:
+            raise ValueError(f"Could not render receipt for {transaction.serial_number}")
+        return pdf_data
+
+    @staticmethod
+    def get_or_render(transaction):
+        """Get the stored receipt file of a receive transaction, rendering and storing it on first use"""
+        path = ReceiptStore.stored_path(transaction.receipt_document)
+        if path:
+            return path
+
+        sha256, size_bytes = ReceiptStore.write_blob(ReceiptStore.render(transaction))
+        # When the pre-renderer stored it meanwhile, the file just written is served all the same
+        ReceiptStore.record_new(transaction.id, sha256, size_bytes)
+        db.session.commit()
+        return ReceiptStore.blob_path(sha256)
+
+    @staticmethod
+    def prerender_missing(limit=PRERENDER_BATCH_SIZE, after_id=0):
+        """
+        Render and store receipts for receive transactions after after_id that have none
+        yet. Returns (stored, last_id): last_id is the last transaction tried, or None when
+        there are none left. Callers continue from last_id, so receipts that fail to
+        render are not picked again on every pass; they are still rendered on download.
+        """
+        transactions = Transaction.query.outerjoin(
+            ReceiptDocument, ReceiptDocument.transaction_id == Transaction.id
+        ).filter(
+            Transaction.type == 'receive',
+            Transaction.id > after_id,
+            ReceiptDocument.id.is_(None)
+        ).order_by(Transaction.id).limit(limit).all()
+
+        if not transactions:
+            return 0, None
+
+        company_settings = receipt_company_settings()
+        generator = get_receipt_generator()
+        stored = 0
+        for transaction in transactions:
+            try:
+                sha256, size_bytes = ReceiptStore.write_blob(
+                    ReceiptStore.render(transaction, company_settings, generator)
+                )
+                if ReceiptStore.record_new(transaction.id, sha256, size_bytes):
+                    stored += 1
+            except Exception as e:
+                logging.error(f"Error pre-rendering receipt for {transaction.serial_number}: {str(e)}")
+        db.session.commit()
+
+        logging.info(f"Pre-rendered {stored} of {len(transactions)} receipts")
+        return stored, transactions[-1].id
+
+    @staticmethod
+    def rerender(all_documents=False, batch_size=PRERENDER_BATCH_SIZE):
+        """
+        Re-render stored receipts after a layout change. Only receipts with an older
+        layout version are re-rendered unless all_documents is set.
+        Returns the number of receipts re-rendered.
+        """
+        query = ReceiptDocument.query
+        if not all_documents:
+            query = query.filter(ReceiptDocument.layout_version < RECEIPT_LAYOUT_VERSION)
+        document_ids = [document_id for (document_id,) in query.with_entities(ReceiptDocument.id).all()]
+
+        company_settings = receipt_company_settings()
+        generator = get_receipt_generator()
+        count = 0
+        for start in range(0, len(document_ids), batch_size):
+            stale_blobs = set()
+            for document in ReceiptDocument.query.filter(ReceiptDocument.id.in_(document_ids[start:start + batch_size])).all():
+                sha256, size_bytes = ReceiptStore.write_blob(
+                    ReceiptStore.render(document.transaction, company_settings, generator)
+                )
+                previous_sha256 = ReceiptStore.record(document.transaction_id, sha256, size_bytes)
+                if previous_sha256 and previous_sha256 != sha256:
+                    stale_blobs.add(previous_sha256)
+                count += 1
+            db.session.commit()
+
+            # Remove superseded files no other receipt points at
+            for sha256 in stale_blobs:
+                if not ReceiptDocument.query.filter_by(sha256=sha256).first():
+                    path = ReceiptStore.blob_path(sha256)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        logging.info(f"Re-rendered {count} receipts")
+        return count
@@ -0,0 +1,116 @@
+"""
+Report Artifact Cache
+Persists generated report files on disk so repeated downloads are served from the file
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+# Bump when the layout of a rendered report changes, so files cached for closed periods are rebuilt
+REPORT_LAYOUT_VERSION = 1
+
+
+class ReportArtifactCache:
+    """Content cache of rendered report files with size-bounded LRU eviction"""
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(report_type, site_id, start_date, end_date, report_format, currency, company_name=None,
+                 high_water_mark=None, catalog_version=None):
+        """
+        Build a cache key for a report. high_water_mark is only set for live
+        periods (the ledger can still grow); closed periods only change with the
+        report layout or the material and site names printed on them (catalog_version).
+        """
+        parts = {
+            'report_type': report_type,
+            'site_id': site_id,
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None,
+            'format': report_format,
+            'currency': currency,
+            'company_name': company_name,
+            'high_water_mark': high_water_mark,
+            'catalog_version': catalog_version,
+            'layout_version': REPORT_LAYOUT_VERSION
+        }
+        digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        extension = {'excel': 'xlsx', 'csv': 'csv', 'zip': 'zip'}.get(report_format, 'pdf')
+        return f"{report_type}_{digest[:32]}.{extension}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Return the path of a cached artifact, or None when it is not cached"""
+        path = self._path(key)
+        try:
+            os.utime(path)  # Mark as recently used for LRU eviction
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, buffer):
+        """Write a report buffer to the cache atomically and return its path"""
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(buffer.getvalue())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+        return path
+
+    def temp_path(self):
+        """Reserve a temporary file in the cache directory for rendering a report into"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        return tmp_path
+
+    def put_file(self, key, tmp_path):
+        """Move a report rendered with temp_path() into the cache and return its path"""
+        path = self._path(key)
+        try:
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove least recently used artifacts until the cache fits in max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"Could not evict cached report {path}: {str(e)}")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Report Cache Key Test
+Cached report files are keyed so that a report is served from the cache only
+while what it shows cannot have changed: closed periods by their dates, live
+periods by the ledger high-water mark, and both by the layout and catalog
+versions. A period is closed by the ledger's business date (UTC), whatever the
+server's local time zone. Precomputed downloads follow the catalog version.
+
+Run with: python report_cache_test.py
+"""
+
+from datetime import date, timedelta
+import os
+import time
+
+from app import app, db
+from models_new import Material, Site, User
+from inventory_service import InventoryService
+from activity_counters import business_date_today
+import report_cache
+from report_cache import ReportArtifactCache
+from report_jobs import ReportJobService
+from static_artifacts import StaticArtifactService
+
+
+def _receive(site_id):
+    """Write one receive transaction to the site's ledger"""
+    user = User.query.filter_by(username='engineer1').first()
+    material = Material.query.order_by(Material.id).first()
+    InventoryService.receive_material(site_id, material.id, 1, 1.0, created_by=user.id)
+
+
+def _key(job_type, report_format='pdf', **params):
+    params = {name: value.isoformat() if isinstance(value, date) else value for name, value in params.items()}
+    return ReportJobService.describe(job_type, params, report_format)[0]
+
+
+def _live_keys(site_id):
+    """Keys of the reports showing the current state of a site"""
+    today = business_date_today()
+    return {
+        'daily_issues': _key('daily_issues', site_id=site_id, report_date=today),
+        'stock_summary': _key('stock_summary', site_id=site_id),
+        'transaction_history': _key('transaction_history', site_id=site_id, start_date=today, end_date=today),
+        'consolidated_stock': _key('consolidated_stock'),
+        'receipts_zip': _key('receipts_zip', 'zip', site_id=site_id, start_date=today, end_date=today),
+    }
+
+
+def _closed_keys(site_id):
+    """Keys of the reports for the previous business day"""
+    yesterday = business_date_today() - timedelta(days=1)
+    return {
+        'daily_issues': _key('daily_issues', site_id=site_id, report_date=yesterday),
+        'transaction_history': _key('transaction_history', site_id=site_id, start_date=yesterday, end_date=yesterday),
+        'receipts_zip': _key('receipts_zip', 'zip', site_id=site_id, start_date=yesterday, end_date=yesterday),
+    }
+
+
+def _changed(before, after):
+    return {name for name in before if before[name] != after[name]}
+
+
+def test_periods_close_on_the_ledger_business_date():
+    # A server 23 hours ahead of UTC, where the local date is a day past the ledger's
+    # except in the first hour of the UTC day
+    local_tz = os.environ.get('TZ')
+    os.environ['TZ'] = 'AHEAD-23'
+    time.tzset()
+    try:
+        with app.app_context():
+            site_id = Site.query.order_by(Site.id).first().id
+
+            print("1. A ledger write moves every live report key...")
+            live, closed = _live_keys(site_id), _closed_keys(site_id)
+            _receive(site_id)
+            assert _changed(live, _live_keys(site_id)) == set(live)
+            print("✓ " + ", ".join(sorted(live)))
+
+            print("2. ...and no closed-period key...")
+            assert not _changed(closed, _closed_keys(site_id))
+            print("✓ " + ", ".join(sorted(closed)) + " unchanged")
+    finally:
+        if local_tz is None:
+            os.environ.pop('TZ')
+        else:
+            os.environ['TZ'] = local_tz
+        time.tzset()
+
+
+def test_catalog_and_layout_versions():
+    with app.app_context():
+        site_id = Site.query.order_by(Site.id).first().id
+
+        print("3. A catalog edit moves live and closed report keys and the catalog download...")
+        live, closed = _live_keys(site_id), _closed_keys(site_id)
+        catalog_version = StaticArtifactService.version('material_catalog')
+        template_version = StaticArtifactService.version('material_template')
+        InventoryService.bump_catalog_version()
+        db.session.commit()
+        assert _changed(live, _live_keys(site_id)) == set(live)
+        assert _changed(closed, _closed_keys(site_id)) == set(closed)
+        assert StaticArtifactService.version('material_catalog') != catalog_version
+        assert StaticArtifactService.version('material_template') == template_version
+        print("✓ All report keys and the catalog version moved; the upload template did not")
+
+        print("4. A write at another site only moves the company-wide key...")
+        other = Site(name='Report Cache Other Site', code='RCOTHER')
+        db.session.add(other)
+        db.session.commit()
+        live = _live_keys(site_id)
+        _receive(other.id)
+        assert _changed(live, _live_keys(site_id)) == {'consolidated_stock'}
+        print("✓ consolidated_stock moved alone")
+
+    print("5. Bumping the layout version moves closed-period keys...")
+    closed_key = ReportArtifactCache.make_key('transaction_history', 1, date(2020, 1, 1), date(2020, 1, 31), 'pdf', 'ZMW')
+    layout_version = report_cache.REPORT_LAYOUT_VERSION
+    report_cache.REPORT_LAYOUT_VERSION += 1
+    try:
+        assert ReportArtifactCache.make_key(
+            'transaction_history', 1, date(2020, 1, 1), date(2020, 1, 31), 'pdf', 'ZMW'
+        ) != closed_key
+    finally:
+        report_cache.REPORT_LAYOUT_VERSION = layout_version
+    print("✓ Key moved")
+
+
+if __name__ == '__main__':
+    test_periods_close_on_the_ledger_business_date()
+    test_catalog_and_layout_versions()
+    print("All report cache checks passed")
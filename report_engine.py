@@ -0,0 +1,412 @@
+"""
+Report Engine
+Each report is a declarative dataset: one query that returns a columnar pandas frame,
+the columns to show and the figures summarising it. The PDF, Excel and CSV renderers
+all consume the same frame, so a single fetch can feed several output formats and a
+new format never needs its own query code.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from itertools import chain
+import logging
+
+import numpy as np
+import pandas as pd
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+from app import db
+from models_new import Site, SystemSettings
+from inventory_service import InventoryService, ReportService
+from enhanced_report_generator import ProfessionalReportGenerator
+from pdf_tables import FlowableStream
+from report_frames import read_frame, plain_records, format_amounts, format_currency, fill_missing
+from streaming_excel import StreamingExcelWriter
+
+# Value kinds; each renderer decides how to present them
+TEXT = 'text'
+NUMBER = 'number'
+COUNT = 'count'
+CURRENCY = 'currency'
+DATE = 'date'
+DATETIME = 'datetime'
+TIME = 'time'
+
+# key is the frame column; pdf=False keeps wide columns (notes etc.) out of the PDF table
+ReportColumn = namedtuple('ReportColumn', ['key', 'header', 'kind', 'pdf'], defaults=(TEXT, True))
+
+REPORT_FORMATS = ['pdf', 'excel', 'csv']
+REPORT_EXTENSIONS = {'pdf': 'pdf', 'excel': 'xlsx', 'csv': 'csv'}
+
+PDF_DATE_FORMATS = {DATE: '%d/%m/%Y', DATETIME: '%d/%m/%Y %H:%M', TIME: '%H:%M'}
+EXCEL_DATE_FORMATS = {DATE: 'dd/mm/yyyy', DATETIME: 'dd/mm/yyyy hh:mm', TIME: 'hh:mm'}
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ReportDataset:
+    """
+    A report definition. query(params) returns a SQLAlchemy query whose labelled
+    columns become the frame; derive(frame, params) adds computed columns; info and
+    summary return (label, value, kind) items shown above and below the details.
+    """
+
+    def __init__(self, name, title, section_title, columns, query, derive=None, info=None, summary=None,
+                 empty_message='No data available.'):
+        self.name = name
+        self.title = title
+        self.section_title = section_title
+        self.columns = columns
+        self.query = query
+        self.derive = derive
+        self.info = info
+        self.summary = summary
+        self.empty_message = empty_message
+
+    @property
+    def sheet_title(self):
+        return self.title.title().replace(' Report', '')
+
+
+def _date_range_label(params):
+    start_date, end_date = params.get('start_date'), params.get('end_date')
+    if start_date and end_date:
+        return f"{start_date.strftime('%d/%m/%Y')} to {end_date.strftime('%d/%m/%Y')}"
+    elif start_date:
+        return f"From {start_date.strftime('%d/%m/%Y')}"
+    elif end_date:
+        return f"Until {end_date.strftime('%d/%m/%Y')}"
+    return "All Time"
+
+
+# Daily issues
+
+def _daily_issues_derive(frame, params):
+    frame['quantity'] = frame['quantity'].abs()
+    frame['total_value'] = frame['total_value'].abs()
+    frame['project_code'] = frame['issued_to_project_code'].fillna('N/A')
+    return frame
+
+
+def _daily_issues_info(frame, params):
+    return [
+        ('Site', params['site_name'], TEXT),
+        ('Report Date', params['report_date'], DATE),
+        ('Total Transactions', len(frame), COUNT),
+    ]
+
+
+def _daily_issues_summary(frame, params):
+    total_value = frame['total_value'].sum()
+    return [
+        ('Total Issues', len(frame), COUNT),
+        ('Total Value', total_value, CURRENCY),
+        ('Average Value per Issue', total_value / len(frame) if len(frame) else 0, CURRENCY),
+        ('Unique Materials', frame['material_name'].nunique(), COUNT),
+    ]
+
+
+DAILY_ISSUES = ReportDataset(
+    'daily_issues',
+    'DAILY MATERIAL ISSUES REPORT',
+    'MATERIAL ISSUES DETAILS',
+    [
+        ReportColumn('serial_number', 'Serial Number'),
+        ReportColumn('created_at', 'Time', TIME),
+        ReportColumn('material_name', 'Material'),
+        ReportColumn('quantity', 'Quantity', NUMBER),
+        ReportColumn('unit', 'Unit'),
+        ReportColumn('unit_cost', 'Unit Cost', CURRENCY),
+        ReportColumn('total_value', 'Total Value', CURRENCY),
+        ReportColumn('project_code', 'Project Code'),
+        ReportColumn('notes', 'Notes', pdf=False),
+    ],
+    lambda params: ReportService.daily_issues_query(params['site_id'], params['report_date']),
+    derive=_daily_issues_derive,
+    info=_daily_issues_info,
+    summary=_daily_issues_summary,
+    empty_message='No material issues recorded for this date.'
+)
+
+
+# Stock summary
+
+def _stock_summary_derive(frame, params):
+    quantity = frame['quantity'].fillna(0)
+    total_value = frame['total_value'].fillna(0)
+    minimum_level = frame['minimum_level'].fillna(0)
+    frame['category'] = frame['category'].fillna('N/A')
+    frame['minimum_level'] = minimum_level
+    frame['unit_cost'] = (total_value / quantity.where(quantity > 0)).fillna(0)
+    frame['status'] = np.where(quantity < minimum_level, 'LOW STOCK', 'OK')
+    return frame
+
+
+def _stock_summary_info(frame, params):
+    return [
+        ('Site', params['site_name'], TEXT),
+        ('Report Date', datetime.now(), DATE),
+    ] + _stock_summary_summary(frame, params)[:3]
+
+
+def _stock_summary_summary(frame, params):
+    total_value = frame['total_value'].sum()
+    return [
+        ('Total Materials', len(frame), COUNT),
+        ('Total Stock Value', total_value, CURRENCY),
+        ('Low Stock Items', int((frame['status'] == 'LOW STOCK').sum()), COUNT),
+        ('Average Value per Material', total_value / len(frame) if len(frame) else 0, CURRENCY),
+    ]
+
+
+STOCK_SUMMARY = ReportDataset(
+    'stock_summary',
+    'STOCK SUMMARY REPORT',
+    'CURRENT STOCK LEVELS',
+    [
+        ReportColumn('material_name', 'Material'),
+        ReportColumn('category', 'Category'),
+        ReportColumn('quantity', 'Current Stock', NUMBER),
+        ReportColumn('unit', 'Unit'),
+        ReportColumn('unit_cost', 'Unit Cost', CURRENCY),
+        ReportColumn('total_value', 'Total Value', CURRENCY),
+        ReportColumn('minimum_level', 'Min Level', NUMBER),
+        ReportColumn('status', 'Status'),
+    ],
+    lambda params: InventoryService.iter_stock_summary(params['site_id']),
+    derive=_stock_summary_derive,
+    info=_stock_summary_info,
+    summary=_stock_summary_summary,
+    empty_message='No stock data available for this site.'
+)
+
+
+# Transaction history
+
+def _transaction_history_derive(frame, params):
+    frame['type_label'] = frame['type'].str.upper()
+    frame['project_code'] = frame['project_code'].fillna('N/A')
+    frame['created_by'] = frame['created_by'].fillna('System')
+    return frame
+
+
+def _transaction_history_info(frame, params):
+    type_counts = frame['type'].value_counts()
+    return [
+        ('Site', params['site_name'], TEXT),
+        ('Date Range', _date_range_label(params), TEXT),
+        ('Total Transactions', len(frame), COUNT),
+        ('Receive Transactions', int(type_counts.get('receive', 0)), COUNT),
+        ('Issue Transactions', int(type_counts.get('issue', 0)), COUNT),
+        ('Adjustment Transactions', int(type_counts.get('adjustment', 0)), COUNT),
+    ]
+
+
+def _transaction_history_summary(frame, params):
+    total_value = frame['total_value'].fillna(0)
+    received_value = total_value[(frame['type'] == 'receive') & (total_value > 0)].sum()
+    issued_value = total_value[frame['type'] == 'issue'].abs().sum()
+    return [
+        ('Total Transactions', len(frame), COUNT),
+        ('Materials Received (Value)', received_value, CURRENCY),
+        ('Materials Issued (Value)', issued_value, CURRENCY),
+        ('Net Stock Change (Value)', received_value - issued_value, CURRENCY),
+    ]
+
+
+TRANSACTION_HISTORY = ReportDataset(
+    'transaction_history',
+    'TRANSACTION HISTORY REPORT',
+    'TRANSACTION DETAILS',
+    [
+        ReportColumn('serial_number', 'Serial Number'),
+        ReportColumn('created_at', 'Date', DATETIME),
+        ReportColumn('material_name', 'Material'),
+        ReportColumn('type_label', 'Type'),
+        ReportColumn('quantity', 'Quantity', NUMBER),
+        ReportColumn('unit', 'Unit'),
+        ReportColumn('unit_cost', 'Unit Cost', CURRENCY),
+        ReportColumn('total_value', 'Total Value', CURRENCY),
+        ReportColumn('project_code', 'Project Code'),
+        ReportColumn('created_by', 'Created By', pdf=False),
+        ReportColumn('notes', 'Notes', pdf=False),
+    ],
+    lambda params: InventoryService.iter_transaction_history(
+        params['site_id'], start_date=params.get('start_date'), end_date=params.get('end_date')
+    ),
+    derive=_transaction_history_derive,
+    info=_transaction_history_info,
+    summary=_transaction_history_summary,
+    empty_message='No transactions found for the specified criteria.'
+)
+
+
+DATASETS = {dataset.name: dataset for dataset in [DAILY_ISSUES, STOCK_SUMMARY, TRANSACTION_HISTORY]}
+
+
+# Renderers
+
+def _is_missing(value):
+    return value is None or (not isinstance(value, str) and pd.isna(value))
+
+
+def _format_pdf_value(value, kind, currency, generator):
+    if _is_missing(value):
+        return 'N/A'
+    if kind == CURRENCY:
+        return generator.format_currency(value, currency)
+    if kind == NUMBER:
+        return f"{value:,.2f}"
+    if kind == COUNT:
+        return f"{int(value):,}"
+    if kind in PDF_DATE_FORMATS:
+        return value.strftime(PDF_DATE_FORMATS[kind])
+    return str(value)
+
+
+def _pdf_column(series, kind, currency):
+    """Format a whole frame column for the PDF table"""
+    if kind == CURRENCY:
+        formatted = format_currency(series, currency)
+    elif kind == NUMBER:
+        formatted = format_amounts(series)
+    elif kind == COUNT:
+        formatted = format_amounts(series, 0)
+    elif kind in PDF_DATE_FORMATS:
+        formatted = series.dt.strftime(PDF_DATE_FORMATS[kind])
+    else:
+        formatted = series.astype(str)
+    return fill_missing(formatted, series)
+
+
+def render_pdf(dataset, frame, params, output):
+    generator = ProfessionalReportGenerator()
+    currency = params['currency']
+    doc = SimpleDocTemplate(output, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=18)
+
+    def info_section(items):
+        return {label: _format_pdf_value(value, kind, currency, generator) for label, value, kind in items}
+
+    story = []
+    generator.add_company_header(story, params['company_name'], dataset.title)
+    if dataset.info:
+        generator.add_report_info_section(story, info_section(dataset.info(frame, params)))
+
+    if frame.empty:
+        story.append(Paragraph(dataset.empty_message, generator.normal_style))
+        generator.add_footer(story, dataset.sheet_title)
+        doc.build(story)
+        return
+
+    columns = [column for column in dataset.columns if column.pdf]
+    formatted = pd.DataFrame({column.key: _pdf_column(frame[column.key], column.kind, currency) for column in columns})
+    rows = (list(row) for row in formatted.itertuples(index=False, name=None))
+    story.append(Paragraph(dataset.section_title, generator.header_style))
+    detail_tables = generator.create_professional_tables(rows, [column.header for column in columns])
+
+    summary_story = []
+    if dataset.summary:
+        summary_story.append(Spacer(1, 30))
+        summary_story.append(Paragraph("SUMMARY", generator.header_style))
+        generator.add_report_info_section(summary_story, info_section(dataset.summary(frame, params)))
+    generator.add_footer(summary_story, dataset.sheet_title)
+
+    doc.build(FlowableStream(chain(story, detail_tables, summary_story)))
+
+
+def render_excel(dataset, frame, params, output):
+    currency_format = f'"{params["currency"]}" #,##0.00'
+    number_formats = {}
+    for index, column in enumerate(dataset.columns):
+        if column.kind == CURRENCY:
+            number_formats[index] = currency_format
+        elif column.kind == NUMBER:
+            number_formats[index] = '#,##0.00'
+        elif column.kind in EXCEL_DATE_FORMATS:
+            number_formats[index] = EXCEL_DATE_FORMATS[column.kind]
+
+    writer = StreamingExcelWriter()
+    writer.add_sheet(
+        dataset.sheet_title,
+        [column.header for column in dataset.columns],
+        plain_records(frame, [column.key for column in dataset.columns]),
+        number_formats=number_formats
+    )
+
+    items = [('Company', params['company_name'], TEXT)]
+    items += dataset.info(frame, params) if dataset.info else []
+    items += dataset.summary(frame, params) if dataset.summary else []
+    items.append(('Generated', datetime.now(), DATETIME))
+
+    summary_rows = []
+    seen = set()
+    for label, value, kind in items:
+        if label in seen:
+            continue
+        seen.add(label)
+        if hasattr(value, 'item'):
+            value = value.item()
+        if kind in EXCEL_DATE_FORMATS:
+            value = value.strftime(PDF_DATE_FORMATS[kind])
+        summary_rows.append((label, value))
+    writer.add_sheet('Summary', ['Metric', 'Value'], summary_rows)
+
+    writer.save(output)
+
+
+def render_csv(dataset, frame, params, output):
+    frame[[column.key for column in dataset.columns]].to_csv(
+        output, index=False, header=[column.header for column in dataset.columns], date_format=CSV_DATE_FORMAT
+    )
+
+
+RENDERERS = {'pdf': render_pdf, 'excel': render_excel, 'csv': render_csv}
+
+
+class ReportEngine:
+    """Service class for fetching report datasets and rendering them"""
+
+    @staticmethod
+    def build_params(site_id, report_date=None, start_date=None, end_date=None):
+        """Build dataset params for a site, with the company name and currency printed on reports"""
+        site = db.session.get(Site, site_id)
+        if not site:
+            raise ValueError(f"Site {site_id} not found")
+
+        system_settings = SystemSettings.query.first()
+        return {
+            'site_id': site.id,
+            'site_name': site.name,
+            'company_name': system_settings.company_name if system_settings else 'Construction Company',
+            'currency': system_settings.currency if system_settings else 'ZMW',
+            'report_date': report_date,
+            'start_date': start_date,
+            'end_date': end_date
+        }
+
+    @staticmethod
+    def fetch_frame(name, params):
+        """Run a report's query once and return its frame with derived columns added"""
+        dataset = DATASETS[name]
+        frame = read_frame(dataset.query(params))
+        if dataset.derive:
+            frame = dataset.derive(frame, params)
+        logging.info(f"Fetched {len(frame)} rows for {name} report")
+        return frame
+
+    @staticmethod
+    def render(name, params, outputs, frame=None):
+        """
+        Render a report into each {format: path} in outputs from one fetch.
+        params holds site_id, site_name, company_name, currency and the report's dates.
+        Returns the frame so callers can render further formats without refetching.
+        """
+        unknown = set(outputs) - set(RENDERERS)
+        if unknown:
+            raise ValueError(f"Unsupported report format: {', '.join(sorted(unknown))}")
+
+        if frame is None:
+            frame = ReportEngine.fetch_frame(name, params)
+        for report_format, output in outputs.items():
+            RENDERERS[report_format](DATASETS[name], frame, params, output)
+        return frame
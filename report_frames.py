@@ -0,0 +1,79 @@
+"""
+Report Frames
+Fetches report queries straight into typed pandas columns and formats columns for
+display, so report rows are never hydrated into ORM objects, Row tuples or dicts
+"""
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Date, DateTime, Float, Integer, Numeric
+
+from app import db
+
+# Rows read from the DBAPI cursor per fetchmany() call
+FETCH_BATCH_SIZE = 5000
+
+CURRENCY_PREFIXES = {'ZMW': 'K', 'USD': '$', 'EUR': '€', 'GBP': '£'}
+
+
+def _column_array(values, sql_type):
+    """Convert one column of raw DBAPI values in a single step based on its SQL type"""
+    if isinstance(sql_type, (Float, Numeric)):
+        return np.array(values, dtype=np.float64)
+    if isinstance(sql_type, Integer):
+        return np.array(values, dtype=np.float64 if None in values else np.int64)
+    if isinstance(sql_type, (DateTime, Date)):
+        # SQLite returns ISO strings, PostgreSQL datetime objects; both parse here
+        return pd.to_datetime(pd.Series(values, dtype=object), format='ISO8601')
+    return np.array(values, dtype=object)
+
+
+def read_frame(query, batch_size=FETCH_BATCH_SIZE):
+    """
+    Run a query and build a DataFrame directly from DBAPI cursor batches. Each column
+    is collected as a plain list and converted once, instead of building a Row (and
+    processing every value) per result row.
+    """
+    names = [description['name'] for description in query.column_descriptions]
+    types = [column.type for column in query.statement.selected_columns]
+
+    # Without stream_results SQLAlchemy leaves the cursor unread, so every row is taken from
+    # it here; server-side cursors would pre-buffer rows into the Result instead
+    result = db.session.connection().execute(query.statement)
+    columns = [[] for _ in names]
+    try:
+        cursor = result.cursor
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for values, batch_values in zip(columns, zip(*rows)):
+                values.extend(batch_values)
+    finally:
+        result.close()
+
+    return pd.DataFrame(
+        {name: _column_array(values, sql_type) for name, values, sql_type in zip(names, columns, types)},
+        columns=names
+    )
+
+
+def format_amounts(series, decimals=2):
+    """Format a numeric column with thousands separators, e.g. 1234.5 -> '1,234.50'"""
+    return series.round(decimals).map(f'{{:,.{decimals}f}}'.format)
+
+
+def format_currency(series, currency='ZMW'):
+    """Format a numeric column as currency the way PDF reports print amounts"""
+    return CURRENCY_PREFIXES.get(currency, f"{currency} ") + format_amounts(series)
+
+
+def fill_missing(formatted, original, placeholder='N/A'):
+    """Replace the formatted values of missing entries with a placeholder"""
+    return formatted.where(original.notna(), placeholder)
+
+
+def plain_records(frame, keys):
+    """Yield row tuples of plain Python values with missing values as None, e.g. for openpyxl"""
+    values = frame[keys].astype(object)
+    return values.where(values.notna(), None).itertuples(index=False, name=None)
@@ -0,0 +1,369 @@
+"""
+Report Job Service
+Renders reports outside the web request: routes queue a ReportJob, the background
+report worker renders it into the report artifact cache, and the browser polls the
+job status and downloads the finished file
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import partial
+import json
+import logging
+import os
+import threading
+
+from sqlalchemy import func, update
+
+from app import app, db
+from models_new import Site, SystemSettings, ReportJob
+from inventory_service import ReportService
+from report_engine import ReportEngine, REPORT_EXTENSIONS
+from consolidated_report import ConsolidatedReportService
+from receipt_bundle import iter_receipt_payloads, iter_receipts_zip
+from receipt_store import ReceiptStore, receipt_company_settings
+from fragment_cache import get_site_version, get_catalog_version
+from activity_counters import business_date_today
+from report_cache import ReportArtifactCache
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+# Seconds between heartbeats of a running job
+HEARTBEAT_SECONDS = 30
+
+# Running jobs without a heartbeat for this long belong to a dead worker and are requeued;
+# the report worker checks periodically, so a job lost to a redeploy is picked up again
+STALE_JOB_MINUTES = 5
+
+report_cache = ReportArtifactCache(app.config['REPORT_CACHE_FOLDER'], app.config['REPORT_CACHE_MAX_BYTES'])
+
+
+def _report_settings():
+    """Get the company name and currency used on reports"""
+    system_settings = SystemSettings.query.first()
+    currency = system_settings.currency if system_settings else 'ZMW'
+    company_name = system_settings.company_name if system_settings else 'Construction Company'
+    return company_name, currency
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _get_site(site_id):
+    site = db.session.get(Site, site_id)
+    if not site:
+        raise ValueError(f"Site {site_id} not found")
+    return site
+
+
+def _build_dataset_report(job_type, params, report_format, cache_key):
+    """Fetch a report dataset and render it straight to a file in the cache directory"""
+    dataset_params = ReportEngine.build_params(
+        params['site_id'],
+        _parse_date(params.get('report_date')),
+        _parse_date(params.get('start_date')),
+        _parse_date(params.get('end_date'))
+    )
+
+    tmp_path = report_cache.temp_path()
+    try:
+        ReportEngine.render(job_type, dataset_params, {report_format: tmp_path})
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    report_cache.put_file(cache_key, tmp_path)
+
+
+def _describe_daily_issues(params, report_format):
+    site = _get_site(params['site_id'])
+    report_date = _parse_date(params['report_date'])
+    company_name, currency = _report_settings()
+
+    # Past business days (UTC dates, as the ledger records them) are closed; today's
+    # report is keyed by the ledger high-water mark
+    extension = REPORT_EXTENSIONS[report_format]
+    download_name = f'daily_issues_{site.name}_{report_date.strftime("%Y%m%d")}.{extension}'
+    high_water_mark = ReportService.ledger_high_water_mark(site.id) if report_date >= business_date_today() else None
+    cache_key = ReportArtifactCache.make_key(
+        'daily_issues', site.id, report_date, report_date, report_format, currency, company_name, high_water_mark,
+        catalog_version=get_catalog_version()
+    )
+    return cache_key, download_name
+
+
+def _describe_stock_summary(params, report_format):
+    site = _get_site(params['site_id'])
+    company_name, currency = _report_settings()
+
+    # Stock levels are always live: key on the ledger high-water mark and the
+    # site data version (which also moves on material edits)
+    extension = REPORT_EXTENSIONS[report_format]
+    download_name = f'stock_summary_{site.name}_{datetime.now().strftime("%Y%m%d")}.{extension}'
+    high_water_mark = f"{ReportService.ledger_high_water_mark(site.id)}.{get_site_version(site.id)}"
+    cache_key = ReportArtifactCache.make_key(
+        'stock_summary', site.id, None, None, report_format, currency, company_name, high_water_mark,
+        catalog_version=get_catalog_version()
+    )
+    return cache_key, download_name
+
+
+def _describe_transaction_history(params, report_format):
+    site = _get_site(params['site_id'])
+    start_date = _parse_date(params.get('start_date'))
+    end_date = _parse_date(params.get('end_date'))
+    company_name, currency = _report_settings()
+
+    date_suffix = f"_{params['start_date']}_{params['end_date']}" if start_date and end_date else ""
+    extension = REPORT_EXTENSIONS[report_format]
+    download_name = f"transaction_history_{site.name.replace(' ', '_')}{date_suffix}.{extension}"
+
+    # A range that ended before the current business date (UTC, as the ledger records it)
+    # is closed; open ranges are keyed by the ledger high-water mark
+    period_closed = end_date is not None and end_date < business_date_today()
+    high_water_mark = None if period_closed else ReportService.ledger_high_water_mark(site.id)
+    cache_key = ReportArtifactCache.make_key(
+        'transaction_history', site.id, start_date, end_date, report_format, currency, company_name, high_water_mark,
+        catalog_version=get_catalog_version()
+    )
+    return cache_key, download_name
+
+
+def _describe_consolidated_stock(params, report_format):
+    company_name, currency = _report_settings()
+
+    # Keyed on the company-wide ledger high-water mark and data version
+    download_name = f"company_stock_{datetime.now().strftime('%Y%m%d')}.{REPORT_EXTENSIONS[report_format]}"
+    high_water_mark = f"{ReportService.ledger_high_water_mark()}.{get_site_version()}"
+    cache_key = ReportArtifactCache.make_key(
+        'consolidated_stock', None, None, None, report_format, currency, company_name, high_water_mark,
+        catalog_version=get_catalog_version()
+    )
+    return cache_key, download_name
+
+
+def _build_consolidated_stock(params, report_format, cache_key):
+    company_name, currency = _report_settings()
+
+    tmp_path = report_cache.temp_path()
+    try:
+        ConsolidatedReportService.render(
+            {'company_name': company_name, 'currency': currency}, {report_format: tmp_path}
+        )
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    report_cache.put_file(cache_key, tmp_path)
+
+
+def _describe_receipts_zip(params, report_format):
+    site_id = params.get('site_id')
+    start_date = _parse_date(params.get('start_date'))
+    end_date = _parse_date(params.get('end_date'))
+    company_name, currency = _report_settings()
+
+    download_name = f"Material_Receipts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    # Ranges that ended before the current business date (UTC) never change; open ranges
+    # are keyed by the ledger high-water mark
+    period_closed = end_date is not None and end_date < business_date_today()
+    high_water_mark = None if period_closed else ReportService.ledger_high_water_mark(site_id)
+    cache_key = ReportArtifactCache.make_key(
+        'receipts', site_id, start_date, end_date, 'zip', currency, company_name, high_water_mark,
+        catalog_version=get_catalog_version()
+    )
+    return cache_key, download_name
+
+
+def _build_receipts_zip(params, report_format, cache_key):
+    payloads = iter_receipt_payloads(
+        receipt_company_settings(),
+        params.get('site_id'),
+        _parse_date(params.get('start_date')),
+        _parse_date(params.get('end_date'))
+    )
+
+    # Receipts rendered for the bundle are kept in the receipt store and recorded
+    # once the cursor over the transactions is finished
+    rendered = []
+
+    def store_rendered(payload, pdf_data):
+        rendered.append((payload['transaction_id'],) + ReceiptStore.write_blob(pdf_data))
+
+    # Missing receipts are rendered in a process pool and appended to the file as they complete
+    tmp_path = report_cache.temp_path()
+    try:
+        with open(tmp_path, 'wb') as zip_file:
+            for chunk in iter_receipts_zip(payloads, on_rendered=store_rendered):
+                zip_file.write(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    report_cache.put_file(cache_key, tmp_path)
+
+    for transaction_id, sha256, size_bytes in rendered:
+        ReceiptStore.record_new(transaction_id, sha256, size_bytes)
+    db.session.commit()
+
+
+@contextmanager
+def _heartbeat(engine, job_id, claim, interval=HEARTBEAT_SECONDS):
+    """
+    Refresh a running job's heartbeat from a background thread while the block runs;
+    renders are single calls with no progress to hook into
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                # Own connection, so the beat commits apart from the render's session
+                with engine.begin() as connection:
+                    connection.execute(
+                        update(ReportJob)
+                        .where(ReportJob.id == job_id, ReportJob.status == JOB_RUNNING, ReportJob.started_at == claim)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+            except Exception as e:
+                logging.warning(f"Report job {job_id} heartbeat failed: {str(e)}")
+
+    thread = threading.Thread(target=beat, name=f'report-job-{job_id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+# job_type -> (describe, build). describe returns (cache_key, download_name)
+# cheaply; build renders the report into the artifact cache under cache_key.
+# Dataset reports share one builder; see report_engine.DATASETS.
+REPORT_TYPES = {
+    'daily_issues': (_describe_daily_issues, partial(_build_dataset_report, 'daily_issues')),
+    'stock_summary': (_describe_stock_summary, partial(_build_dataset_report, 'stock_summary')),
+    'transaction_history': (_describe_transaction_history, partial(_build_dataset_report, 'transaction_history')),
+    'consolidated_stock': (_describe_consolidated_stock, _build_consolidated_stock),
+    'receipts_zip': (_describe_receipts_zip, _build_receipts_zip),
+}
+
+
+class ReportJobService:
+    """Service class for queueing, claiming and running report jobs"""
+
+    @staticmethod
+    def describe(job_type, params, report_format):
+        """Get the (cache_key, download_name) a report would be stored under"""
+        describe, _ = REPORT_TYPES[job_type]
+        return describe(params, report_format)
+
+    @staticmethod
+    def submit(job_type, params, report_format, requested_by):
+        """Queue a report job and return it"""
+        if job_type not in REPORT_TYPES:
+            raise ValueError(f"Unknown report type: {job_type}")
+
+        job = ReportJob(
+            job_type=job_type,
+            report_format=report_format,
+            params=json.dumps(params),
+            status=JOB_QUEUED,
+            requested_by=requested_by
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        logging.info(f"Report job {job.id} queued: {job_type} ({report_format})")
+        return job
+
+    @staticmethod
+    def claim_next():
+        """Atomically claim the oldest queued job; returns None when the queue is empty"""
+        while True:
+            job_id = db.session.query(ReportJob.id).filter(
+                ReportJob.status == JOB_QUEUED
+            ).order_by(ReportJob.id).limit(1).scalar()
+            if job_id is None:
+                return None
+
+            now = datetime.utcnow()
+            result = db.session.execute(
+                update(ReportJob)
+                .where(ReportJob.id == job_id, ReportJob.status == JOB_QUEUED)
+                .values(status=JOB_RUNNING, started_at=now, heartbeat_at=now)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return db.session.get(ReportJob, job_id)
+            # Another worker claimed it first; try the next one
+
+    @staticmethod
+    def run_job(job):
+        """Render a claimed job into the artifact cache and record the outcome"""
+        claim = job.started_at
+        try:
+            with _heartbeat(db.engine, job.id, claim, HEARTBEAT_SECONDS):
+                params = json.loads(job.params or '{}')
+                describe, build = REPORT_TYPES[job.job_type]
+                cache_key, download_name = describe(params, job.report_format)
+                if not report_cache.get(cache_key):
+                    build(params, job.report_format, cache_key)
+
+            if ReportJobService._finish(job, claim, artifact_key=cache_key, download_name=download_name,
+                                        status=JOB_COMPLETED):
+                logging.info(f"Report job {job.id} completed: {download_name}")
+
+        except Exception as e:
+            db.session.rollback()
+            if ReportJobService._finish(job, claim, status=JOB_FAILED, error_message=str(e)):
+                logging.error(f"Report job {job.id} failed: {str(e)}")
+
+    @staticmethod
+    def _finish(job, claim, **values):
+        """
+        Record the outcome of a job only while this worker's claim still holds; a job
+        requeued as stale may be running again elsewhere, and that run records its own
+        """
+        result = db.session.execute(
+            update(ReportJob)
+            .where(ReportJob.id == job.id, ReportJob.status == JOB_RUNNING, ReportJob.started_at == claim)
+            .values(completed_at=datetime.utcnow(), **values)
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            logging.warning(f"Report job {job.id} was claimed again while running; its outcome was not recorded")
+            return False
+        db.session.refresh(job)
+        return True
+
+        return job
+
+    @staticmethod
+    def run_next():
+        """Claim and run one queued job; returns the job or None when the queue is empty"""
+        job = ReportJobService.claim_next()
+        if job:
+            ReportJobService.run_job(job)
+        return job
+
+    @staticmethod
+    def requeue_stale(max_age_minutes=STALE_JOB_MINUTES):
+        """Requeue running jobs whose worker stopped sending heartbeats; returns the number requeued"""
+        cutoff = datetime.utcnow() - timedelta(minutes=max_age_minutes)
+        result = db.session.execute(
+            update(ReportJob)
+            .where(ReportJob.status == JOB_RUNNING,
+                   func.coalesce(ReportJob.heartbeat_at, ReportJob.started_at) < cutoff)
+            .values(status=JOB_QUEUED, started_at=None, heartbeat_at=None)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def artifact_path(job):
+        """Get the path of a completed job's file, or None if it is not available"""
+        if job.status != JOB_COMPLETED or not job.artifact_key:
+            return None
+        return report_cache.get(job.artifact_key)
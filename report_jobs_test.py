@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Report Job Queue Test
+Claiming, heartbeats and requeueing of report jobs: a running job keeps its
+heartbeat fresh while it renders, only jobs whose heartbeat stopped are
+requeued, and a worker whose job was claimed again does not record its outcome.
+
+Run with: python report_jobs_test.py
+"""
+
+from datetime import datetime, timedelta
+from io import BytesIO
+import time
+import uuid
+
+from sqlalchemy import update
+
+from app import app, db
+from models_new import ReportJob, User
+import report_jobs
+from report_jobs import (
+    ReportJobService, REPORT_TYPES, report_cache, JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED
+)
+
+
+def _register_test_report(build):
+    """A report type whose build is supplied by the test"""
+    job_type = f'test_{uuid.uuid4().hex[:8]}'
+
+    def describe(params, report_format):
+        return f"{job_type}_{params['run']}.csv", f"{job_type}.csv"
+
+    REPORT_TYPES[job_type] = (describe, build)
+    return job_type
+
+
+def _submit(job_type):
+    with app.app_context():
+        user = User.query.filter_by(username='engineer1').first()
+        return ReportJobService.submit(job_type, {'run': uuid.uuid4().hex}, 'csv', user.id).id
+
+
+def _claim(job_id):
+    """Claim a specific job, as claim_next would when it is the oldest queued"""
+    now = datetime.utcnow()
+    db.session.execute(
+        update(ReportJob).where(ReportJob.id == job_id, ReportJob.status == JOB_QUEUED)
+        .values(status=JOB_RUNNING, started_at=now, heartbeat_at=now)
+    )
+    db.session.commit()
+    return db.session.get(ReportJob, job_id)
+
+
+def test_heartbeat_while_rendering():
+    print("1. A slow render refreshes its heartbeat...")
+
+    def slow_build(params, report_format, cache_key):
+        time.sleep(0.5)
+        report_cache.put(cache_key, BytesIO(b'a,b\n'))
+
+    job_id = _submit(_register_test_report(slow_build))
+    heartbeat_seconds = report_jobs.HEARTBEAT_SECONDS
+    report_jobs.HEARTBEAT_SECONDS = 0.1
+    try:
+        with app.app_context():
+            job = _claim(job_id)
+            claimed_at = job.started_at
+            ReportJobService.run_job(job)
+            job = db.session.get(ReportJob, job_id)
+            assert job.status == JOB_COMPLETED, job.status
+            assert job.heartbeat_at > claimed_at
+    finally:
+        report_jobs.HEARTBEAT_SECONDS = heartbeat_seconds
+    print("✓ Completed with a heartbeat after its claim")
+
+
+def test_requeue_only_silent_jobs():
+    print("2. Only running jobs whose heartbeat stopped are requeued...")
+    job_type = _register_test_report(lambda params, report_format, cache_key: None)
+    silent_id, alive_id = _submit(job_type), _submit(job_type)
+    with app.app_context():
+        long_ago = datetime.utcnow() - timedelta(minutes=report_jobs.STALE_JOB_MINUTES + 1)
+        for job_id in (silent_id, alive_id):
+            _claim(job_id).started_at = long_ago
+        db.session.get(ReportJob, silent_id).heartbeat_at = long_ago
+        db.session.commit()
+
+        assert ReportJobService.requeue_stale() >= 1
+        assert db.session.get(ReportJob, silent_id).status == JOB_QUEUED
+        assert db.session.get(ReportJob, alive_id).status == JOB_RUNNING
+        db.session.get(ReportJob, alive_id).status = JOB_COMPLETED
+        db.session.commit()
+    print("✓ Silent job requeued, long render with a fresh heartbeat kept")
+
+
+def test_outcome_needs_the_claim():
+    print("3. A worker whose job was claimed again does not record its outcome...")
+
+    def reclaimed_build(params, report_format, cache_key):
+        # Meanwhile the job was requeued as stale and another worker claimed it
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(ReportJob).where(ReportJob.id == job_id)
+                .values(status=JOB_RUNNING, started_at=datetime.utcnow() + timedelta(seconds=1))
+            )
+        report_cache.put(cache_key, BytesIO(b'a,b\n'))
+
+    job_id = _submit(_register_test_report(reclaimed_build))
+    with app.app_context():
+        ReportJobService.run_job(_claim(job_id))
+        db.session.expire_all()
+        job = db.session.get(ReportJob, job_id)
+        assert job.status == JOB_RUNNING and job.completed_at is None, job.status
+        job.status = JOB_COMPLETED
+        db.session.commit()
+    print("✓ Left running for the worker holding the new claim")
+
+
+if __name__ == '__main__':
+    test_heartbeat_while_rendering()
+    test_requeue_only_silent_jobs()
+    test_outcome_needs_the_claim()
+    print("All report job checks passed")
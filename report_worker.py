@@ -0,0 +1,120 @@
+"""
+Background Report Worker
+Polls the report_jobs table and renders queued reports outside the web workers,
+imports queued material catalog uploads, rebuilds precomputed downloads after
+a deploy or catalog change, and periodically exports the legacy stock journal
+to its workbook.
+
+Run with: python report_worker.py   (or: flask --app main run-report-worker)
+gunicorn.conf.py starts one alongside the web server unless REPORT_WORKER_EMBEDDED=0.
+"""
+
+import logging
+import os
+import signal
+import time
+
+from app import app
+
+# Seconds to sleep when the queue is empty
+POLL_INTERVAL = float(os.environ.get('REPORT_WORKER_POLL_INTERVAL', 2.0))
+
+# Pre-render goods received vouchers into the receipt store while the queue is empty
+PRERENDER_RECEIPTS = os.environ.get('PRERENDER_RECEIPTS', '1') != '0'
+
+# Seconds between checks for jobs left running by a worker that died (redeploy, OOM)
+STALE_CHECK_INTERVAL = float(os.environ.get('REPORT_WORKER_STALE_CHECK_INTERVAL', 60))
+
+# Seconds between exports of the legacy stock journal to construction_materials.xlsx (0 disables)
+STOCK_WORKBOOK_EXPORT_INTERVAL = float(os.environ.get('STOCK_WORKBOOK_EXPORT_INTERVAL', 300))
+
+_stopping = False
+
+
+def _request_stop(signum, frame):
+    global _stopping
+    _stopping = True
+    logging.info(f"Report worker received signal {signum}, stopping after the current job")
+
+
+def _export_stock_workbook():
+    """Export the legacy stock journal when it changed after the last export"""
+    from excel_manager import ExcelManager
+
+    # Only sites still on the legacy flow have a journal
+    if os.path.exists(os.path.join('data', 'stock_journal.jsonl')):
+        ExcelManager().journal.export_if_stale()
+
+
+def _requeue_stale():
+    """Requeue report jobs and material imports whose worker has died"""
+    from report_jobs import ReportJobService
+    from material_import import MaterialImportService
+
+    with app.app_context():
+        requeued = ReportJobService.requeue_stale()
+        if requeued:
+            logging.info(f"Requeued {requeued} stale report jobs")
+        # Interrupted imports continue after their last committed chunk
+        requeued = MaterialImportService.requeue_stale()
+        if requeued:
+            logging.info(f"Requeued {requeued} stale material imports")
+
+
+def run(poll_interval=POLL_INTERVAL):
+    """Run report jobs until SIGTERM/SIGINT"""
+    from report_jobs import ReportJobService
+    from receipt_store import ReceiptStore
+    from material_import import MaterialImportService
+    from static_artifacts import StaticArtifactService
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+
+    logging.info(f"Report worker started (pid {os.getpid()})")
+    # Other workers can die while this one runs, so the check repeats, not only at startup
+    next_stale_check = time.monotonic()
+    next_workbook_export = time.monotonic()
+    # Receipts that failed to pre-render are passed over until the worker restarts
+    prerender_after_id = 0
+    while not _stopping:
+        if time.monotonic() >= next_stale_check:
+            next_stale_check = time.monotonic() + STALE_CHECK_INTERVAL
+            try:
+                _requeue_stale()
+            except Exception as e:
+                logging.error(f"Stale job check error: {str(e)}")
+
+        try:
+            # A fresh app context per job gives each job its own database session
+            with app.app_context():
+                busy = ReportJobService.run_next() is not None
+                if not busy:
+                    busy = MaterialImportService.run_next() is not None
+                # Upload templates are rebuilt ahead of the first download after a catalog change
+                if not busy:
+                    busy = StaticArtifactService.refresh() > 0
+                # When idle, render receipts for new receive transactions ahead of their first download
+                if not busy and PRERENDER_RECEIPTS:
+                    _, last_id = ReceiptStore.prerender_missing(after_id=prerender_after_id)
+                    busy = last_id is not None
+                    prerender_after_id = last_id or prerender_after_id
+        except Exception as e:
+            logging.error(f"Report worker error: {str(e)}")
+            busy = False
+
+        if STOCK_WORKBOOK_EXPORT_INTERVAL and time.monotonic() >= next_workbook_export:
+            next_workbook_export = time.monotonic() + STOCK_WORKBOOK_EXPORT_INTERVAL
+            try:
+                _export_stock_workbook()
+            except Exception as e:
+                logging.error(f"Stock workbook export error: {str(e)}")
+
+        if not busy:
+            time.sleep(poll_interval)
+
+    logging.info("Report worker stopped")
+
+
+if __name__ == '__main__':
+    run()
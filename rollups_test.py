@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Maintained Rollups Test
+The stock status index, inventory valuation rollup and daily activity counters
+are written in the same transaction as each stock movement. After receiving,
+issuing and adjusting stock they must hold the expected values, and match what
+their rebuild commands compute from the stock levels and the ledger.
+
+Run with: python rollups_test.py
+"""
+
+import uuid
+
+from app import app, db
+from models_new import Material, Site, StockStatus, InventoryValuation, DailyActivityCounter, Transaction, User
+from inventory_service import InventoryService
+from stock_status import StockStatusService, STATUS_NORMAL, STATUS_LOW, STATUS_CRITICAL
+from valuation_service import ValuationService
+from activity_counters import ActivityCounterService
+
+
+def _snapshot(site_id):
+    """The maintained rollup rows of one site"""
+    return {
+        'status': sorted(
+            (row.material_id, row.status, row.quantity, row.minimum_level)
+            for row in StockStatus.query.filter_by(site_id=site_id)
+        ),
+        'valuation': sorted(
+            (row.category, round(row.quantity, 6), round(row.total_value, 6))
+            for row in InventoryValuation.query.filter_by(site_id=site_id)
+        ),
+        'activity': sorted(
+            (row.business_date, row.type, row.count, round(row.quantity, 6), round(row.total_value, 6))
+            for row in DailyActivityCounter.query.filter_by(site_id=site_id)
+        ),
+    }
+
+
+def _status(site_id, material_id):
+    return StockStatus.query.filter_by(site_id=site_id, material_id=material_id).one().status
+
+
+def _valuation(site_id, category):
+    row = InventoryValuation.query.filter_by(site_id=site_id, category=category).one()
+    return row.quantity, row.total_value
+
+
+def test_rollups_follow_stock_movements():
+    with app.app_context():
+        suffix = uuid.uuid4().hex[:8]
+        user_id = User.query.filter_by(username='engineer1').first().id
+        site = Site(name=f'Rollup Site {suffix}', code=f'R{suffix[:6]}')
+        category = f'Rollup {suffix}'
+        material = Material(name=f'Rollup Material {suffix}', sku=f'RLP-{suffix}', unit='pcs',
+                            cost_per_unit=2.0, minimum_level=10, category=category)
+        db.session.add_all([site, material])
+        db.session.commit()
+        site_id, material_id = site.id, material.id
+
+        print("1. Receiving 20 at 2.00...")
+        InventoryService.receive_material(site_id, material_id, 20, 2.0, created_by=user_id)
+        assert _status(site_id, material_id) == STATUS_NORMAL
+        assert _valuation(site_id, category) == (20, 40)
+        assert ActivityCounterService.get_counts(site_id=site_id) == {'receive': 1}
+        print("✓ Normal, valued at 40.00, one receive counted")
+
+        print("2. Issuing 12 (below the minimum of 10)...")
+        InventoryService.issue_material(site_id, material_id, 12, approved_by=user_id, created_by=user_id)
+        assert _status(site_id, material_id) == STATUS_LOW
+        assert _valuation(site_id, category) == (8, 16)
+        assert ActivityCounterService.get_counts(site_id=site_id) == {'receive': 1, 'issue': 1}
+        print("✓ Low, valued at 16.00, one issue counted")
+
+        print("3. Counting 4 where 8 were expected...")
+        InventoryService.adjust_stock(site_id, material_id, 8, 4, reason='Rollup test', adjusted_by=user_id)
+        assert _status(site_id, material_id) == STATUS_CRITICAL
+        assert _valuation(site_id, category) == (4, 8)
+        assert ActivityCounterService.get_counts(site_id=site_id) == {'receive': 1, 'issue': 1, 'adjustment': 1}
+        assert ActivityCounterService.get_total(site_id) == Transaction.query.filter_by(site_id=site_id).count()
+        print("✓ Critical, valued at 8.00, one adjustment counted")
+
+        print("4. Rebuilding every rollup from the source tables...")
+        maintained = _snapshot(site_id)
+        StockStatusService.rebuild()
+        ValuationService.rebuild()
+        ActivityCounterService.rebuild()
+        assert _snapshot(site_id) == maintained, (maintained, _snapshot(site_id))
+        print("✓ Rebuilt rows match the maintained rows")
+
+
+if __name__ == '__main__':
+    test_rollups_follow_stock_movements()
+    print("All rollup checks passed")
@@ -1,5 +1,5 @@
 import os
-from flask import render_template, request, redirect, url_for, flash, session, jsonify
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, send_file
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash
@@ -762,3 +762,17 @@ def stock_report():
         logging.error(f"Error generating stock report: {str(e)}")
         flash('Error generating stock report', 'error')
         return redirect(url_for('materials_dashboard'))
+
+@app.route('/export_stock_workbook')
+@login_required
+def export_stock_workbook():
+    """Download the stock journal exported as the construction materials workbook"""
+    try:
+        excel_manager = ExcelManager()
+        path = excel_manager.export_workbook()
+        return send_file(os.path.abspath(path), as_attachment=True,
+                         download_name=f"construction_materials_{datetime.now().strftime('%Y%m%d')}.xlsx")
+    except Exception as e:
+        logging.error(f"Error exporting stock workbook: {str(e)}")
+        flash('Error exporting stock workbook', 'error')
+        return redirect(url_for('materials_dashboard'))
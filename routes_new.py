@@ -3,23 +3,40 @@ Enhanced Routes for Multi-Site Inventory Management System
 """
 
 import os
-from flask import render_template, request, redirect, url_for, flash, session, jsonify, send_file
+import csv
+import functools
+import tempfile
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, send_file, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import logging
-from io import BytesIO
+from io import StringIO
+from sqlalchemy.orm import joinedload
 
 from app import app, db
 from models_new import (
     User, Site, Material, StockLevel, Transaction, IssueRequest, BatchIssueRequest, 
-    BatchIssueItem, StockAdjustment, FIFOBatch, StockTransferRequest, SystemSettings
+    StockAdjustment, FIFOBatch, StockTransferRequest, SystemSettings, StockStatus,
+    InventoryValuation, DailyActivityCounter, ReportJob, MaterialImportJob
 )
-from inventory_service import InventoryService, ReportService
-from report_generator import PDFReportGenerator, ExcelReportGenerator
-from receipt_generator import ReceiptGenerator
-from enhanced_report_generator import ProfessionalReportGenerator, EnhancedExcelReportGenerator
+from inventory_service import InventoryService
+from stock_status import StockStatusService, STATUS_NORMAL, STATUS_LOW, STATUS_CRITICAL
+from valuation_service import ValuationService
+from activity_counters import ActivityCounterService
+from fragment_cache import init_fragment_cache, bypass_fragment_cache
+from report_jobs import ReportJobService, report_cache, JOB_COMPLETED, JOB_FAILED
+from report_engine import ReportEngine, REPORT_FORMATS
+from receipt_store import ReceiptStore, receipt_filename
+from ledger_export import iter_ledger_csv, gzip_chunks
+from streaming_excel import StreamingExcelWriter, excel_stream_response, EXCEL_MIMETYPE
+from material_import import MaterialImportService, JOB_FAILED as IMPORT_FAILED, STALLED_IMPORT_MESSAGE
+from import_reader import import_format
+from units import canonical_unit, unit_choices
+from grn_import import GrnImportService
+from static_artifacts import StaticArtifactService, ARTIFACTS, STATIC_ARTIFACT_MAX_AGE
+from cycle_count import CycleCountService, DEFAULT_COUNT_REASON, DIFF_COLUMNS as CYCLE_COUNT_DIFF
 
 # Define comprehensive material categories
 MATERIAL_CATEGORIES = [
@@ -51,6 +68,9 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'  # type: ignore
 
+# Register the rendered fragment cache ({% cache %} template tag)
+init_fragment_cache(app)
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -75,12 +95,12 @@ def initialize_default_data():
             materials = [
                 Material(name='Portland Cement', unit='bags', description='50kg bags', cost_per_unit=12.50, minimum_level=100, category='Construction'),
                 Material(name='Reinforcement Steel', unit='kg', description='Grade 60 rebar', cost_per_unit=0.85, minimum_level=1000, category='Construction'),
-                Material(name='Concrete Blocks', unit='pieces', description='8x8x16 blocks', cost_per_unit=2.25, minimum_level=500, category='Masonry'),
-                Material(name='Sand', unit='cubic meters', description='Fine construction sand', cost_per_unit=25.00, minimum_level=50, category='Aggregates'),
-                Material(name='Gravel', unit='cubic meters', description='Coarse aggregate', cost_per_unit=30.00, minimum_level=30, category='Aggregates'),
-                Material(name='Lumber 2x4', unit='pieces', description='8ft pressure treated', cost_per_unit=8.50, minimum_level=200, category='Timber'),
-                Material(name='Roofing Sheets', unit='pieces', description='Galvanized iron sheets', cost_per_unit=15.75, minimum_level=100, category='Roofing'),
-                Material(name='PVC Pipes', unit='meters', description='4-inch diameter', cost_per_unit=5.50, minimum_level=500, category='Plumbing')
+                Material(name='Concrete Blocks', unit='pcs', description='8x8x16 blocks', cost_per_unit=2.25, minimum_level=500, category='Masonry'),
+                Material(name='Sand', unit='m3', description='Fine construction sand', cost_per_unit=25.00, minimum_level=50, category='Aggregates'),
+                Material(name='Gravel', unit='m3', description='Coarse aggregate', cost_per_unit=30.00, minimum_level=30, category='Aggregates'),
+                Material(name='Lumber 2x4', unit='pcs', description='8ft pressure treated', cost_per_unit=8.50, minimum_level=200, category='Timber'),
+                Material(name='Roofing Sheets', unit='pcs', description='Galvanized iron sheets', cost_per_unit=15.75, minimum_level=100, category='Roofing'),
+                Material(name='PVC Pipes', unit='m', description='4-inch diameter', cost_per_unit=5.50, minimum_level=500, category='Plumbing')
             ]
             for material in materials:
                 db.session.add(material)
@@ -134,6 +154,14 @@ def initialize_default_data():
                     )
         
         db.session.commit()
+        
+        # Backfill maintained rollups for databases created before they existed
+        if StockLevel.query.first() and not StockStatus.query.first():
+            StockStatusService.rebuild()
+        if StockLevel.query.first() and not InventoryValuation.query.first():
+            ValuationService.rebuild()
+        if Transaction.query.first() and not DailyActivityCounter.query.first():
+            ActivityCounterService.rebuild()
         logging.info("Default data initialized successfully")
         
     except Exception as e:
@@ -266,19 +294,18 @@ def site_engineer_dashboard():
             
         total_pending = pending_individual_requests + pending_batch_requests + pending_transfer_requests
         
+        # Inventory valuation by category from the rollup table
+        try:
+            category_valuations = ValuationService.get_category_totals()
+        except Exception as e:
+            logging.error(f"Error getting category valuations: {e}")
+            category_valuations = []
+        
         # Get today's activity with error handling
         try:
-            from sqlalchemy import func
-            today = datetime.now().date()
-            today_receipts = Transaction.query.filter(
-                Transaction.type == 'receive',
-                func.date(Transaction.created_at) == today
-            ).count()
-            
-            today_issues = Transaction.query.filter(
-                Transaction.type == 'issue',
-                func.date(Transaction.created_at) == today
-            ).count()
+            today_counts = ActivityCounterService.get_counts()
+            today_receipts = today_counts.get('receive', 0)
+            today_issues = today_counts.get('issue', 0)
         except:
             today_receipts = 0
             today_issues = 0
@@ -296,6 +323,7 @@ def site_engineer_dashboard():
                              recent_transactions=recent_transactions,
                              today_receipts=today_receipts,
                              today_issues=today_issues,
+                             category_valuations=category_valuations,
                              current_time=datetime.now())
                              
     except Exception as e:
@@ -468,7 +496,9 @@ def edit_site():
         
         if request.form.get('is_active'):
             site.is_active = bool(request.form.get('is_active'))
-            
+        
+        # Site names are printed on cached reports and downloads, like material names
+        InventoryService.bump_catalog_version()
         db.session.commit()
         flash('Site updated successfully', 'success')
     except Exception as e:
@@ -496,13 +526,22 @@ def edit_material():
             flash('Material not found', 'error')
             return redirect(url_for('materials'))
             
+        unit = canonical_unit(request.form['unit'])
+        if not unit:
+            flash(f"Unknown unit '{request.form['unit']}'", 'error')
+            return redirect(url_for('material_management'))
+        
+        old_category = material.category
         material.name = request.form['name']
         material.sku = request.form['sku']
         material.category = request.form.get('category')
-        material.unit = request.form['unit']
+        material.unit = unit
         material.minimum_level = float(request.form['minimum_level']) if request.form.get('minimum_level') else None
         material.description = request.form.get('description')
         material.is_active = bool(request.form.get('is_active'))
+        StockStatusService.refresh_material(material)
+        ValuationService.move_category(material, old_category, material.category)
+        InventoryService.bump_catalog_version()
         db.session.commit()
         flash('Material updated successfully', 'success')
     except Exception as e:
@@ -551,6 +590,7 @@ def delete_material():
         
         # Delete the material
         db.session.delete(material)
+        InventoryService.bump_catalog_version()
         db.session.commit()
         
         flash(f'Material "{material.name}" deleted successfully', 'success')
@@ -588,7 +628,8 @@ def material_management():
     return render_template('material_management.html', 
                          materials=materials, 
                          total_materials=total_materials,
-                         active_materials=active_materials)
+                         active_materials=active_materials,
+                         unit_choices=unit_choices())
 
 
 @app.route('/system_settings', methods=['GET', 'POST'])
@@ -628,17 +669,16 @@ def system_settings():
     sites = Site.query.all()
     
     # Get system statistics
-    total_transactions = Transaction.query.count()
-    active_users = User.query.count()
-    active_sites = Site.query.filter_by(is_active=True).count()
-    today_transactions = Transaction.query.filter(
-        Transaction.created_at >= datetime.now().date()
-    ).count()
+    total_transactions = ActivityCounterService.get_total()
+    active_users = len(users)
+    active_sites = sum(1 for site in sites if site.is_active)
+    today_transactions = sum(ActivityCounterService.get_counts().values())
     pending_approvals = IssueRequest.query.filter_by(status='pending').count()
     low_stock_items = len(InventoryService.get_low_stock_items())
     
-    # Calculate total inventory value
-    total_inventory_value = db.session.query(db.func.sum(StockLevel.total_value)).scalar() or 0
+    # Total inventory value from the per-site, per-category rollup
+    total_inventory_value = ValuationService.get_total_value()
+    category_valuations = ValuationService.get_category_totals()
     
     return render_template('system_settings.html',
                          users=users,
@@ -650,6 +690,7 @@ def system_settings():
                          pending_approvals=pending_approvals,
                          low_stock_items=low_stock_items,
                          total_inventory_value=total_inventory_value,
+                         category_valuations=category_valuations,
                          database_size=25,  # Placeholder
                          last_backup=None,  # Placeholder
                          settings=settings)
@@ -693,6 +734,7 @@ def manage_materials():
                          materials=materials, 
                          categories=all_categories,
                          predefined_categories=MATERIAL_CATEGORIES,
+                         unit_choices=unit_choices(),
                          selected_category=category_filter,
                          search_query=search_query)
 
@@ -707,7 +749,10 @@ def add_material():
     try:
         name = request.form.get('name')
         sku = request.form.get('sku')
-        unit = request.form.get('unit')
+        unit = canonical_unit(request.form.get('unit'))
+        if not unit:
+            flash(f"Unknown unit '{request.form.get('unit', '')}'", 'error')
+            return redirect(url_for('material_management'))
         description = request.form.get('description')
         cost_per_unit = float(request.form.get('cost_per_unit', 0))
         minimum_level = float(request.form.get('minimum_level', 0))
@@ -724,6 +769,7 @@ def add_material():
         )
         
         db.session.add(material)
+        InventoryService.bump_catalog_version()
         db.session.commit()
         
         flash(f'Material {name} added successfully', 'success')
@@ -736,6 +782,30 @@ def add_material():
     return redirect(url_for('material_management'))
 
 
+def send_static_artifact(name):
+    """
+    Send a precomputed artifact. The unversioned URL redirects to the current
+    version, which the browser may then keep for STATIC_ARTIFACT_MAX_AGE.
+    """
+    version = StaticArtifactService.version(name)
+    if request.args.get('v') != version:
+        return redirect(url_for(request.endpoint, v=version))
+    
+    response = send_file(
+        StaticArtifactService.get(name, version),
+        mimetype=EXCEL_MIMETYPE,
+        as_attachment=True,
+        download_name=ARTIFACTS[name].download_name,
+        etag=version,
+        max_age=STATIC_ARTIFACT_MAX_AGE
+    )
+    # Downloads need a login, so only the browser may cache them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+
 @app.route('/download_material_template')
 @login_required
 def download_material_template():
@@ -745,137 +815,38 @@ def download_material_template():
         return redirect(url_for('index'))
     
     try:
-        import pandas as pd
-        from io import BytesIO
-        
-        # Create sample data for the template with comprehensive categories
-        template_data = {
-            'Material Name': [
-                'Portland Cement',
-                'Steel Rebar 12mm',
-                'Ready Mix Concrete',
-                'Electrical Wire 2.5mm',
-                'PVC Pipe 110mm',
-                'Grass Seed',
-                'Garden Soil',
-                'Brick Blocks',
-                'Plumbing Fittings',
-                'Paint Brushes'
-            ],
-            'Unit': [
-                'bags',
-                'kg',
-                'm3',
-                'm',
-                'm',
-                'kg',
-                'bags',
-                'pieces',
-                'pieces',
-                'pieces'
-            ],
-            'Description': [
-                'High quality Portland cement for construction',
-                'Steel reinforcement bars 12mm diameter',
-                'Ready mix concrete M20 grade',
-                'Electrical wire 2.5mm copper',
-                'PVC drainage pipe 110mm diameter',
-                'Lawn grass seed for landscaping',
-                'Organic garden soil for planting',
-                'Standard brick blocks for masonry',
-                'Copper pipe fittings for plumbing',
-                'Professional paint brushes for finishing'
-            ],
-            'Cost per Unit': [
-                8.50,
-                0.85,
-                120.00,
-                2.30,
-                15.75,
-                25.00,
-                15.00,
-                0.45,
-                12.50,
-                8.50
-            ],
-            'Minimum Level': [
-                50,
-                500,
-                10,
-                100,
-                20,
-                50,
-                100,
-                1000,
-                100,
-                50
-            ],
-            'Category': [
-                'Construction',
-                'Construction',
-                'Construction',
-                'Electrical',
-                'Plumbing',
-                'Gardening',
-                'Gardening',
-                'Masonry',
-                'Plumbing',
-                'Finishing'
-            ]
-        }
-        
-        # Create DataFrame
-        df = pd.DataFrame(template_data)
-        
-        # Create Excel file in memory
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Materials')
-            
-            # Get the workbook and worksheet
-            workbook = writer.book
-            worksheet = writer.sheets['Materials']
-            
-            # Auto-adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name='material_upload_template.xlsx'
-        )
-        
+        return send_static_artifact('material_template')
     except Exception as e:
         logging.error(f"Error creating template: {str(e)}")
         flash('Error creating template file', 'error')
         return redirect(url_for('manage_materials'))
 
 
+@app.route('/download_material_catalog')
+@login_required
+def download_material_catalog():
+    """Download the upload template pre-filled with every current material"""
+    if current_user.role != 'site_engineer':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    
+    try:
+        return send_static_artifact('material_catalog')
+    except Exception as e:
+        logging.error(f"Error creating catalog file: {str(e)}")
+        flash('Error creating catalog file', 'error')
+        return redirect(url_for('manage_materials'))
+
+
 @app.route('/upload_materials_excel', methods=['POST'])
 @login_required
 def upload_materials_excel():
-    """Handle Excel file upload for bulk material import"""
+    """Queue an uploaded Excel or CSV catalog for the background material import"""
     if current_user.role != 'site_engineer':
         flash('Access denied', 'error')
         return redirect(url_for('index'))
     
     try:
-        import pandas as pd
-        from werkzeug.utils import secure_filename
-        
         # Check if file was uploaded
         if 'excel_file' not in request.files:
             flash('No file selected', 'error')
@@ -887,109 +858,25 @@ def upload_materials_excel():
             return redirect(url_for('manage_materials'))
         
         # Check file extension
-        if not file.filename.lower().endswith(('.xlsx', '.xls')):
-            flash('Invalid file format. Please upload .xlsx or .xls files only.', 'error')
+        if not import_format(file.filename):
+            flash('Invalid file format. Please upload .xlsx, .xls or .csv files only.', 'error')
             return redirect(url_for('manage_materials'))
         
-        # Read Excel file
         skip_header = request.form.get('skip_header') == '1'
         update_existing = request.form.get('update_existing') == '1'
         
-        # Read the Excel file
-        df = pd.read_excel(file, header=0 if skip_header else None)
-        
-        # Define expected columns
-        expected_columns = ['Material Name', 'Unit', 'Description', 'Cost per Unit', 'Minimum Level', 'Category']
-        
-        # If no header, assign column names
-        if not skip_header:
-            df.columns = expected_columns[:len(df.columns)]
-        
-        # Validate required columns
-        if 'Material Name' not in df.columns or 'Unit' not in df.columns:
-            flash('Excel file must contain "Material Name" and "Unit" columns', 'error')
+        # The file is read in chunks by the worker, so only the upload itself is held on disk
+        file_path = MaterialImportService.store_upload(file)
+        try:
+            job = MaterialImportService.submit(
+                file_path, secure_filename(file.filename) or 'materials', skip_header, update_existing, current_user.id
+            )
+        except ValueError as e:
+            os.remove(file_path)
+            flash(str(e), 'error')
             return redirect(url_for('manage_materials'))
         
-        # Process each row
-        added_count = 0
-        updated_count = 0
-        error_count = 0
-        
-        for index, row in df.iterrows():
-            try:
-                # Skip empty rows
-                material_name_val = row.get('Material Name')
-                if pd.isna(material_name_val) or not str(material_name_val).strip():
-                    continue
-                
-                material_name = str(row['Material Name']).strip()
-                unit = str(row['Unit']).strip()
-                
-                # Validate unit
-                valid_units = [
-                    'kg', 'bags', 'tons', 'tonnes', 'tonner', 'tonne',
-                    'm3', 'm2', 'm', 'meters', 'metres', 
-                    'pcs', 'pieces', 'ea', 'each', 'no',
-                    'liters', 'litres', 'l',
-                    'cubic meters', 'cubic metres',
-                    'square meters', 'square metres',
-                    'box', 'boxes', 'sheets', 'rolls', 'units'
-                ]
-                if unit.lower() not in valid_units:
-                    logging.warning(f"Invalid unit '{unit}' for material '{material_name}'. Skipping.")
-                    error_count += 1
-                    continue
-                
-                # Check if material exists
-                existing_material = Material.query.filter_by(name=material_name).first()
-                
-                if existing_material and not update_existing:
-                    logging.info(f"Material '{material_name}' already exists. Skipping.")
-                    continue
-                
-                # Prepare material data
-                material_data = {
-                    'name': material_name,
-                    'unit': unit,
-                    'description': str(row.get('Description', '')).strip() if pd.notna(row.get('Description')) else '',
-                    'cost_per_unit': float(row.get('Cost per Unit', 0)) if pd.notna(row.get('Cost per Unit')) else 0.0,
-                    'minimum_level': float(row.get('Minimum Level', 0)) if pd.notna(row.get('Minimum Level')) else 0.0,
-                    'category': str(row.get('Category', 'General')).strip() if pd.notna(row.get('Category')) else 'General'
-                }
-                
-                if existing_material and update_existing:
-                    # Update existing material
-                    existing_material.unit = material_data['unit']
-                    existing_material.description = material_data['description']
-                    existing_material.cost_per_unit = material_data['cost_per_unit']
-                    existing_material.minimum_level = material_data['minimum_level']
-                    existing_material.category = material_data['category']
-                    updated_count += 1
-                else:
-                    # Create new material
-                    new_material = Material(**material_data)
-                    db.session.add(new_material)
-                    added_count += 1
-                    
-            except Exception as e:
-                logging.error(f"Error processing row {index}: {str(e)}")
-                error_count += 1
-                continue
-        
-        # Commit all changes
-        db.session.commit()
-        
-        # Show detailed success message
-        if added_count > 0 or updated_count > 0:
-            success_msg = f"Excel upload completed! Added: {added_count}, Updated: {updated_count}"
-            if error_count > 0:
-                success_msg += f", Errors: {error_count}"
-            flash(success_msg, 'success')
-        else:
-            if error_count > 0:
-                flash(f"Upload failed: {error_count} materials skipped due to invalid units or other errors. Check the logs for details.", 'error')
-            else:
-                flash("No materials were imported. Check your Excel file format.", 'warning')
+        return redirect(url_for('material_import_status', job_id=job.id))
         
     except Exception as e:
         db.session.rollback()
@@ -999,6 +886,87 @@ def upload_materials_excel():
     return redirect(url_for('manage_materials'))
 
 
+def get_material_import_or_none(job_id):
+    """Get a material import job visible to the current user"""
+    if current_user.role != 'site_engineer':
+        return None
+    return db.session.get(MaterialImportJob, job_id)
+
+
+@app.route('/material_imports/<int:job_id>')
+@login_required
+def material_import_status(job_id):
+    """Show the progress of a material import"""
+    job = get_material_import_or_none(job_id)
+    if not job:
+        flash('Import not found', 'error')
+        return redirect(url_for('manage_materials'))
+    
+    return render_template('material_import_job.html', job=job, stalled=MaterialImportService.is_stalled(job),
+                           stalled_message=STALLED_IMPORT_MESSAGE)
+
+
+@app.route('/api/material_imports/<int:job_id>')
+@login_required
+def api_material_import(job_id):
+    """API endpoint for polling material import progress"""
+    job = get_material_import_or_none(job_id)
+    if not job:
+        return jsonify({'error': 'Material import not found'}), 404
+    
+    stalled = MaterialImportService.is_stalled(job)
+    return jsonify({
+        'id': job.id,
+        'filename': job.filename,
+        'status': job.status,
+        'stalled': stalled,
+        'rows_total': job.rows_total,
+        'rows_processed': job.rows_processed,
+        'added': job.added,
+        'updated': job.updated,
+        'skipped': job.skipped,
+        'rejected': job.rejected,
+        'error': job.error_message if job.status == IMPORT_FAILED else (STALLED_IMPORT_MESSAGE if stalled else None),
+        'error_report_url': url_for('download_material_import_errors', job_id=job.id) if job.rejected else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None
+    })
+
+
+@app.route('/material_imports/<int:job_id>/errors')
+@login_required
+def download_material_import_errors(job_id):
+    """Download the rows a material import rejected, with the reason for each"""
+    job = get_material_import_or_none(job_id)
+    if not job:
+        flash('Import not found', 'error')
+        return redirect(url_for('manage_materials'))
+    
+    return send_file(
+        MaterialImportService.error_report(job),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name=f'material_import_{job.id}_errors.csv'
+    )
+
+
+@app.route('/material_imports/<int:job_id>/resume', methods=['POST'])
+@login_required
+def resume_material_import(job_id):
+    """Continue a failed or stalled material import after its last committed chunk"""
+    job = get_material_import_or_none(job_id)
+    if not job:
+        flash('Import not found', 'error')
+        return redirect(url_for('manage_materials'))
+    
+    try:
+        MaterialImportService.resume(job)
+    except ValueError as e:
+        flash(str(e), 'error')
+    
+    return redirect(url_for('material_import_status', job_id=job.id))
+
+
 @app.route('/view_stock')
 @login_required
 def view_stock():
@@ -1013,12 +981,17 @@ def view_stock():
     else:
         site_id = request.args.get('site_id', type=int)
     
-    try:
-        stock_summary = InventoryService.get_stock_summary(site_id)
-    except Exception as e:
-        logging.error(f"Error getting stock summary: {str(e)}")
-        stock_summary = []
-        flash('Error loading stock data. Please try again.', 'error')
+    # Called from the cached fragments, so the summary query only runs on a cache miss
+    @functools.cache
+    def load_stock_summary():
+        try:
+            return InventoryService.get_stock_summary(site_id)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Error getting stock summary: {str(e)}")
+            # An empty table from a failed query must not be cached until the next write
+            bypass_fragment_cache()
+            return None
     
     # For site engineers, show all sites; for storesman, only their site
     if current_user.role == 'site_engineer':
@@ -1029,9 +1002,10 @@ def view_stock():
     selected_site = Site.query.get(site_id) if site_id else None
     
     return render_template('view_stock.html',
-                         stock_summary=stock_summary,
+                         load_stock_summary=load_stock_summary,
                          sites=sites,
-                         selected_site=selected_site)
+                         selected_site=selected_site,
+                         cache_site_id=site_id)
 
 
 @app.route('/download_stock_excel')
@@ -1045,88 +1019,49 @@ def download_stock_excel():
     site_id = request.args.get('site_id', type=int)
     
     try:
-        # Get stock summary data
-        stock_summary = InventoryService.get_stock_summary(site_id)
+        from openpyxl.styles import PatternFill
         
-        # Create Excel file
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        from openpyxl.utils import get_column_letter
+        site_name = Site.query.get(site_id).name if site_id else 'All Sites'
         
-        wb = Workbook()
-        ws = wb.active
+        low_fill = PatternFill(start_color="FF6B6B", end_color="FF6B6B", fill_type="solid")
+        warning_fill = PatternFill(start_color="FFD93D", end_color="FFD93D", fill_type="solid")
+        normal_fill = PatternFill(start_color="6BCF7F", end_color="6BCF7F", fill_type="solid")
+        status_fills = {'Low Stock': low_fill, 'Warning': warning_fill, 'Normal': normal_fill}
+        
+        def rows():
+            # Stream stock levels from a server-side cursor
+            for item in InventoryService.iter_stock_summary(site_id):
+                if item.minimum_level and item.quantity <= item.minimum_level:
+                    status = "Low Stock"
+                elif item.minimum_level and item.quantity <= (item.minimum_level * 1.5):
+                    status = "Warning"
+                else:
+                    status = "Normal"
+                
+                yield (
+                    item.site_name,
+                    item.material_name,
+                    float(item.quantity),
+                    item.unit,
+                    float(item.minimum_level) if item.minimum_level else 0,
+                    status,
+                    float(item.total_value),
+                    item.updated_at.strftime('%Y-%m-%d %H:%M:%S') if item.updated_at else 'N/A'
+                )
         
-        # Set title
-        site_name = Site.query.get(site_id).name if site_id else 'All Sites'
-        ws.title = f"Stock Levels - {site_name}"
-        
-        # Headers
-        headers = ['Site', 'Material Name', 'Current Stock', 'Unit', 'Minimum Level', 'Status', 'Total Value', 'Last Updated']
-        
-        # Style headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-        
-        # Add data
-        for row_num, item in enumerate(stock_summary, 2):
-            ws.cell(row=row_num, column=1, value=item.site_name)
-            ws.cell(row=row_num, column=2, value=item.material_name)
-            ws.cell(row=row_num, column=3, value=float(item.quantity))
-            ws.cell(row=row_num, column=4, value=item.unit)
-            ws.cell(row=row_num, column=5, value=float(item.minimum_level) if item.minimum_level else 0)
-            
-            # Status
-            if item.minimum_level and item.quantity <= item.minimum_level:
-                status = "Low Stock"
-                status_fill = PatternFill(start_color="FF6B6B", end_color="FF6B6B", fill_type="solid")
-            elif item.minimum_level and item.quantity <= (item.minimum_level * 1.5):
-                status = "Warning"
-                status_fill = PatternFill(start_color="FFD93D", end_color="FFD93D", fill_type="solid")
-            else:
-                status = "Normal"
-                status_fill = PatternFill(start_color="6BCF7F", end_color="6BCF7F", fill_type="solid")
-            
-            status_cell = ws.cell(row=row_num, column=6, value=status)
-            status_cell.fill = status_fill
-            
-            ws.cell(row=row_num, column=7, value=float(item.total_value))
-            ws.cell(row=row_num, column=8, value=item.updated_at.strftime('%Y-%m-%d %H:%M:%S') if item.updated_at else 'N/A')
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[column_letter].width = adjusted_width
-        
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        writer = StreamingExcelWriter()
+        writer.add_sheet(
+            f"Stock Levels - {site_name}",
+            ['Site', 'Material Name', 'Current Stock', 'Unit', 'Minimum Level', 'Status', 'Total Value', 'Last Updated'],
+            rows(),
+            fills=lambda row: {5: status_fills[row[5]]}
+        )
         
         # Generate filename
-        from datetime import datetime
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"stock_levels_{site_name.replace(' ', '_')}_{timestamp}.xlsx"
         
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        return excel_stream_response(writer, filename)
         
     except Exception as e:
         logging.error(f"Error generating stock Excel: {str(e)}")
@@ -1163,12 +1098,14 @@ def approve_requests():
         StockTransferRequest.status.in_(['approved', 'rejected'])
     ).order_by(StockTransferRequest.reviewed_at.desc()).limit(10).all()
     
-    # Get stock levels for validation
-    stock_levels = {}
-    for site in Site.query.all():
-        stock_levels[site.id] = {}
-        for stock in StockLevel.query.filter_by(site_id=site.id).all():
-            stock_levels[site.id][stock.material_id] = stock
+    # Stock levels for validation, loaded from the cached fragment so they are only read on a cache miss
+    def load_stock_levels():
+        material_ids = {request.material_id for request in individual_requests}
+        material_ids.update(item.material_id for request in batch_requests for item in request.items)
+        stock_levels = {}
+        for stock in StockLevel.query.filter(StockLevel.material_id.in_(material_ids)).all():
+            stock_levels.setdefault(stock.site_id, {})[stock.material_id] = stock
+        return stock_levels
     
     return render_template('approve_requests.html',
                          individual_requests=individual_requests,
@@ -1177,7 +1114,7 @@ def approve_requests():
                          recent_individual=recent_individual,
                          recent_batch=recent_batch,
                          recent_transfers=recent_transfers,
-                         stock_levels=stock_levels)
+                         load_stock_levels=load_stock_levels)
 
 
 @app.route('/process_individual_request', methods=['POST'])
@@ -1324,11 +1261,18 @@ def storesman_dashboard():
             materials = []
             
         try:
-            stock_levels = StockLevel.query.filter_by(site_id=site_id).all() or []
+            stock_levels = StockLevel.query.options(joinedload(StockLevel.material)).filter_by(site_id=site_id).all() or []
         except Exception as e:
             logging.error(f"Error getting stock levels: {e}")
             stock_levels = []
             
+        # Stock status counts from the maintained low-stock index
+        try:
+            status_counts = StockStatusService.get_status_counts(site_id)
+        except Exception as e:
+            logging.error(f"Error getting stock status counts: {e}")
+            status_counts = {STATUS_NORMAL: 0, STATUS_LOW: 0, STATUS_CRITICAL: 0}
+        
         total_materials = len(materials)
         current_stock_items = len(stock_levels)
         pending_requests = pending_individual + pending_batch
@@ -1355,8 +1299,9 @@ def storesman_dashboard():
                          pending_issue_requests=pending_issue_requests,
                          recent_transactions=recent_transactions,
                              current_time=datetime.now(),
-                             normal_stock_count=len([s for s in stock_levels if s.material and s.quantity > s.material.minimum_level]),
-                             critical_stock_count=len([s for s in stock_levels if s.material and s.quantity <= (s.material.minimum_level * 0.5)]))
+                             normal_stock_count=status_counts[STATUS_NORMAL],
+                             low_only_stock_count=status_counts[STATUS_LOW],
+                             critical_stock_count=status_counts[STATUS_CRITICAL])
                              
     except Exception as e:
         logging.error(f"Error in storesman_dashboard: {str(e)}")
@@ -1451,6 +1396,81 @@ def process_bulk_receive_material():
     return redirect(url_for('bulk_receive_materials'))
 
 
+@app.route('/import_grn', methods=['POST'])
+@login_required
+def import_grn():
+    """Receive every line of an uploaded supplier invoice in one bulk transaction"""
+    if current_user.role != 'storesman':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    
+    file = request.files.get('invoice_file')
+    if not file or file.filename == '':
+        flash('No invoice file selected', 'error')
+        return redirect(url_for('bulk_receive_materials'))
+    if not import_format(file.filename):
+        flash('Invalid file format. Please upload .xlsx, .xls or .csv files only.', 'error')
+        return redirect(url_for('bulk_receive_materials'))
+    
+    # Uploads saved so far, removed again when nothing is received
+    saved_paths = []
+    try:
+        site_id = current_user.assigned_site_id
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs('uploads', exist_ok=True)
+        
+        # The invoice file is kept as the supporting document unless a scan of the invoice is attached
+        invoice_path = os.path.join('uploads', f"grn_{timestamp}_{secure_filename(file.filename) or 'invoice'}")
+        file.save(invoice_path)
+        saved_paths.append(invoice_path)
+        plan = GrnImportService.plan(site_id, invoice_path, file.filename, request.form.get('skip_header') == '1')
+        
+        if len(plan.errors):
+            discard_uploads(saved_paths)
+            flash(f'{len(plan.errors)} invoice lines could not be matched; nothing was received', 'error')
+            materials = Material.query.all()
+            return render_template('bulk_receive_materials.html', materials=materials, grn_errors=plan.errors)
+        
+        supporting_document_url = invoice_path
+        document = request.files.get('supporting_document')
+        if document and document.filename:
+            supporting_document_url = os.path.join('uploads', f"grn_{timestamp}_{secure_filename(document.filename)}")
+            document.save(supporting_document_url)
+            # The scan replaces the invoice file as the supporting document
+            if supporting_document_url != invoice_path:
+                os.remove(invoice_path)
+            saved_paths = [supporting_document_url]
+        
+        count = GrnImportService.apply(
+            plan,
+            created_by=current_user.id,
+            supplier=request.form.get('supplier'),
+            invoice_number=request.form.get('invoice_number'),
+            supporting_document_url=supporting_document_url,
+            project_code=request.form.get('project_code'),
+            notes=request.form.get('notes')
+        )
+        flash(f'Invoice received: {count} transactions created for {len(plan.diff)} materials.', 'success')
+        
+    except ValueError as e:
+        discard_uploads(saved_paths)
+        flash(str(e), 'error')
+    except Exception as e:
+        db.session.rollback()
+        discard_uploads(saved_paths)
+        logging.error(f"Error importing GRN: {str(e)}")
+        flash(f'Error importing invoice: {str(e)}', 'error')
+    
+    return redirect(url_for('bulk_receive_materials'))
+
+
+def discard_uploads(paths):
+    """Remove uploaded files no transaction links to"""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
 @app.route('/view_document/<path:filename>')
 @login_required
 def view_document(filename):
@@ -1626,6 +1646,7 @@ def submit_material_request():
         )
         
         db.session.add(issue_request)
+        InventoryService.bump_site_version(site_id)
         db.session.commit()
         
         flash('Material request submitted successfully', 'success')
@@ -1668,56 +1689,25 @@ def submit_batch_request():
     
     try:
         site_id = current_user.assigned_site_id
-        project_code = request.form.get('project_code')
-        purpose = request.form.get('purpose')
-        
-        # Generate batch ID
-        batch_id = BatchIssueRequest.generate_batch_id()
         
-        # Create batch request
-        batch_request = BatchIssueRequest(
-            batch_id=batch_id,
-            site_id=site_id,
-            project_code=project_code,
-            purpose=purpose,
-            requested_by=current_user.id
+        # Rows are numbered by the form; removed rows leave gaps in the numbering
+        items = []
+        for key, material_id in request.form.items():
+            if key.startswith('material_id_') and material_id:
+                quantity = request.form.get(f"quantity_{key[len('material_id_'):]}")
+                items.append((int(material_id), float(quantity or 0)))
+        
+        batch_id = InventoryService.create_batch_issue_request(
+            site_id,
+            items,
+            requested_by=current_user.id,
+            project_code=request.form.get('project_code'),
+            purpose=request.form.get('purpose')
         )
-        
-        db.session.add(batch_request)
-        db.session.flush()  # Get the batch_id
-        
-        # Process batch items
-        item_count = 0
-        i = 0
-        while request.form.get(f'material_id_{i}'):
-            material_id = int(request.form.get(f'material_id_{i}'))
-            quantity = float(request.form.get(f'quantity_{i}'))
-            
-            if quantity > 0:
-                # Check stock availability
-                stock_level = StockLevel.query.filter_by(site_id=site_id, material_id=material_id).first()
-                if not stock_level or stock_level.quantity < quantity:
-                    material = Material.query.get(material_id)
-                    flash(f'Insufficient stock for {material.name}', 'error')
-                    return redirect(url_for('batch_request'))
-                
-                batch_item = BatchIssueItem(
-                    batch_id=batch_id,
-                    material_id=material_id,
-                    quantity_requested=quantity
-                )
-                db.session.add(batch_item)
-                item_count += 1
-            
-            i += 1
-        
-        if item_count == 0:
-            flash('Please add at least one material to the batch request', 'error')
-            return redirect(url_for('batch_request'))
-        
-        db.session.commit()
         flash(f'Batch request {batch_id} submitted successfully', 'success')
         
+    except ValueError as e:
+        flash(str(e), 'error')
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error submitting batch request: {str(e)}")
@@ -1767,6 +1757,41 @@ def view_transactions():
                          selected_type=transaction_type)
 
 # Report Generation Routes
+REPORT_MIMETYPES = {'excel': EXCEL_MIMETYPE, 'csv': 'text/csv', 'zip': 'application/zip'}
+
+
+def report_mimetype(report_format):
+    return REPORT_MIMETYPES.get(report_format, 'application/pdf')
+
+
+def send_report_file(path, download_name, report_format):
+    """Send a cached report artifact to the client"""
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=report_mimetype(report_format)
+    )
+
+
+def queue_report(job_type, params, report_format):
+    """
+    Serve a report straight from the artifact cache, or queue it for the background
+    report worker and send the user to the job status page
+    """
+    if job_type != 'receipts_zip' and report_format not in REPORT_FORMATS:
+        flash('Unsupported report format', 'error')
+        return redirect(url_for('reports'))
+    
+    cache_key, download_name = ReportJobService.describe(job_type, params, report_format)
+    cached_path = report_cache.get(cache_key)
+    if cached_path:
+        return send_report_file(cached_path, download_name, report_format)
+    
+    job = ReportJobService.submit(job_type, params, report_format, current_user.id)
+    return redirect(url_for('report_job_status', job_id=job.id))
+
+
 @app.route('/reports', methods=['GET', 'POST'])
 @login_required
 def reports():
@@ -1805,54 +1830,7 @@ def generate_daily_report():
             flash('Access denied to this site', 'error')
             return redirect(url_for('reports'))
         
-        issues_data = ReportService.generate_daily_issues_report(site_id, report_date)
-        
-        # Get system settings for currency and company name
-        system_settings = SystemSettings.query.first()
-        currency = system_settings.currency if system_settings else 'ZMW'
-        company_name = system_settings.company_name if system_settings else 'Construction Company'
-        
-        if report_format == 'excel':
-            # Use enhanced Excel generator
-            excel_generator = EnhancedExcelReportGenerator()
-            excel_data = {
-                'transactions': [
-                    {
-                        'serial_number': txn.serial_number,
-                        'date': txn.created_at.strftime('%d/%m/%Y %H:%M'),
-                        'material_name': txn.material_name,
-                        'quantity': abs(txn.quantity),
-                        'unit': txn.unit,
-                        'unit_cost': txn.unit_cost,
-                        'total_value': abs(txn.total_value),
-                        'project_code': txn.issued_to_project_code or 'N/A'
-                    } for txn in issues_data
-                ]
-            }
-            
-            excel_buffer = excel_generator.generate_comprehensive_excel_report(
-                company_name, excel_data, currency
-            )
-            
-            return send_file(
-                excel_buffer,
-                as_attachment=True,
-                download_name=f'daily_issues_{site.name}_{report_date.strftime("%Y%m%d")}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            # Use professional PDF generator
-            report_generator = ProfessionalReportGenerator()
-            pdf_buffer = report_generator.generate_daily_issues_report(
-                company_name, site.name, report_date, issues_data, currency
-            )
-            
-            return send_file(
-                pdf_buffer,
-                as_attachment=True,
-                download_name=f'daily_issues_{site.name}_{report_date.strftime("%Y%m%d")}.pdf',
-                mimetype='application/pdf'
-            )
+        return queue_report('daily_issues', {'site_id': site_id, 'report_date': report_date.isoformat()}, report_format)
         
     except Exception as e:
         logging.error(f"Error generating daily report: {str(e)}")
@@ -1882,54 +1860,7 @@ def generate_stock_report():
             flash('Access denied to this site', 'error')
             return redirect(url_for('reports'))
         
-        stock_data = ReportService.generate_stock_summary_report(site_id)
-        
-        # Get system settings for currency and company name
-        system_settings = SystemSettings.query.first()
-        currency = system_settings.currency if system_settings else 'ZMW'
-        company_name = system_settings.company_name if system_settings else 'Construction Company'
-        
-        if format_type == 'excel':
-            # Use enhanced Excel generator
-            excel_generator = EnhancedExcelReportGenerator()
-            excel_data = {
-                'stock_levels': [
-                    {
-                        'material_name': item.material_name,
-                        'category': item.category or 'N/A',
-                        'quantity': item.quantity,
-                        'unit': item.unit,
-                        'unit_cost': item.total_value / item.quantity if item.quantity > 0 else 0,
-                        'total_value': item.total_value,
-                        'minimum_level': item.minimum_level,
-                        'status': 'LOW STOCK' if item.quantity < item.minimum_level else 'OK'
-                    } for item in stock_data
-                ]
-            }
-            
-            excel_buffer = excel_generator.generate_comprehensive_excel_report(
-                company_name, excel_data, currency
-            )
-            
-            return send_file(
-                excel_buffer,
-                as_attachment=True,
-                download_name=f'stock_summary_{site.name}_{datetime.now().strftime("%Y%m%d")}.xlsx',
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            # Use professional PDF generator
-            report_generator = ProfessionalReportGenerator()
-            pdf_buffer = report_generator.generate_stock_summary_report(
-                company_name, site.name, stock_data, currency
-            )
-            
-            return send_file(
-                pdf_buffer,
-                as_attachment=True,
-                download_name=f'stock_summary_{site.name}_{datetime.now().strftime("%Y%m%d")}.pdf',
-                mimetype='application/pdf'
-            )
+        return queue_report('stock_summary', {'site_id': site_id}, format_type)
         
     except Exception as e:
         logging.error(f"Error generating stock report: {str(e)}")
@@ -1937,6 +1868,25 @@ def generate_stock_report():
         return redirect(url_for('reports'))
 
 
+@app.route('/generate_consolidated_report')
+@login_required
+def generate_consolidated_report():
+    """Generate the stock report across all sites"""
+    if current_user.role != 'site_engineer':
+        flash('Access denied', 'error')
+        return redirect(url_for('reports'))
+    
+    report_format = request.args.get('format', 'excel')
+    
+    try:
+        return queue_report('consolidated_stock', {}, report_format)
+        
+    except Exception as e:
+        logging.error(f"Error generating consolidated report: {str(e)}")
+        flash('Error generating report', 'error')
+        return redirect(url_for('reports'))
+
+
 @app.route('/generate_transaction_history_report')
 @login_required
 def generate_transaction_history_report():
@@ -1957,86 +1907,19 @@ def generate_transaction_history_report():
         return redirect(url_for('reports'))
     
     try:
-        # Parse dates if provided
-        start_date_obj = None
-        end_date_obj = None
-        
+        # Validate dates if provided
         if start_date:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
+            datetime.strptime(start_date, '%Y-%m-%d')
         if end_date:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
+            datetime.strptime(end_date, '%Y-%m-%d')
         
         site = Site.query.get(site_id)
         if not site:
             flash('Site not found', 'error')
             return redirect(url_for('reports'))
         
-        # Get transaction history
-        transactions_data = ReportService.generate_transaction_history_report(
-            site_id, start_date_obj, end_date_obj
-        )
-        
-        # Debug logging
-        logging.info(f"Transaction data for site {site_id}: {len(transactions_data)} transactions")
-        if transactions_data:
-            for i, txn in enumerate(transactions_data[:3]):  # Log first 3 transactions
-                logging.info(f"Transaction {i+1}: {txn.serial_number} - {txn.type} - {txn.quantity}")
-        
-        # Generate filename
-        date_suffix = f"_{start_date}_{end_date}" if start_date and end_date else ""
-        
-        # Get system settings for currency and company name
-        system_settings = SystemSettings.query.first()
-        currency = system_settings.currency if system_settings else 'ZMW'
-        company_name = system_settings.company_name if system_settings else 'Construction Company'
-        
-        if report_format == 'excel':
-            # Use enhanced Excel generator
-            excel_generator = EnhancedExcelReportGenerator()
-            excel_data = {
-                'transactions': [
-                    {
-                        'serial_number': txn.serial_number,
-                        'date': txn.created_at.strftime('%d/%m/%Y %H:%M'),
-                        'material_name': txn.material_name,
-                        'type': txn.type.upper(),
-                        'quantity': txn.quantity,
-                        'unit': txn.unit,
-                        'unit_cost': txn.unit_cost,
-                        'total_value': txn.total_value,
-                        'project_code': txn.issued_to_project_code or 'N/A',
-                        'created_by': txn.creator.username if hasattr(txn, 'creator') and txn.creator else 'System'
-                    } for txn in transactions_data
-                ]
-            }
-            
-            excel_buffer = excel_generator.generate_comprehensive_excel_report(
-                company_name, excel_data, currency
-            )
-            
-            filename = f"transaction_history_{site.name.replace(' ', '_')}{date_suffix}.xlsx"
-            
-            return send_file(
-                excel_buffer,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-        else:
-            # Use professional PDF generator
-            report_generator = ProfessionalReportGenerator()
-            pdf_buffer = report_generator.generate_transaction_history_report(
-                company_name, site.name, transactions_data, start_date_obj, end_date_obj, currency
-            )
-            
-            filename = f"transaction_history_{site.name.replace(' ', '_')}{date_suffix}.pdf"
-            
-            return send_file(
-                pdf_buffer,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/pdf'
-            )
+        params = {'site_id': site_id, 'start_date': start_date or None, 'end_date': end_date or None}
+        return queue_report('transaction_history', params, report_format)
         
     except Exception as e:
         logging.error(f"Error generating transaction history report: {str(e)}")
@@ -2236,22 +2119,13 @@ def api_stock_levels(site_id):
     if current_user.role == 'storesman' and current_user.assigned_site_id != site_id:
         return jsonify({'error': 'Access denied'}), 403
     
-    stock_summary = InventoryService.get_stock_summary(site_id)
-    
-    data = []
-    for item in stock_summary:
-        data.append({
-            'material_id': item.material_id,
-            'material_name': item.material_name,
-            'unit': item.unit,
-            'quantity': item.quantity,
-            'total_value': item.total_value,
-            'average_cost': item.total_value / item.quantity if item.quantity > 0 else 0,
-            'minimum_level': item.minimum_level,
-            'is_low_stock': item.quantity < item.minimum_level
-        })
+    # Derived columns come from the stock summary dataset, computed over whole columns
+    stock_frame = ReportEngine.fetch_frame('stock_summary', {'site_id': site_id})
+    stock_frame['average_cost'] = stock_frame['unit_cost']
+    stock_frame['is_low_stock'] = stock_frame['status'] == 'LOW STOCK'
     
-    return jsonify(data)
+    columns = ['material_id', 'material_name', 'unit', 'quantity', 'total_value', 'average_cost', 'minimum_level', 'is_low_stock']
+    return jsonify(stock_frame[columns].to_dict(orient='records'))
 
 
 @app.route('/api/materials')
@@ -2346,41 +2220,13 @@ def download_receipt(transaction_id):
             flash('Receipts are only available for material receipts', 'warning')
             return redirect(url_for('reports'))
         
-        # Get related data
-        site_data = {
-            'name': transaction.site.name,
-            'location': transaction.site.location or 'N/A',
-            'code': transaction.site.code or 'N/A'
-        }
-        
-        user_data = {
-            'username': transaction.creator_user.username,
-            'role': transaction.creator_user.role
-        }
-        
-        # Get company settings
-        system_settings = SystemSettings.query.first()
-        company_settings = {
-            'company_name': system_settings.company_name if system_settings else 'Construction Company',
-            'currency': system_settings.currency if system_settings else 'ZMW'
-        }
-        
-        # Generate receipt
-        receipt_generator = ReceiptGenerator()
-        transaction_data = receipt_generator.extract_transaction_data(transaction)
-        
-        # Generate PDF
-        pdf_buffer = receipt_generator.generate_receipt(
-            transaction_data, site_data, user_data, company_settings
-        )
-        
-        # Create filename
-        filename = f"Receipt_{transaction.serial_number}_{transaction.created_at.strftime('%Y%m%d')}.pdf"
+        # Receipts are rendered once and served from the receipt store afterwards
+        receipt_path = ReceiptStore.get_or_render(transaction)
         
         return send_file(
-            pdf_buffer,
+            receipt_path,
             as_attachment=True,
-            download_name=filename,
+            download_name=receipt_filename(transaction),
             mimetype='application/pdf'
         )
         
@@ -2393,78 +2239,33 @@ def download_receipt(transaction_id):
 @app.route('/download_all_receipts')
 @login_required
 def download_all_receipts():
-    """Download all receipts for receive transactions as a ZIP file"""
+    """Download goods received vouchers for a site and date range as a ZIP file"""
     try:
-        import zipfile
-        from io import BytesIO
+        site_id = request.args.get('site_id', type=int)
+        start_date = request.args.get('start_date') or None
+        end_date = request.args.get('end_date') or None
         
-        # Get receive transactions based on user role
+        # Storesmen only get receipts for their assigned site
         if current_user.role == 'storesman':
-            transactions = Transaction.query.filter_by(
-                site_id=current_user.assigned_site_id,
-                type='receive'
-            ).order_by(Transaction.created_at.desc()).limit(100).all()
-        else:
-            transactions = Transaction.query.filter_by(
-                type='receive'
-            ).order_by(Transaction.created_at.desc()).limit(100).all()
+            site_id = current_user.assigned_site_id
         
-        if not transactions:
+        receipts_query = Transaction.query.filter_by(type='receive')
+        if site_id:
+            receipts_query = receipts_query.filter_by(site_id=site_id)
+        if start_date:
+            receipts_query = receipts_query.filter(
+                Transaction.created_at >= datetime.strptime(start_date, '%Y-%m-%d')
+            )
+        if end_date:
+            receipts_query = receipts_query.filter(
+                Transaction.created_at < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+            )
+        if not receipts_query.first():
             flash('No receipt transactions found', 'warning')
             return redirect(url_for('reports'))
         
-        # Create ZIP file in memory
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            receipt_generator = ReceiptGenerator()
-            
-            for transaction in transactions:
-                try:
-                    # Get related data
-                    site_data = {
-                        'name': transaction.site.name,
-                        'location': transaction.site.location or 'N/A',
-                        'code': transaction.site.code or 'N/A'
-                    }
-                    
-                    user_data = {
-                        'username': transaction.creator_user.username if transaction.creator_user else 'Unknown',
-                        'role': transaction.creator_user.role if transaction.creator_user else 'Unknown'
-                    }
-                    
-                    # Get company settings
-                    system_settings = SystemSettings.query.first()
-                    company_settings = {
-                        'company_name': system_settings.company_name if system_settings else 'Construction Company',
-                        'currency': system_settings.currency if system_settings else 'ZMW'
-                    }
-                    
-                    # Generate receipt
-                    transaction_data = receipt_generator.extract_transaction_data(transaction)
-                    pdf_buffer = receipt_generator.generate_receipt(
-                        transaction_data, site_data, user_data, company_settings
-                    )
-                    
-                    # Add to ZIP
-                    filename = f"Receipt_{transaction.serial_number}_{transaction.created_at.strftime('%Y%m%d')}.pdf"
-                    zip_file.writestr(filename, pdf_buffer.getvalue())
-                    
-                except Exception as e:
-                    logging.error(f"Error generating receipt for transaction {transaction.serial_number}: {str(e)}")
-                    continue
-        
-        zip_buffer.seek(0)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        zip_filename = f"Material_Receipts_{timestamp}.zip"
-        
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=zip_filename,
-            mimetype='application/zip'
-        )
+        params = {'site_id': site_id, 'start_date': start_date, 'end_date': end_date}
+        return queue_report('receipts_zip', params, 'zip')
         
     except Exception as e:
         logging.error(f"Error generating receipts ZIP: {str(e)}")
@@ -2505,6 +2306,123 @@ def api_pending_counts():
     })
 
 
+
+@app.route('/api/activity_trend')
+@login_required
+def api_activity_trend():
+    """API endpoint for daily ledger activity trends (defaults to the last 90 days)"""
+    days = min(max(request.args.get('days', 90, type=int), 1), 366)
+    site_id = request.args.get('site_id', type=int)
+    
+    # Storesmen only see their assigned site
+    if current_user.role == 'storesman':
+        site_id = current_user.assigned_site_id
+        if not site_id:
+            return jsonify([])
+    
+    data = []
+    for row in ActivityCounterService.get_trend(days, site_id):
+        data.append({
+            'date': row.business_date.isoformat(),
+            'type': row.type,
+            'count': int(row.count or 0),
+            'quantity': float(row.quantity or 0),
+            'total_value': float(row.total_value or 0)
+        })
+    
+    return jsonify(data)
+
+
+@app.route('/api/export/transactions.csv')
+@login_required
+def api_export_transactions_csv():
+    """Stream the transactions ledger as CSV for a site and date range"""
+    site_id = request.args.get('site_id', type=int)
+    
+    # Storesmen can only export their assigned site
+    if current_user.role == 'storesman':
+        if not current_user.assigned_site_id or (site_id and site_id != current_user.assigned_site_id):
+            return jsonify({'error': 'Access denied'}), 403
+        site_id = current_user.assigned_site_id
+    
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    chunks = iter_ledger_csv(site_id, start_date, end_date)
+    headers = {'Content-Disposition': 'attachment; filename="transactions.csv"'}
+    
+    # Compress on the fly when the client accepts gzip
+    if request.args.get('gzip', 1, type=int) and 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    
+    return Response(stream_with_context(chunks), mimetype='text/csv', headers=headers)
+
+
+def get_report_job_or_none(job_id):
+    """Get a report job visible to the current user"""
+    job = ReportJob.query.get(job_id)
+    if not job:
+        return None
+    if current_user.role != 'site_engineer' and job.requested_by != current_user.id:
+        return None
+    return job
+
+
+@app.route('/reports/jobs/<int:job_id>')
+@login_required
+def report_job_status(job_id):
+    """Show a queued report and download it when ready"""
+    job = get_report_job_or_none(job_id)
+    if not job:
+        flash('Report not found', 'error')
+        return redirect(url_for('reports'))
+    
+    return render_template('report_job.html', job=job)
+
+
+@app.route('/api/report_jobs/<int:job_id>')
+@login_required
+def api_report_job(job_id):
+    """API endpoint for polling report job status"""
+    job = get_report_job_or_none(job_id)
+    if not job:
+        return jsonify({'error': 'Report job not found'}), 404
+    
+    return jsonify({
+        'id': job.id,
+        'job_type': job.job_type,
+        'format': job.report_format,
+        'status': job.status,
+        'error': job.error_message if job.status == JOB_FAILED else None,
+        'download_url': url_for('download_report_job', job_id=job.id) if job.status == JOB_COMPLETED else None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None
+    })
+
+
+@app.route('/reports/jobs/<int:job_id>/download')
+@login_required
+def download_report_job(job_id):
+    """Download the file produced by a completed report job"""
+    job = get_report_job_or_none(job_id)
+    if not job:
+        flash('Report not found', 'error')
+        return redirect(url_for('reports'))
+    
+    artifact_path = ReportJobService.artifact_path(job)
+    if not artifact_path:
+        flash('This report is no longer available, please generate it again', 'warning')
+        return redirect(url_for('reports'))
+    
+    return send_report_file(artifact_path, job.download_name, job.report_format)
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -2547,6 +2465,7 @@ def transaction_history():
 @app.route('/bulk_stock_adjustments')
 @login_required  
 def bulk_stock_adjustments():
+    """Cycle count page: download a count sheet and upload the counted sheet for a site"""
     if current_user.role not in ['site_engineer', 'storesman']:
         flash('Access denied', 'error')
         return redirect(url_for('index'))
@@ -2559,15 +2478,138 @@ def bulk_stock_adjustments():
         site_id = request.args.get('site_id', type=int)
         sites = Site.query.all()
     
-    # Get stock levels for the site
-    stock_levels = []
+    recent_counts = []
     if site_id:
-        stock_levels = StockLevel.query.filter_by(site_id=site_id).all()
+        recent_counts = StockAdjustment.query.filter_by(site_id=site_id).order_by(
+            StockAdjustment.adjusted_at.desc()
+        ).limit(20).all()
     
-    return render_template('stock_adjustments.html',
-                         stock_levels=stock_levels,
+    return render_template('cycle_count.html',
                          sites=sites,
-                         selected_site_id=site_id)
+                         selected_site_id=site_id,
+                         recent_counts=recent_counts,
+                         preview=None)
+
+
+def _cycle_count_site_id(requested_site_id):
+    """The site a cycle count applies to, or None when the user may not count it"""
+    if current_user.role == 'storesman':
+        return current_user.assigned_site_id
+    if current_user.role == 'site_engineer' and requested_site_id and db.session.get(Site, requested_site_id):
+        return requested_site_id
+    return None
+
+
+@app.route('/cycle_counts/sheet')
+@login_required
+def download_count_sheet():
+    """A blank count sheet listing every material stocked at the site"""
+    site_id = _cycle_count_site_id(request.args.get('site_id', type=int))
+    if not site_id:
+        flash('Select a site to count', 'error')
+        return redirect(url_for('bulk_stock_adjustments'))
+    
+    rows = db.session.query(Material.name, Material.sku, Material.unit).join(
+        StockLevel, StockLevel.material_id == Material.id
+    ).filter(StockLevel.site_id == site_id).order_by(Material.category, Material.name).all()
+    
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Material', 'SKU', 'Unit', 'Counted Quantity'])
+    writer.writerows([name, sku or '', unit, ''] for name, sku, unit in rows)
+    return Response(output.getvalue(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=count_sheet_site_{site_id}_{date.today().isoformat()}.csv'
+    })
+
+
+@app.route('/cycle_counts', methods=['POST'])
+@login_required
+def process_cycle_count():
+    """Preview or apply an uploaded count sheet in one atomic bulk write"""
+    site_id = _cycle_count_site_id(request.form.get('site_id', type=int))
+    if not site_id:
+        flash('Access denied', 'error')
+        return redirect(url_for('bulk_stock_adjustments'))
+    
+    file = request.files.get('count_sheet')
+    if not file or file.filename == '':
+        flash('No file selected', 'error')
+        return redirect(url_for('bulk_stock_adjustments', site_id=site_id))
+    
+    preview_only = request.form.get('preview') == '1'
+    reason = request.form.get('reason') or DEFAULT_COUNT_REASON
+    try:
+        suffix = os.path.splitext(file.filename)[1].lower()
+        with tempfile.NamedTemporaryFile(suffix=suffix) as upload:
+            file.save(upload.name)
+            first_row, df = CycleCountService.read(upload.name, file.filename, request.form.get('skip_header') == '1')
+        
+        plan = CycleCountService.plan(site_id, df, first_row, for_update=not preview_only)
+        if preview_only or len(plan.errors):
+            db.session.rollback()
+            if len(plan.errors):
+                flash(f'{len(plan.errors)} lines were rejected; nothing was adjusted', 'error')
+            sites = Site.query.all() if current_user.role == 'site_engineer' else [current_user.assigned_site]
+            return render_template('cycle_count.html',
+                                 sites=sites,
+                                 selected_site_id=site_id,
+                                 recent_counts=[],
+                                 preview=plan)
+        
+        counted, adjusted = CycleCountService.apply(plan, current_user.id, reason)
+        flash(f'Cycle count applied: {counted} items counted, {adjusted} adjusted', 'success')
+        
+    except ValueError as e:
+        flash(str(e), 'error')
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error processing cycle count: {str(e)}")
+        flash('Error processing cycle count', 'error')
+    
+    return redirect(url_for('bulk_stock_adjustments', site_id=site_id))
+
+
+@app.route('/api/cycle_counts', methods=['POST'])
+@login_required
+def api_cycle_count():
+    """
+    Apply a count sheet posted as JSON: {"site_id": 1, "reason": "...", "dry_run": false,
+    "counts": [{"material_id": 3, "counted_quantity": 120}, {"sku": "CEM-50", "counted_quantity": 40}]}
+    """
+    data = request.get_json(silent=True) or {}
+    requested_site_id = data.get('site_id')
+    site_id = _cycle_count_site_id(requested_site_id if isinstance(requested_site_id, int) else None)
+    if not site_id:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    try:
+        first_row, df = CycleCountService.from_records(data.get('counts', []))
+        plan = CycleCountService.plan(site_id, df, first_row, for_update=not data.get('dry_run'))
+        errors = plan.errors.to_dict(orient='records')
+        discrepancies = plan.lines.loc[plan.lines['discrepancy'] != 0, [key for key, _ in CYCLE_COUNT_DIFF]]
+        result = {
+            'site_id': site_id,
+            'counted': len(plan.lines),
+            'discrepancies': discrepancies.to_dict(orient='records'),
+            'rejected': errors
+        }
+        if errors:
+            db.session.rollback()
+            return jsonify(dict(result, error='Some counts were rejected; nothing was adjusted')), 400
+        if data.get('dry_run'):
+            db.session.rollback()
+            return jsonify(dict(result, applied=False))
+        
+        counted, adjusted = CycleCountService.apply(plan, current_user.id, data.get('reason'))
+        return jsonify(dict(result, applied=True, adjusted=adjusted))
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error applying cycle count: {str(e)}")
+        return jsonify({'error': 'Error applying cycle count'}), 500
 
 
 @app.route('/batch_operations')
@@ -2620,90 +2662,22 @@ def generate_report():
 @app.route('/export_excel')
 @login_required
 def export_excel():
-    """Generate and download Excel export"""
-    try:
-        # Default stock report export
-        sites = Site.query.all()
-        if not sites:
-            flash('No sites available', 'error')
-            return redirect(url_for('reports'))
-        
-        # Use first site as default
-        site_id = sites[0].id
-        stock_data = InventoryService.get_stock_levels_for_site(site_id)
-        
-        # Generate Excel report
-        excel_generator = EnhancedExcelReportGenerator()
-        excel_data = {
-            'stock_levels': [
-                {
-                    'material_name': stock.material.name,
-                    'current_stock': stock.quantity,
-                    'unit': stock.material.unit,
-                    'minimum_level': stock.material.minimum_level,
-                    'category': stock.material.category,
-                    'cost_per_unit': stock.material.cost_per_unit,
-                    'total_value': stock.quantity * stock.material.cost_per_unit
-                } for stock in stock_data
-            ]
-        }
-        
-        system_settings = SystemSettings.query.first()
-        company_name = system_settings.company_name if system_settings else 'Construction Company'
-        currency = system_settings.currency if system_settings else 'ZMW'
-        
-        excel_buffer = excel_generator.generate_comprehensive_excel_report(
-            company_name, excel_data, currency
-        )
-        
-        return send_file(
-            excel_buffer,
-            as_attachment=True,
-            download_name=f"stock_report_{datetime.now().strftime('%Y%m%d')}.xlsx",
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        
-    except Exception as e:
-        logging.error(f"Error generating Excel export: {str(e)}")
-        flash('Error generating Excel export', 'error')
-        return redirect(url_for('reports'))
+    """Generate and download the company-wide Excel export"""
+    return export_consolidated_report('excel')
 
 @app.route('/export_pdf')
 @login_required
 def export_pdf():
-    """Generate and download PDF export"""
+    """Generate and download the company-wide PDF export"""
+    return export_consolidated_report('pdf')
+
+def export_consolidated_report(report_format):
+    """The quick exports stay open to every signed-in user, unlike the report page's consolidated report"""
     try:
-        # Default stock report export
-        sites = Site.query.all()
-        if not sites:
-            flash('No sites available', 'error')
-            return redirect(url_for('reports'))
-        
-        # Use first site as default
-        site_id = sites[0].id
-        site = Site.query.get(site_id)
-        stock_data = InventoryService.get_stock_levels_for_site(site_id)
-        
-        # Generate PDF report
-        system_settings = SystemSettings.query.first()
-        company_name = system_settings.company_name if system_settings else 'Construction Company'
-        currency = system_settings.currency if system_settings else 'ZMW'
-        
-        report_generator = ProfessionalReportGenerator()
-        pdf_buffer = report_generator.generate_stock_level_report(
-            company_name, site.name, stock_data, currency
-        )
-        
-        return send_file(
-            pdf_buffer,
-            as_attachment=True,
-            download_name=f"stock_report_{site.name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.pdf",
-            mimetype='application/pdf'
-        )
-        
+        return queue_report('consolidated_stock', {}, report_format)
     except Exception as e:
-        logging.error(f"Error generating PDF export: {str(e)}")
-        flash('Error generating PDF export', 'error')
+        logging.error(f"Error generating {report_format} export: {str(e)}")
+        flash(f'Error generating {report_format.upper()} export', 'error')
         return redirect(url_for('reports'))
 
 @app.route('/issue_material')
@@ -0,0 +1,142 @@
+"""
+Static Artifacts
+Downloads that are the same for every user, such as the material upload template,
+are built once and kept on disk under a version derived from what they depend on:
+a digest of the layout and sample rows for fixed artifacts (so they are rebuilt
+only when a deploy changes them), and the material catalog version for artifacts
+pre-filled with current materials. The report worker rebuilds stale artifacts in
+the background and downloads serve the stored file with long-lived caching headers.
+"""
+
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from app import app, db
+from models_new import Material
+from fragment_cache import get_catalog_version
+from material_import import MATERIAL_COLUMNS, SKU_COLUMN
+from streaming_excel import StreamingExcelWriter
+
+# Bump when the layout of a generated artifact changes without its rows changing
+ARTIFACT_LAYOUT_VERSION = 1
+
+# Seconds browsers may keep a versioned download without asking again
+STATIC_ARTIFACT_MAX_AGE = 365 * 24 * 3600
+
+SAMPLE_MATERIALS = [
+    ('Portland Cement', 'bags', 'High quality Portland cement for construction', 8.50, 50, 'Construction'),
+    ('Steel Rebar 12mm', 'kg', 'Steel reinforcement bars 12mm diameter', 0.85, 500, 'Construction'),
+    ('Ready Mix Concrete', 'm3', 'Ready mix concrete M20 grade', 120.00, 10, 'Construction'),
+    ('Electrical Wire 2.5mm', 'm', 'Electrical wire 2.5mm copper', 2.30, 100, 'Electrical'),
+    ('PVC Pipe 110mm', 'm', 'PVC drainage pipe 110mm diameter', 15.75, 20, 'Plumbing'),
+    ('Grass Seed', 'kg', 'Lawn grass seed for landscaping', 25.00, 50, 'Gardening'),
+    ('Garden Soil', 'bags', 'Organic garden soil for planting', 15.00, 100, 'Gardening'),
+    ('Brick Blocks', 'pcs', 'Standard brick blocks for masonry', 0.45, 1000, 'Masonry'),
+    ('Plumbing Fittings', 'pcs', 'Copper pipe fittings for plumbing', 12.50, 100, 'Plumbing'),
+    ('Paint Brushes', 'pcs', 'Professional paint brushes for finishing', 8.50, 50, 'Finishing'),
+]
+
+# name: artifact key; download_name: file name offered to the browser; catalog: whether
+# it is built from the material catalog; headers and rows: sheet columns and a callable
+# returning its rows
+Artifact = namedtuple('Artifact', 'name download_name catalog headers rows')
+
+
+def _catalog_rows():
+    """Every material as an upload row, so the file can be edited and imported back"""
+    return db.session.query(
+        Material.name, Material.unit, Material.description, Material.cost_per_unit,
+        Material.minimum_level, Material.category, Material.sku
+    ).order_by(Material.category, Material.name).all()
+
+
+ARTIFACTS = {
+    artifact.name: artifact for artifact in (
+        Artifact('material_template', 'material_upload_template.xlsx', False,
+                 MATERIAL_COLUMNS, lambda: SAMPLE_MATERIALS),
+        Artifact('material_catalog', 'material_catalog.xlsx', True,
+                 MATERIAL_COLUMNS + [SKU_COLUMN], _catalog_rows),
+    )
+}
+
+
+def _fixed_version(artifact):
+    """Digest of everything a fixed artifact is built from"""
+    parts = [ARTIFACT_LAYOUT_VERSION, artifact.headers, artifact.rows()]
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+# Fixed artifacts only change with the code, so their versions are computed once per process
+_FIXED_VERSIONS = {name: _fixed_version(artifact) for name, artifact in ARTIFACTS.items() if not artifact.catalog}
+
+
+class StaticArtifactService:
+    """Service class for building and serving precomputed downloads"""
+
+    @staticmethod
+    def version(name):
+        """The current version of an artifact"""
+        if ARTIFACTS[name].catalog:
+            return f"c{get_catalog_version()}.{ARTIFACT_LAYOUT_VERSION}"
+        return _FIXED_VERSIONS[name]
+
+    @staticmethod
+    def path(name, version):
+        return os.path.join(app.config['STATIC_ARTIFACT_FOLDER'], f"{name}-{version}.xlsx")
+
+    @staticmethod
+    def build(name):
+        """Build the current version of an artifact and return (path, version)"""
+        artifact = ARTIFACTS[name]
+        # The version is read before the rows, so a catalog change committed in between
+        # only makes the file newer than its version and the next bump rebuilds it
+        version = StaticArtifactService.version(name)
+        rows = artifact.rows()
+
+        directory = app.config['STATIC_ARTIFACT_FOLDER']
+        os.makedirs(directory, exist_ok=True)
+        path = StaticArtifactService.path(name, version)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            writer = StreamingExcelWriter()
+            writer.add_sheet('Materials', artifact.headers, rows, number_formats={3: '#,##0.00'})
+            writer.save(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        # Older versions are no longer linked to
+        for entry in os.scandir(directory):
+            if entry.name.startswith(f"{name}-") and entry.name.endswith('.xlsx') and entry.path != path:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        logging.info(f"Built static artifact {name} version {version} ({len(rows)} rows)")
+        return path, version
+
+    @staticmethod
+    def get(name, version=None):
+        """The file of an artifact's current version, building it when the worker has not yet"""
+        version = version or StaticArtifactService.version(name)
+        path = StaticArtifactService.path(name, version)
+        if os.path.exists(path):
+            return path
+        return StaticArtifactService.build(name)[0]
+
+    @staticmethod
+    def refresh():
+        """Build every artifact whose current version is not on disk; returns the number built"""
+        built = 0
+        for name in ARTIFACTS:
+            if not os.path.exists(StaticArtifactService.path(name, StaticArtifactService.version(name))):
+                StaticArtifactService.build(name)
+                built += 1
+        return built
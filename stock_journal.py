@@ -0,0 +1,240 @@
+"""
+Stock Journal
+Append-only record of the legacy stock flow (receipts and issuances by material
+name). Every change is one JSON line appended under an exclusive file lock, so
+concurrent workers never overwrite each other, and current stock and the
+issuance log are served from an in-memory index that is keyed on the journal's
+modification time and size and only reads lines appended since it was built.
+
+The construction_materials.xlsx workbook is an export of the journal, written
+on demand or periodically by the report worker, instead of the live store.
+"""
+
+from datetime import datetime
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from openpyxl import Workbook, load_workbook
+
+ENTRY_OPENING = 'opening'
+ENTRY_RECEIVE = 'receive'
+ENTRY_ISSUE = 'issue'
+
+STOCK_HEADERS = ['Material Name', 'Quantity', 'Unit', 'Last Updated', 'Updated By']
+LOG_HEADERS = ['Date', 'Material Name', 'Quantity Issued', 'Unit', 'Issued By', 'Notes', 'Remaining Stock']
+
+# Indexes per journal path, shared by every StockJournal in the process
+_indexes = {}
+_indexes_lock = threading.RLock()
+
+
+def _timestamp():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class _JournalIndex:
+    """Current stock and issuance log folded from the journal up to offset"""
+
+    def __init__(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.key = None
+        self.stock = {}
+        self.issuances = []
+
+    def apply(self, entry):
+        name = entry['material']
+        at, by = entry['at'], entry.get('by')
+        if entry['type'] == ENTRY_OPENING:
+            self.stock[name] = {'quantity': entry['quantity'], 'unit': entry.get('unit'),
+                                'last_updated': at, 'updated_by': by}
+        elif entry['type'] == ENTRY_RECEIVE:
+            current = self.stock.setdefault(name, {'quantity': 0, 'unit': entry.get('unit')})
+            current['quantity'] += entry['quantity']
+            current['last_updated'], current['updated_by'] = at, by
+        elif entry['type'] == ENTRY_ISSUE:
+            # Issuances imported from an old workbook are history only; its stock sheet already reflects them
+            if entry.get('applied', True) and name in self.stock:
+                current = self.stock[name]
+                current['quantity'] = max(0, current['quantity'] - entry['quantity'])
+                current['last_updated'], current['updated_by'] = at, by
+            self.issuances.append(entry)
+
+    def remaining(self, name):
+        current = self.stock.get(name)
+        return current['quantity'] if current else 0
+
+
+class StockJournal:
+    """Append-only stock journal with an incrementally maintained in-memory index"""
+
+    def __init__(self, path, workbook_path=None):
+        self.path = path
+        self.workbook_path = workbook_path
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if not os.path.exists(self.path):
+            self._seed_from_workbook()
+
+    def _seed_from_workbook(self):
+        """Start a new journal from the stock and issuance log of an existing workbook"""
+        with open(self.path, 'a', encoding='utf-8') as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            try:
+                if journal.tell() > 0 or not self.workbook_path or not os.path.exists(self.workbook_path):
+                    return
+                workbook = load_workbook(self.workbook_path, read_only=True, data_only=True)
+                try:
+                    entries = []
+                    if 'Issuance Log' in workbook.sheetnames:
+                        for row in workbook['Issuance Log'].iter_rows(min_row=2, values_only=True):
+                            row = tuple(row) + (None,) * (7 - len(row))
+                            if row[1]:
+                                entries.append({
+                                    'at': str(row[0] or ''), 'type': ENTRY_ISSUE, 'material': row[1],
+                                    'quantity': row[2] or 0, 'unit': row[3], 'by': row[4], 'notes': row[5] or '',
+                                    'remaining': row[6] or 0, 'applied': False
+                                })
+                    if 'Current Stock' in workbook.sheetnames:
+                        for row in workbook['Current Stock'].iter_rows(min_row=2, values_only=True):
+                            row = tuple(row) + (None,) * (5 - len(row))
+                            if row[0]:
+                                entries.append({
+                                    'at': str(row[3] or _timestamp()), 'type': ENTRY_OPENING, 'material': row[0],
+                                    'quantity': row[1] or 0, 'unit': row[2] or 'units', 'by': row[4]
+                                })
+                finally:
+                    workbook.close()
+                self._write(journal, entries)
+                logging.info(f"Started stock journal {self.path} from {self.workbook_path} ({len(entries)} entries)")
+            finally:
+                fcntl.flock(journal, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _write(journal, entries):
+        journal.write(''.join(json.dumps(entry, default=str) + '\n' for entry in entries))
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def _index(self):
+        """The index for the journal's current contents, reading only lines appended since the last call"""
+        stat = os.stat(self.path)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with _indexes_lock:
+            index = _indexes.get(self.path)
+            if index is not None and index.key == key:
+                return index
+            # A replaced or truncated journal is indexed again from the start
+            if index is None or index.inode != stat.st_ino or stat.st_size < index.offset:
+                index = _JournalIndex(stat.st_ino)
+            with open(self.path, 'rb') as journal:
+                journal.seek(index.offset)
+                data = journal.read(stat.st_size - index.offset)
+            # A line still being appended by another worker is picked up on a later call
+            complete = data[:data.rfind(b'\n') + 1]
+            for line in complete.splitlines():
+                if line.strip():
+                    index.apply(json.loads(line))
+            index.offset += len(complete)
+            index.key = key if len(complete) == len(data) else None
+            _indexes[self.path] = index
+            return index
+
+    def _append(self, build_entries):
+        """Append the entries built from the up-to-date index while holding the journal lock"""
+        with open(self.path, 'a', encoding='utf-8') as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            try:
+                entries = build_entries(self._index())
+                self._write(journal, entries)
+            finally:
+                fcntl.flock(journal, fcntl.LOCK_UN)
+        return entries
+
+    def record_receipts(self, materials, received_by):
+        """Append one receive entry per material (name, quantity, unit)"""
+        at = _timestamp()
+        return self._append(lambda index: [
+            {'at': at, 'type': ENTRY_RECEIVE, 'material': material['name'], 'quantity': material['quantity'],
+             'unit': material['unit'], 'by': received_by}
+            for material in materials
+        ])
+
+    def record_issuance(self, material_name, quantity_issued, unit, issued_by, notes=''):
+        """Append an issue entry with the stock remaining after it"""
+        def build(index):
+            if material_name in index.stock:
+                remaining = max(0, index.remaining(material_name) - quantity_issued)
+            else:
+                logging.warning(f"Material {material_name} not found in stock")
+                remaining = 0
+            return [{'at': _timestamp(), 'type': ENTRY_ISSUE, 'material': material_name, 'quantity': quantity_issued,
+                     'unit': unit, 'by': issued_by, 'notes': notes, 'remaining': remaining}]
+        entry, = self._append(build)
+        return entry
+
+    def current_stock(self):
+        """Current stock per material, in the order materials were first recorded"""
+        with _indexes_lock:
+            return [
+                {'material_name': name, 'quantity': data['quantity'], 'unit': data['unit'],
+                 'last_updated': data['last_updated'], 'updated_by': data['updated_by']}
+                for name, data in self._index().stock.items()
+            ]
+
+    def issuance_log(self, limit=None):
+        """Issuances oldest first; with limit, only the most recent ones"""
+        with _indexes_lock:
+            issuances = list(self._index().issuances)
+        if limit:
+            issuances = issuances[-limit:]
+        return [
+            {'date': entry['at'], 'material_name': entry['material'], 'quantity_issued': entry['quantity'],
+             'unit': entry.get('unit'), 'issued_by': entry.get('by'), 'notes': entry.get('notes', ''),
+             'remaining_stock': entry.get('remaining', 0)}
+            for entry in issuances
+        ]
+
+    def export_workbook(self, path=None):
+        """Write current stock and the issuance log to an XLSX workbook atomically; returns its path"""
+        path = path or self.workbook_path
+        with _indexes_lock:
+            index = self._index()
+            stock = [[name, data['quantity'], data['unit'], data['last_updated'], data['updated_by']]
+                     for name, data in index.stock.items()]
+            issuances = list(index.issuances)
+        workbook = Workbook(write_only=True)
+        ws_stock = workbook.create_sheet('Current Stock')
+        ws_stock.append(STOCK_HEADERS)
+        for row in stock:
+            ws_stock.append(row)
+        ws_log = workbook.create_sheet('Issuance Log')
+        ws_log.append(LOG_HEADERS)
+        for entry in issuances:
+            ws_log.append([entry['at'], entry['material'], entry['quantity'], entry.get('unit'), entry.get('by'),
+                           entry.get('notes', ''), entry.get('remaining', 0)])
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        os.close(fd)
+        try:
+            workbook.save(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logging.info(f"Exported stock journal to {path}")
+        return path
+
+    def export_if_stale(self):
+        """Export the workbook when the journal changed after the last export; returns whether it did"""
+        try:
+            if os.path.getmtime(self.workbook_path) >= os.path.getmtime(self.path):
+                return False
+        except FileNotFoundError:
+            pass
+        self.export_workbook()
+        return True
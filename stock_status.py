@@ -0,0 +1,199 @@
+"""
+Stock Status Service
+Maintains the normal / low / critical state of every stock level so dashboards
+read an indexed table instead of comparing quantities against minimums per request
+"""
+
+from datetime import datetime
+import logging
+
+from blinker import Namespace
+from sqlalchemy import event, func, insert, update
+
+from app import db
+from models_new import Site, Material, StockLevel, StockStatus
+
+STATUS_NORMAL = 'normal'
+STATUS_LOW = 'low'
+STATUS_CRITICAL = 'critical'
+BELOW_MINIMUM_STATUSES = (STATUS_LOW, STATUS_CRITICAL)
+
+# Stock at or below this fraction of the minimum level is critical
+CRITICAL_RATIO = 0.5
+
+_signals = Namespace()
+
+# Sent after commit with site_id, material_id, old_status, new_status, quantity, minimum_level
+stock_status_changed = _signals.signal('stock-status-changed')
+
+
+def classify_stock(quantity, minimum_level):
+    """Classify a stock quantity against its material's minimum level"""
+    minimum_level = minimum_level or 0
+    if minimum_level > 0 and quantity <= minimum_level * CRITICAL_RATIO:
+        return STATUS_CRITICAL
+    if quantity < minimum_level:
+        return STATUS_LOW
+    return STATUS_NORMAL
+
+
+class StockStatusService:
+    """Service class for maintaining and querying the low-stock index"""
+
+    @staticmethod
+    def refresh(site_id, material_id, quantity, minimum_level):
+        """
+        Update the stored status of one stock level in the current transaction.
+        Status transitions are queued and emitted once the transaction commits.
+        """
+        new_status = classify_stock(quantity, minimum_level)
+        state = StockStatus.query.filter_by(site_id=site_id, material_id=material_id).first()
+
+        if not state:
+            state = StockStatus(site_id=site_id, material_id=material_id, status=new_status)
+            db.session.add(state)
+            old_status = None
+        else:
+            old_status = state.status
+
+        state.quantity = quantity
+        state.minimum_level = minimum_level or 0
+        if old_status != new_status:
+            state.status = new_status
+            state.changed_at = datetime.utcnow()
+            db.session.info.setdefault('stock_status_events', []).append({
+                'site_id': site_id,
+                'material_id': material_id,
+                'old_status': old_status,
+                'new_status': new_status,
+                'quantity': quantity,
+                'minimum_level': minimum_level or 0
+            })
+        return state
+
+    @staticmethod
+    def refresh_many(levels):
+        """
+        Update the stored status of many stock levels in the current transaction with
+        one query and two bulk statements. levels holds (site_id, material_id,
+        quantity, minimum_level) tuples with unique (site_id, material_id) pairs.
+        """
+        levels = list(levels)
+        if not levels:
+            return
+
+        site_ids = {site_id for site_id, _, _, _ in levels}
+        existing = {
+            (row.site_id, row.material_id): row
+            for row in db.session.query(StockStatus.id, StockStatus.site_id, StockStatus.material_id, StockStatus.status)
+            .filter(StockStatus.site_id.in_(site_ids))
+        }
+
+        now = datetime.utcnow()
+        inserts, transitions, updates, events = [], [], [], []
+        for site_id, material_id, quantity, minimum_level in levels:
+            minimum_level = minimum_level or 0
+            new_status = classify_stock(quantity, minimum_level)
+            state = existing.get((site_id, material_id))
+            values = {'quantity': quantity, 'minimum_level': minimum_level, 'status': new_status}
+            if not state:
+                inserts.append(dict(values, site_id=site_id, material_id=material_id, changed_at=now))
+            elif state.status != new_status:
+                transitions.append(dict(values, id=state.id, changed_at=now))
+            else:
+                # Unchanged statuses keep their changed_at
+                updates.append(dict(values, id=state.id))
+                continue
+            events.append({
+                'site_id': site_id,
+                'material_id': material_id,
+                'old_status': state.status if state else None,
+                'new_status': new_status,
+                'quantity': quantity,
+                'minimum_level': minimum_level
+            })
+
+        if inserts:
+            db.session.execute(insert(StockStatus), inserts)
+        for rows in (transitions, updates):
+            if rows:
+                db.session.execute(update(StockStatus), rows)
+        db.session.info.setdefault('stock_status_events', []).extend(events)
+
+    @staticmethod
+    def refresh_material(material):
+        """Re-classify a material at every site after its minimum level changed"""
+        for stock_level in StockLevel.query.filter_by(material_id=material.id).all():
+            StockStatusService.refresh(stock_level.site_id, material.id, stock_level.quantity, material.minimum_level)
+
+    @staticmethod
+    def rebuild():
+        """Rebuild the status table from stock levels; returns the number of rows classified"""
+        rows = db.session.query(
+            StockLevel.site_id,
+            StockLevel.material_id,
+            StockLevel.quantity,
+            Material.minimum_level
+        ).join(Material).all()
+
+        current_keys = set()
+        for row in rows:
+            StockStatusService.refresh(row.site_id, row.material_id, row.quantity, row.minimum_level)
+            current_keys.add((row.site_id, row.material_id))
+
+        # Drop states whose stock level no longer exists
+        for state in StockStatus.query.all():
+            if (state.site_id, state.material_id) not in current_keys:
+                db.session.delete(state)
+        db.session.commit()
+
+        logging.info(f"Stock status index rebuilt for {len(rows)} stock levels")
+        return len(rows)
+
+    @staticmethod
+    def get_low_stock_items(site_id=None):
+        """Get stock levels currently below their minimum level"""
+        query = db.session.query(
+            StockStatus.site_id,
+            Site.name.label('site_name'),
+            StockStatus.material_id,
+            Material.name.label('material_name'),
+            Material.unit,
+            StockStatus.quantity,
+            StockStatus.minimum_level,
+            StockStatus.status
+        ).join(Site, StockStatus.site_id == Site.id).join(Material, StockStatus.material_id == Material.id).filter(
+            StockStatus.status.in_(BELOW_MINIMUM_STATUSES)
+        )
+
+        if site_id:
+            query = query.filter(StockStatus.site_id == site_id)
+
+        return query.all()
+
+    @staticmethod
+    def get_status_counts(site_id=None):
+        """Get the number of stock levels in each status"""
+        query = db.session.query(StockStatus.status, func.count(StockStatus.id))
+        if site_id:
+            query = query.filter(StockStatus.site_id == site_id)
+
+        counts = {STATUS_NORMAL: 0, STATUS_LOW: 0, STATUS_CRITICAL: 0}
+        counts.update(dict(query.group_by(StockStatus.status).all()))
+        return counts
+
+
+@event.listens_for(db.session, 'after_commit')
+def _emit_stock_status_events(session):
+    events = session.info.pop('stock_status_events', [])
+    for change in events:
+        logging.info(
+            f"Stock status changed: site {change['site_id']}, material {change['material_id']}: "
+            f"{change['old_status'] or 'new'} -> {change['new_status']}"
+        )
+        stock_status_changed.send(None, **change)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_stock_status_events(session, previous_transaction):
+    session.info.pop('stock_status_events', None)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Supplier Info Parsing Test
+Checks that supplier name, contact and reference are read from transaction notes,
+including several fields written on one line.
+
+Run with: python supplier_info_test.py
+"""
+
+from receipt_generator import parse_supplier_info
+
+CASES = [
+    ("Supplier: ACME Ltd\nContact: 0712 345\nReference: INV-9",
+     {'name': 'ACME Ltd', 'contact': '0712 345', 'reference': 'INV-9'}),
+    ("Supplier: ACME Ltd Ref: PO-778",
+     {'name': 'ACME Ltd', 'reference': 'PO-778'}),
+    ("Delivered in good order. Supplier: ACME, Contact: 0712 345, Reference: INV-9",
+     {'name': 'ACME', 'contact': '0712 345', 'reference': 'INV-9'}),
+    ("supplier: Lusaka Hardware; ref: DN-12\nChecked by the storesman",
+     {'name': 'Lusaka Hardware', 'reference': 'DN-12'}),
+    ("Reference: INV-1 Ref: ignored",
+     {'reference': 'INV-1'}),
+    ("Received in good order", None),
+    (None, None),
+]
+
+
+def test_parse_supplier_info():
+    for notes, expected in CASES:
+        result = parse_supplier_info(notes)
+        assert result == expected, f"{notes!r}: expected {expected}, got {result}"
+        print(f"✓ {notes!r}")
+
+
+if __name__ == '__main__':
+    test_parse_supplier_info()
+    print("All supplier info checks passed")
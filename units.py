@@ -0,0 +1,106 @@
+"""
+Units of Measure
+Central registry of the units materials are stocked in: canonical codes,
+display labels, accepted spellings and conversion factors. The registry is
+built once at import into read-only hash maps shared by catalog imports, OCR
+extraction and the material forms, so every spelling of a unit ('tonne',
+'tonner', 'tons') is stored as one code and stock aggregates do not split.
+"""
+
+from collections import namedtuple
+import re
+from types import MappingProxyType
+
+# factor converts a quantity to the base unit of its dimension; units in their own
+# dimension (packaging such as bags) cannot be converted
+UnitDefinition = namedtuple('UnitDefinition', 'code label dimension factor aliases')
+
+_DEFINITIONS = (
+    UnitDefinition('kg', 'Kilograms (kg)', 'mass', 1.0,
+                   ('kgs', 'kilo', 'kilos', 'kilogram', 'kilograms')),
+    UnitDefinition('tons', 'Tonnes (t)', 'mass', 1000.0,
+                   ('t', 'ton', 'tonne', 'tonnes', 'tonner', 'tonners', 'mt', 'metric ton', 'metric tons')),
+    UnitDefinition('m', 'Meters (m)', 'length', 1.0,
+                   ('meter', 'meters', 'metre', 'metres', 'mtr', 'mtrs', 'lm', 'linear meters', 'linear metres')),
+    UnitDefinition('ft', 'Feet (ft)', 'length', 0.3048, ('foot', 'feet')),
+    UnitDefinition('m2', 'Square Meters (m²)', 'area', 1.0,
+                   ('m²', 'sqm', 'sq m', 'square meter', 'square meters', 'square metre', 'square metres')),
+    UnitDefinition('m3', 'Cubic Meters (m³)', 'volume', 1.0,
+                   ('m³', 'cbm', 'cubic', 'cu m', 'cubic meter', 'cubic meters', 'cubic metre', 'cubic metres')),
+    UnitDefinition('liters', 'Liters', 'volume', 0.001,
+                   ('l', 'ltr', 'ltrs', 'liter', 'litre', 'litres')),
+    UnitDefinition('pcs', 'Pieces', 'count', 1.0,
+                   ('pc', 'piece', 'pieces', 'ea', 'each', 'no', 'no.', 'nos', 'number', 'unit', 'units')),
+    UnitDefinition('pairs', 'Pairs', 'count', 2.0, ('pair', 'pr', 'prs')),
+    UnitDefinition('bags', 'Bags', 'bags', None, ('bag',)),
+    UnitDefinition('boxes', 'Boxes', 'boxes', None, ('box', 'bx')),
+    UnitDefinition('sheets', 'Sheets', 'sheets', None, ('sheet',)),
+    UnitDefinition('rolls', 'Rolls', 'rolls', None, ('roll',)),
+)
+
+
+def _normalize(value):
+    """Lower-case a unit spelling and collapse its whitespace"""
+    return ' '.join(str(value).lower().split())
+
+
+def _build_aliases():
+    aliases = {}
+    for unit in _DEFINITIONS:
+        for spelling in (unit.code,) + unit.aliases:
+            key = _normalize(spelling)
+            if aliases.setdefault(key, unit.code) != unit.code:
+                raise ValueError(f"Unit spelling '{spelling}' is registered twice")
+    return aliases
+
+
+# Canonical code -> definition, and every accepted spelling (normalized) -> canonical code
+UNITS = MappingProxyType({unit.code: unit for unit in _DEFINITIONS})
+UNIT_ALIASES = MappingProxyType(_build_aliases())
+
+# Spellings found in free text (OCR): longest first so 'cubic meters' wins over 'm';
+# one- and two-letter spellings only count right after a number
+_TEXT_PATTERN = re.compile(
+    r'(?<![\w.])(?:(?P<number>\d+(?:\.\d+)?)\s*)?(?P<unit>'
+    + '|'.join(re.escape(spelling) for spelling in sorted(UNIT_ALIASES, key=len, reverse=True))
+    + r')(?!\w)',
+    re.IGNORECASE
+)
+
+
+def canonical_unit(value):
+    """The canonical code for a unit spelling, or None when it is not a known unit"""
+    if value is None:
+        return None
+    return UNIT_ALIASES.get(_normalize(value))
+
+
+def canonical_units(values):
+    """Canonical codes for a Series of unit spellings; unknown spellings become NaN"""
+    return values.astype('string').str.lower().str.split().str.join(' ').astype(object).map(UNIT_ALIASES)
+
+
+def unit_choices():
+    """(code, label) pairs for unit selects, in registry order"""
+    return [(unit.code, unit.label) for unit in _DEFINITIONS]
+
+
+def find_unit(text):
+    """The canonical unit mentioned in free text, or None"""
+    for match in _TEXT_PATTERN.finditer(text):
+        spelling = match.group('unit')
+        if match.group('number') or len(spelling.rstrip('.')) > 2:
+            return UNIT_ALIASES[_normalize(spelling)]
+    return None
+
+
+def convert_quantity(quantity, from_unit, to_unit):
+    """Convert a quantity between two units of the same dimension; raises ValueError otherwise"""
+    source, target = UNITS.get(canonical_unit(from_unit)), UNITS.get(canonical_unit(to_unit))
+    if source is None or target is None:
+        raise ValueError(f"Unknown unit '{from_unit if source is None else to_unit}'")
+    if source.code == target.code:
+        return quantity
+    if source.dimension != target.dimension or source.factor is None:
+        raise ValueError(f"Cannot convert {source.code} to {target.code}")
+    return quantity * source.factor / target.factor
@@ -0,0 +1,108 @@
+"""
+Inventory Valuation Service
+Maintains quantity and value rollups per (site, category) alongside every stock
+mutation so valuation totals read O(sites x categories) rows instead of every stock level
+"""
+
+from datetime import datetime
+import logging
+
+from sqlalchemy import func, update
+
+from app import db
+from models_new import Site, Material, StockLevel, InventoryValuation
+
+
+class ValuationService:
+    """Service class for the per-site, per-category inventory valuation rollup"""
+
+    @staticmethod
+    def apply_delta(site_id, category, quantity_delta, value_delta):
+        """Add a quantity/value change to a rollup row in the current transaction"""
+        if not quantity_delta and not value_delta:
+            return
+
+        category = category or 'General'
+        result = db.session.execute(
+            update(InventoryValuation)
+            .where(InventoryValuation.site_id == site_id, InventoryValuation.category == category)
+            .values(
+                quantity=InventoryValuation.quantity + quantity_delta,
+                total_value=InventoryValuation.total_value + value_delta,
+                updated_at=datetime.utcnow()
+            )
+        )
+        if result.rowcount == 0:
+            db.session.add(InventoryValuation(
+                site_id=site_id,
+                category=category,
+                quantity=quantity_delta,
+                total_value=value_delta
+            ))
+            db.session.flush()
+
+    @staticmethod
+    def move_category(material, old_category, new_category):
+        """Move a material's stock between category rollups after its category changed"""
+        if (old_category or 'General') == (new_category or 'General'):
+            return
+
+        for stock_level in StockLevel.query.filter_by(material_id=material.id).all():
+            ValuationService.apply_delta(stock_level.site_id, old_category, -stock_level.quantity, -stock_level.total_value)
+            ValuationService.apply_delta(stock_level.site_id, new_category, stock_level.quantity, stock_level.total_value)
+
+    @staticmethod
+    def rebuild():
+        """Recompute every rollup row from stock levels; returns the number of rows written"""
+        rows = db.session.query(
+            StockLevel.site_id,
+            Material.category,
+            func.sum(StockLevel.quantity).label('quantity'),
+            func.sum(StockLevel.total_value).label('total_value')
+        ).join(Material).group_by(StockLevel.site_id, Material.category).all()
+
+        InventoryValuation.query.delete()
+        for row in rows:
+            db.session.add(InventoryValuation(
+                site_id=row.site_id,
+                category=row.category or 'General',
+                quantity=row.quantity or 0,
+                total_value=row.total_value or 0
+            ))
+        db.session.commit()
+
+        logging.info(f"Inventory valuation rollup rebuilt: {len(rows)} site/category rows")
+        return len(rows)
+
+    @staticmethod
+    def get_total_value(site_id=None):
+        """Get the total inventory value for a site or all sites"""
+        query = db.session.query(func.sum(InventoryValuation.total_value))
+        if site_id:
+            query = query.filter(InventoryValuation.site_id == site_id)
+        return query.scalar() or 0
+
+    @staticmethod
+    def get_category_totals(site_id=None):
+        """Get quantity and value per category for a site or all sites, largest value first"""
+        query = db.session.query(
+            InventoryValuation.category,
+            func.sum(InventoryValuation.quantity).label('quantity'),
+            func.sum(InventoryValuation.total_value).label('total_value')
+        )
+        if site_id:
+            query = query.filter(InventoryValuation.site_id == site_id)
+
+        return query.group_by(InventoryValuation.category).order_by(func.sum(InventoryValuation.total_value).desc()).all()
+
+    @staticmethod
+    def get_site_totals():
+        """Get quantity and value per site"""
+        return db.session.query(
+            InventoryValuation.site_id,
+            Site.name.label('site_name'),
+            func.sum(InventoryValuation.quantity).label('quantity'),
+            func.sum(InventoryValuation.total_value).label('total_value')
+        ).join(Site, InventoryValuation.site_id == Site.id).group_by(
+            InventoryValuation.site_id, Site.name
+        ).order_by(Site.name).all()